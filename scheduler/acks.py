@@ -0,0 +1,125 @@
+import time
+
+from redis.exceptions import RedisError
+
+from .emergency import get_entry_id_timestamp_ms
+
+
+# the claims failing (e.g.: XAUTOCLAIM unknown before Redis 6.2) are retried up to 32 intervals apart
+MAX_BACKOFF_FACTOR = 32
+
+
+def get_consumer_group_name(service_stream):
+    return service_stream.input_consumer_group.name
+
+
+class DataStreamAcker():
+    """
+    Acks the service stream entries with a single XACK per batch of event ids,
+    instead of one round trip per event.
+    """
+
+    def __init__(self, service_stream):
+        self.service_stream = service_stream
+        self.acked_count = 0
+
+    def ack(self, event_ids):
+        if not event_ids:
+            return
+        redis_db = getattr(self.service_stream, 'redis_db', None)
+        if redis_db is None:
+            for event_id in event_ids:
+                self.service_stream.ack(event_id)
+        else:
+            redis_db.xack(self.service_stream.key, get_consumer_group_name(self.service_stream), *event_ids)
+        self.acked_count += len(event_ids)
+
+
+class PendingEntryReclaimer():
+    """
+    Claims the service stream entries left pending (read but never acked) in the consumer group
+    for longer than `min_idle_ms`, e.g.: by a scheduler that crashed before acking them, so they are
+    routed again instead of being lost. Entries older than `max_age_ms` (from the time in their entry id)
+    are not worth routing anymore, they're only acked and dropped.
+    It goes over the pending entries with XAUTOCLAIM, at most `count` entries every `interval_ms`,
+    claiming them for `consumer_name`, and backs off while the claims fail.
+    """
+
+    def __init__(self, service_stream, min_idle_ms=60000, max_age_ms=0, interval_ms=5000, count=100, logger=None,
+                 consumer_name=None):
+        self.service_stream = service_stream
+        self.consumer_name = consumer_name
+        self.min_idle_ms = min_idle_ms
+        self.max_age_ms = max_age_ms
+        self.interval = interval_ms / 1000
+        self.count = count
+        self.logger = logger
+        self.cursor = '0-0'
+        self.last_claim_time = None
+        self.failed_claims = 0
+        self.reclaimed_count = 0
+        self.dropped_count = 0
+
+    def is_due(self):
+        if self.last_claim_time is None:
+            return True
+        backoff_factor = min(2 ** self.failed_claims, MAX_BACKOFF_FACTOR)
+        return time.perf_counter() - self.last_claim_time >= self.interval * backoff_factor
+
+    def get_claim_kwargs(self, consumer_name):
+        return {
+            'name': self.service_stream.key,
+            'groupname': get_consumer_group_name(self.service_stream),
+            'consumername': consumer_name,
+            'min_idle_time': self.min_idle_ms,
+            'start_id': self.cursor,
+            'count': self.count,
+        }
+
+    def split_claimed(self, response):
+        """
+        Returns the claimed events to route again, and the ids of the ones to only ack.
+        """
+        self.last_claim_time = time.perf_counter()
+        next_cursor, claimed_entries = response[0], response[1]
+        self.cursor = next_cursor.decode('utf-8') if isinstance(next_cursor, bytes) else next_cursor
+        min_timestamp_ms = time.time() * 1000 - self.max_age_ms
+        event_list = []
+        dropped_ids = []
+        for event_id, json_msg in claimed_entries:
+            if event_id is None:
+                continue
+            if json_msg is None:
+                # trimmed from the stream while pending
+                dropped_ids.append(event_id)
+                continue
+            entry_timestamp_ms = get_entry_id_timestamp_ms(event_id)
+            if self.max_age_ms > 0 and entry_timestamp_ms is not None and entry_timestamp_ms < min_timestamp_ms:
+                dropped_ids.append(event_id)
+                continue
+            event_list.append((event_id, json_msg))
+        self.reclaimed_count += len(event_list)
+        self.dropped_count += len(dropped_ids)
+        return event_list, dropped_ids
+
+    def claim(self):
+        redis_db = getattr(self.service_stream, 'redis_db', None)
+        if redis_db is None:
+            self.last_claim_time = time.perf_counter()
+            return [], []
+        try:
+            response = redis_db.xautoclaim(**self.get_claim_kwargs(self.consumer_name))
+        except RedisError as e:
+            self.last_claim_time = time.perf_counter()
+            self.failed_claims += 1
+            if self.logger is not None:
+                self.logger.error(f'Failed to claim pending entries (XAUTOCLAIM needs Redis 6.2 or newer): {e}')
+            return [], []
+        self.failed_claims = 0
+        return self.split_claimed(response)
+
+    def get_state(self):
+        return {
+            'reclaimed': self.reclaimed_count,
+            'dropped': self.dropped_count,
+        }
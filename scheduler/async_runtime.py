@@ -0,0 +1,289 @@
+import asyncio
+import signal
+from concurrent.futures import ThreadPoolExecutor
+
+from redis import asyncio as aioredis
+
+
+class CollectingOutputStage():
+    """
+    Output stage used by the async runtime: the routing code only collects the outgoing
+    events here, and they are written afterwards by the runtime writer tasks.
+    """
+
+    def __init__(self):
+        self.pending_msgs = []
+
+    def add(self, destination_stream, event_msg):
+        write_kwargs = getattr(destination_stream, 'default_write_kwargs', {})
+        self.pending_msgs.append((destination_stream.key, write_kwargs, event_msg))
+
+    def flush_if_due(self):
+        pass
+
+    def flush(self):
+        return 0
+
+    def take(self):
+        pending_msgs = self.pending_msgs
+        self.pending_msgs = []
+        return pending_msgs
+
+
+class PendingBatch():
+    """
+    Data stream entries of one read, only acked once all the writer tasks
+    that got a part of its outgoing events have written them. If any part fails to be written,
+    the entries are left pending, for the reclaimer to route them again.
+    """
+    __slots__ = ('event_ids', 'remaining_parts', 'has_failed_writes')
+
+    def __init__(self, event_ids, remaining_parts):
+        self.event_ids = event_ids
+        self.remaining_parts = remaining_parts
+        self.has_failed_writes = False
+
+
+class AsyncSchedulerRuntime():
+    """
+    Runs the scheduler command and data loops as cooperative tasks over an asyncio redis client,
+    instead of two blocking threads:
+
+    readers (XREADGROUP) -> data queue -> router -> writer queues -> writers (pipelined XADDs + XACK)
+
+    Both queues are bounded, so slow writes throttle the reads. Routing stays a single synchronous
+    step on the event loop. The service steps that make blocking calls on its synchronous redis client
+    (the commands, e.g.: a plan warm up and publish, the stats reports, the emergency shedding backlog
+    checks, the latency budgets clock sync and the destinations backlog refresh) run in threads instead,
+    the commands and reports one at a time in their own thread, so they don't block the loop.
+    A new plan is installed with a single reference swap, like in the threaded runtime.
+    Each destination stream is always written by the same writer task, which keeps the events order
+    per destination while the writes to different destinations are in flight concurrently.
+    On `stop` the readers stop reading, and everything already read is routed, written and acked.
+    """
+
+    def __init__(self, service, redis_client,
+                 read_count=100, read_block_ms=100, read_concurrency=1, write_concurrency=4, queue_size=64):
+        self.service = service
+        self.redis_client = redis_client
+        self.read_count = read_count
+        # the reads must time out, otherwise the readers would never see the stop request
+        self.read_block_ms = max(1, read_block_ms)
+        self.read_concurrency = max(1, read_concurrency)
+        self.write_concurrency = max(1, write_concurrency)
+        self.queue_size = queue_size
+        self.data_stream_key = service.service_stream.key
+        self.data_group = f'cg-{self.data_stream_key}'
+        self.consumer_name = f'{service.name}-async'
+        self.output_stage = CollectingOutputStage()
+        self.stop_event = None
+        self.command_executor = None
+
+    def stop(self):
+        self.service.logger.info('Stopping async runtime, draining pending events...')
+        if self.stop_event is not None:
+            self.stop_event.set()
+
+    def is_stopping(self):
+        return self.stop_event.is_set()
+
+    async def run_blocking(self, func, *args, executor=None):
+        return await asyncio.get_running_loop().run_in_executor(executor, func, *args)
+
+    def process_cmd_event(self, cg_sub_group, event_type, json_msg):
+        event_data = self.service.default_event_deserializer(json_msg)
+        self.service.process_event_type_wrapper(cg_sub_group, event_type, event_data, json_msg)
+        self.service.log_state()
+
+    async def read_cmd(self, cg_sub_group, cmd_keys):
+        group = self.service._get_cg_sub_group_id(cg_sub_group)
+        streams = {key: '>' for key in cmd_keys}
+        while not self.is_stopping():
+            try:
+                response = await self.redis_client.xreadgroup(
+                    group, self.consumer_name, streams, count=1, block=self.read_block_ms
+                )
+            except Exception as e:
+                self.service.logger.error(f'Error reading CMD-[{cg_sub_group}]:')
+                self.service.logger.exception(e)
+                await asyncio.sleep(self.read_block_ms / 1000)
+                continue
+            for stream_key, event_list in response or []:
+                event_type = stream_key.decode('utf-8')
+                for event_id, json_msg in event_list:
+                    try:
+                        await self.run_blocking(
+                            self.process_cmd_event, cg_sub_group, event_type, json_msg, executor=self.command_executor
+                        )
+                    except Exception as e:
+                        self.service.logger.error(f'Error processing {json_msg}:')
+                        self.service.logger.exception(e)
+
+    async def report_metrics(self):
+        while not self.is_stopping():
+            try:
+                await asyncio.wait_for(self.stop_event.wait(), timeout=self.service.metrics_report_interval)
+                return
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.run_blocking(self.service.publish_scheduler_stats_reported, executor=self.command_executor)
+            except Exception as e:
+                self.service.logger.error('Error reporting scheduler stats:')
+                self.service.logger.exception(e)
+
+    async def read_data(self, reader_index):
+        consumer_name = f'{self.consumer_name}-{reader_index}'
+        streams = {self.data_stream_key: '>'}
+        while not self.is_stopping():
+            try:
+                response = await self.redis_client.xreadgroup(
+                    self.data_group, consumer_name, streams, count=self.read_count, block=self.read_block_ms
+                )
+            except Exception as e:
+                self.service.logger.error('Error reading DATA:')
+                self.service.logger.exception(e)
+                await asyncio.sleep(self.read_block_ms / 1000)
+                continue
+            for stream_key, event_list in response or []:
+                if event_list:
+                    await self.data_queue.put(event_list)
+
+    async def reclaim_data(self, reclaimer):
+        consumer_name = f'{self.consumer_name}-reclaimer'
+        while not self.is_stopping():
+            try:
+                await asyncio.wait_for(self.stop_event.wait(), timeout=reclaimer.interval)
+                return
+            except asyncio.TimeoutError:
+                pass
+            try:
+                response = await self.redis_client.xautoclaim(**reclaimer.get_claim_kwargs(consumer_name))
+                event_list, dropped_ids = reclaimer.split_claimed(response)
+                if dropped_ids:
+                    self.service.logger.warning(f'Dropping {len(dropped_ids)} pending events too old to be routed')
+                    await self.redis_client.xack(self.data_stream_key, self.data_group, *dropped_ids)
+                if event_list:
+                    # routed, written and acked like any other read
+                    await self.data_queue.put(event_list)
+            except Exception as e:
+                self.service.logger.error('Error reclaiming pending DATA:')
+                self.service.logger.exception(e)
+
+    def split_by_writer(self, pending_msgs):
+        writer_msgs = [[] for _ in range(self.write_concurrency)]
+        for pending_msg in pending_msgs:
+            writer_msgs[hash(pending_msg[0]) % self.write_concurrency].append(pending_msg)
+        return writer_msgs
+
+    async def route_data(self):
+        while True:
+            event_list = await self.data_queue.get()
+            if event_list is None:
+                break
+            try:
+                if self.service.emergency_shedder.enabled:
+                    await self.run_blocking(self.service.update_emergency_shedding, event_list)
+                if self.service.deadline_checker.is_active and self.service.deadline_checker.is_clock_sync_due():
+                    await self.run_blocking(self.service.sync_deadline_clock)
+                if self.service.is_backlog_refresh_due():
+                    await self.run_blocking(self.service.refresh_destination_backlogs)
+                self.service.process_data_events(event_list)
+                self.service.evict_idle_bufferstream_states()
+            except Exception as e:
+                self.service.logger.error('Error routing data events:')
+                self.service.logger.exception(e)
+            event_ids = []
+            if self.service.ack_data_stream_events:
+                event_ids = [event_id for event_id, json_msg in event_list]
+
+            writer_parts = [
+                (writer_index, msgs)
+                for writer_index, msgs in enumerate(self.split_by_writer(self.output_stage.take())) if msgs
+            ]
+            if not writer_parts:
+                # nothing to write (e.g.: all events shed), only the ack is left
+                writer_parts = [(0, [])]
+            pending_batch = PendingBatch(event_ids, len(writer_parts))
+            for writer_index, msgs in writer_parts:
+                await self.write_queues[writer_index].put((pending_batch, msgs))
+            # lets the readers and writers progress between the routed batches
+            await asyncio.sleep(0)
+
+        for write_queue in self.write_queues:
+            await write_queue.put(None)
+
+    async def write_data(self, write_queue):
+        while True:
+            item = await write_queue.get()
+            if item is None:
+                break
+            pending_batch, msgs = item
+            try:
+                if msgs:
+                    pipeline = self.redis_client.pipeline(transaction=False)
+                    for destination, write_kwargs, event_msg in msgs:
+                        pipeline.xadd(destination, event_msg, **write_kwargs)
+                    await pipeline.execute()
+            except Exception as e:
+                pending_batch.has_failed_writes = True
+                self.service.logger.error(f'Error writing {len(msgs)} data events:')
+                self.service.logger.exception(e)
+            pending_batch.remaining_parts -= 1
+            if pending_batch.remaining_parts == 0 and pending_batch.has_failed_writes:
+                self.service.logger.warning(
+                    f'Not acking {len(pending_batch.event_ids)} events read before a failed write'
+                )
+            elif pending_batch.remaining_parts == 0 and pending_batch.event_ids:
+                try:
+                    await self.redis_client.xack(self.data_stream_key, self.data_group, *pending_batch.event_ids)
+                except Exception as e:
+                    self.service.logger.error('Error acking data events:')
+                    self.service.logger.exception(e)
+
+    async def run(self):
+        self.stop_event = asyncio.Event()
+        self.data_queue = asyncio.Queue(maxsize=self.queue_size)
+        self.write_queues = [asyncio.Queue(maxsize=self.queue_size) for _ in range(self.write_concurrency)]
+        self.service.output_stage = self.output_stage
+        self.command_executor = ThreadPoolExecutor(max_workers=1)
+
+        control_tasks = [
+            asyncio.ensure_future(self.read_cmd(cg_sub_group, cmd_keys))
+            for cg_sub_group, cmd_keys in self.service.service_cmd_cg_keys_map.items() if cmd_keys
+        ]
+        if self.service.metrics_report_interval > 0:
+            control_tasks.append(asyncio.ensure_future(self.report_metrics()))
+        reader_tasks = [
+            asyncio.ensure_future(self.read_data(reader_index)) for reader_index in range(self.read_concurrency)
+        ]
+        if self.service.pending_reclaimer is not None:
+            reader_tasks.append(asyncio.ensure_future(self.reclaim_data(self.service.pending_reclaimer)))
+        router_task = asyncio.ensure_future(self.route_data())
+        writer_tasks = [asyncio.ensure_future(self.write_data(write_queue)) for write_queue in self.write_queues]
+
+        await self.stop_event.wait()
+        await asyncio.gather(*reader_tasks)
+        await self.data_queue.put(None)
+        await router_task
+        await asyncio.gather(*writer_tasks)
+        for task in control_tasks:
+            task.cancel()
+        await asyncio.gather(*control_tasks, return_exceptions=True)
+        self.command_executor.shutdown(wait=True)
+        self.service.logger.info('Async runtime stopped.')
+
+
+def run_async_runtime(service, redis_configs, runtime_configs):
+    async def main():
+        redis_client = aioredis.Redis(**redis_configs)
+        runtime = AsyncSchedulerRuntime(service, redis_client, **runtime_configs)
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, runtime.stop)
+        try:
+            await runtime.run()
+        finally:
+            await redis_client.close()
+
+    asyncio.run(main())
@@ -0,0 +1,85 @@
+import time
+
+
+class DestinationBacklogView():
+    """
+    Cached view of the backlog of the destination streams, i.e.: the entries their consumer groups
+    still have to read (lag) or to ack (pending). The view is refreshed from Redis at most once per
+    refresh interval, with a single pipelined call per connection, so reading it costs nothing on
+    the data path. Between two refreshes the events sent to a destination are added to its cached
+    backlog, so the destinations that looked the shortest at the last refresh don't get every event.
+    """
+
+    def __init__(self, get_destination_stream, refresh_interval_ms=500, logger=None):
+        self.get_destination_stream = get_destination_stream
+        self.refresh_interval = refresh_interval_ms / 1000
+        self.logger = logger
+        self.destinations = frozenset()
+        self.backlogs = {}
+        self.last_refresh_time = None
+
+    def set_destinations(self, destinations):
+        self.destinations = frozenset(destinations)
+        self.backlogs = {destination: self.backlogs.get(destination, 0) for destination in self.destinations}
+        self.last_refresh_time = None
+
+    def is_refresh_due(self):
+        if self.last_refresh_time is None:
+            return True
+        return time.perf_counter() - self.last_refresh_time >= self.refresh_interval
+
+    def _group_by_connection(self):
+        connection_groups = {}
+        for destination in self.destinations:
+            redis_db = getattr(self.get_destination_stream(destination), 'redis_db', None)
+            if redis_db is not None:
+                connection_groups.setdefault(id(redis_db), (redis_db, []))[1].append(destination)
+        return connection_groups.values()
+
+    def get_groups_backlog(self, groups_info):
+        if isinstance(groups_info, Exception):
+            return 0
+        backlog = 0
+        for group_info in groups_info:
+            # 'lag' is only available from Redis 7, and can be None if it can't be computed
+            group_backlog = group_info.get('pending', 0) + (group_info.get('lag') or 0)
+            backlog = max(backlog, group_backlog)
+        return backlog
+
+    def refresh(self):
+        self.last_refresh_time = time.perf_counter()
+        backlogs = {destination: 0 for destination in self.destinations}
+        try:
+            for redis_db, destinations in self._group_by_connection():
+                pipeline = redis_db.pipeline(transaction=False)
+                for destination in destinations:
+                    pipeline.xinfo_groups(destination)
+                for destination, groups_info in zip(destinations, pipeline.execute(raise_on_error=False)):
+                    backlogs[destination] = self.get_groups_backlog(groups_info)
+        except Exception as e:
+            if self.logger is not None:
+                self.logger.error('Error refreshing the destinations backlog:')
+                self.logger.exception(e)
+            return
+        self.backlogs = backlogs
+
+    def refresh_if_due(self):
+        if self.is_refresh_due():
+            self.refresh()
+
+    def get_backlog(self, destination):
+        return self.backlogs.get(destination, 0)
+
+    def get_dataflow_backlog(self, dataflow):
+        # parallel first-hop destinations, the slowest one sets the pace of the dataflow
+        backlog = 0
+        for destination in dataflow.first_hop_destinations:
+            destination_backlog = self.backlogs.get(destination, 0)
+            if destination_backlog > backlog:
+                backlog = destination_backlog
+        return backlog
+
+    def record_sent(self, dataflow):
+        backlogs = self.backlogs
+        for destination in dataflow.first_hop_destinations:
+            backlogs[destination] = backlogs.get(destination, 0) + 1
@@ -0,0 +1,297 @@
+#!/usr/bin/env python
+import argparse
+import collections
+import datetime
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+import uuid
+
+import opentracing
+from event_service_utils.streams.base import BasicStream, StreamFactory
+
+from scheduler.metrics import LatencyHistogram
+from scheduler.service import Scheduler
+
+from scheduler.conf import (
+    SERVICE_STREAM_KEY,
+    SERVICE_CMD_KEY_LIST,
+    PUB_EVENT_LIST,
+    SERVICE_DETAILS,
+)
+
+
+class InMemoryStream(BasicStream):
+    """
+    Stand-in for the redis streams, like the mocked streams used in the tests,
+    but with O(1) reads and writes and without keeping the written events around.
+    """
+
+    def __init__(self, key):
+        BasicStream.__init__(self, key)
+        self.pending_events = collections.deque()
+        self.written_count = 0
+
+    def read_events(self, count=1):
+        pending_events = self.pending_events
+        for _ in range(min(count, len(pending_events))):
+            yield pending_events.popleft()
+
+    def write_events(self, *events):
+        self.written_count += len(events)
+        return []
+
+    def ack(self, event_id, stream_key=None):
+        pass
+
+
+class InMemoryManyKeyConsumerGroup(BasicStream):
+    def read_stream_events_list(self, count=1):
+        return []
+
+
+class InMemoryStreamFactory(StreamFactory):
+
+    def __init__(self):
+        self.streams = {}
+
+    def create(self, key, stype=None, cg_id=None):
+        if stype == 'manyKeyConsumerOnly':
+            return InMemoryManyKeyConsumerGroup(cg_id)
+        stream = self.streams.get(key)
+        if stream is None:
+            stream = InMemoryStream(key)
+            self.streams[key] = stream
+        return stream
+
+    def get_written_count(self, exclude_keys):
+        return sum(stream.written_count for key, stream in self.streams.items() if key not in exclude_keys)
+
+
+def generate_bufferstream_keys(n_bufferstreams):
+    return [uuid.uuid4().hex for _ in range(n_bufferstreams)]
+
+
+def generate_plan(strategy_name, bufferstream_keys, n_dataflows, load_shedding_rate=0.1):
+    has_load_shedding = '-LS' in strategy_name
+    dataflows = {}
+    for buffer_stream_key in bufferstream_keys:
+        weights = [random.random() for _ in range(n_dataflows)]
+        total_weight = sum(weights)
+        cum_weight = 0
+        dataflow_choices = []
+        for dataflow_index, weight in enumerate(weights):
+            cum_weight += weight / total_weight
+            data_flow = [[f'object-detection-{dataflow_index}-data'], ['wm-data']]
+            if has_load_shedding:
+                dataflow_choices.append([load_shedding_rate, cum_weight, data_flow])
+            else:
+                dataflow_choices.append([cum_weight, data_flow])
+        dataflows[buffer_stream_key] = dataflow_choices
+    return {
+        'name': strategy_name,
+        'dataflows': dataflows,
+    }
+
+
+def generate_payload(payload_size):
+    # nested detected objects, to have about the size and shape of the frame metadata events
+    payload = []
+    while len(json.dumps(payload)) < payload_size:
+        payload.append({
+            'label': 'person',
+            'confidence': round(random.random(), 4),
+            'bounding_box': [random.randint(0, 640) for _ in range(4)],
+        })
+    return payload
+
+
+def generate_events(bufferstream_keys, n_events, rate_skew=0.0, payload_size=0):
+    # the relative event rate of each bufferstream follows a zipf-like distribution,
+    # a skew of zero means all bufferstreams have the same event rate
+    rate_weights = [1 / ((rank + 1) ** rate_skew) for rank in range(len(bufferstream_keys))]
+    selected_keys = random.choices(bufferstream_keys, weights=rate_weights, k=n_events)
+    payload = generate_payload(payload_size)
+    events = []
+    for event_index, buffer_stream_key in enumerate(selected_keys):
+        event_data = {
+            'id': f'benchmark:{event_index}',
+            'buffer_stream_key': buffer_stream_key,
+        }
+        if payload_size:
+            event_data['payload'] = payload
+        events.append((f'{event_index}-0', {b'event': json.dumps(event_data)}))
+    return events
+
+
+def create_benchmark_service(stream_factory, service_configs):
+    service = Scheduler(
+        service_stream_key=SERVICE_STREAM_KEY,
+        service_cmd_key_list=SERVICE_CMD_KEY_LIST,
+        pub_event_list=PUB_EVENT_LIST,
+        service_details=SERVICE_DETAILS,
+        stream_factory=stream_factory,
+        default_scheduling_strategy=None,
+        logging_level='ERROR',
+        tracer_configs={'reporting_host': None, 'reporting_port': None},
+        **service_configs
+    )
+    if service.tracer is not None:
+        service.tracer.close()
+    service.tracer = opentracing.Tracer()
+    return service
+
+
+def drive_service(service, service_stream, events):
+    service_stream.pending_events.extend(events)
+    latency_histogram = LatencyHistogram()
+    start_time = time.perf_counter()
+    while service_stream.pending_events:
+        pending_before = len(service_stream.pending_events)
+        call_start_time = time.perf_counter()
+        service.process_data()
+        call_time = time.perf_counter() - call_start_time
+        processed_events = pending_before - len(service_stream.pending_events)
+        per_event_time = call_time / processed_events
+        for _ in range(processed_events):
+            latency_histogram.record(per_event_time)
+    if service.output_stage is not None:
+        service.output_stage.flush()
+    return time.perf_counter() - start_time, latency_histogram
+
+
+def measure_allocations(service, service_stream, events):
+    tracemalloc.start()
+    if hasattr(tracemalloc, 'reset_peak'):
+        # python 3.9+, before that the peak is only reset by starting the tracing, when it was not running yet
+        tracemalloc.reset_peak()
+    start_blocks = sys.getallocatedblocks()
+    start_traced_memory, _ = tracemalloc.get_traced_memory()
+    drive_service(service, service_stream, events)
+    end_blocks = sys.getallocatedblocks()
+    end_traced_memory, peak_traced_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'net_blocks_per_event': (end_blocks - start_blocks) / len(events),
+        'net_bytes_per_event': (end_traced_memory - start_traced_memory) / len(events),
+        'peak_bytes_per_event': (peak_traced_memory - start_traced_memory) / len(events),
+    }
+
+
+def run_benchmark_case(
+        strategy_name, n_bufferstreams, n_dataflows, n_events,
+        rate_skew=0.0, payload_size=0, allocation_events=0, service_configs=None):
+    if service_configs is None:
+        service_configs = {}
+    stream_factory = InMemoryStreamFactory()
+    service = create_benchmark_service(stream_factory, service_configs)
+    bufferstream_keys = generate_bufferstream_keys(n_bufferstreams)
+    service.execute_adaptive_plan(generate_plan(strategy_name, bufferstream_keys, n_dataflows))
+    service_stream = stream_factory.streams[SERVICE_STREAM_KEY]
+
+    # warm up caches and destination streams before measuring
+    warm_up_events = generate_events(bufferstream_keys, min(n_events, 1000), rate_skew, payload_size)
+    drive_service(service, service_stream, warm_up_events)
+    events = generate_events(bufferstream_keys, n_events, rate_skew, payload_size)
+    excluded_keys = [SERVICE_STREAM_KEY] + list(PUB_EVENT_LIST)
+    written_before = stream_factory.get_written_count(excluded_keys)
+    total_time, latency_histogram = drive_service(service, service_stream, events)
+    written_count = stream_factory.get_written_count(excluded_keys) - written_before
+
+    result = {
+        'strategy': strategy_name,
+        'bufferstreams': n_bufferstreams,
+        'dataflows_per_bufferstream': n_dataflows,
+        'events': n_events,
+        'rate_skew': rate_skew,
+        'payload_size': payload_size,
+        'service_configs': service_configs,
+        'total_time_s': total_time,
+        'events_per_sec': n_events / total_time if total_time else 0,
+        'written_events': written_count,
+        'latency_p50_us': latency_histogram.get_percentile(50),
+        'latency_p99_us': latency_histogram.get_percentile(99),
+        'latency_max_us': latency_histogram.max_us,
+    }
+    if allocation_events:
+        allocation_events = generate_events(bufferstream_keys, allocation_events, rate_skew, payload_size)
+        result['allocations'] = measure_allocations(service, service_stream, allocation_events)
+    return result
+
+
+def parse_plan_sizes(plan_sizes):
+    parsed_sizes = []
+    for plan_size in plan_sizes.split(','):
+        n_bufferstreams, n_dataflows = plan_size.lower().split('x')
+        parsed_sizes.append((int(n_bufferstreams), int(n_dataflows)))
+    return parsed_sizes
+
+
+def get_registered_strategies():
+    stream_factory = InMemoryStreamFactory()
+    service = create_benchmark_service(stream_factory, {})
+    return list(service.scheduling_strategies.keys())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Scheduler throughput and latency benchmark.')
+    parser.add_argument(
+        '--strategies', default=None, help='comma separated strategy names, defaults to all registered'
+    )
+    parser.add_argument(
+        '--plan-sizes', default='10x2,100x4', help='comma separated "<bufferstreams>x<dataflows>" sizes'
+    )
+    parser.add_argument('--events', type=int, default=20000)
+    parser.add_argument('--rate-skew', type=float, default=0.0)
+    parser.add_argument('--payload-size', type=int, default=0)
+    parser.add_argument('--allocation-events', type=int, default=2000)
+    parser.add_argument('--data-batch-size', type=int, default=1)
+    parser.add_argument('--output-batch-size', type=int, default=1)
+    parser.add_argument('--event-passthrough', action='store_true')
+    parser.add_argument('--trace-sampling-rate', type=float, default=1.0)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default='bench_output.json')
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    strategies = args.strategies.split(',') if args.strategies else get_registered_strategies()
+    service_configs = {
+        'data_batch_configs': {'size': args.data_batch_size},
+        'output_configs': {'batch_size': args.output_batch_size, 'max_delay_ms': 0},
+        'event_passthrough': args.event_passthrough,
+        'trace_sampling_rates': {
+            'forwarded': args.trace_sampling_rate,
+            'shed': args.trace_sampling_rate,
+            'no_plan': args.trace_sampling_rate,
+        },
+    }
+    results = []
+    for strategy_name in strategies:
+        for n_bufferstreams, n_dataflows in parse_plan_sizes(args.plan_sizes):
+            result = run_benchmark_case(
+                strategy_name, n_bufferstreams, n_dataflows, args.events,
+                rate_skew=args.rate_skew, payload_size=args.payload_size,
+                allocation_events=args.allocation_events, service_configs=service_configs
+            )
+            print(
+                f'{strategy_name} {n_bufferstreams}x{n_dataflows}: {result["events_per_sec"]:.0f} events/sec, '
+                f'p50 {result["latency_p50_us"]}us, p99 {result["latency_p99_us"]}us'
+            )
+            results.append(result)
+
+    report = {
+        'created_at': datetime.datetime.utcnow().isoformat(),
+        'python_version': platform.python_version(),
+        'seed': args.seed,
+        'results': results,
+    }
+    with open(args.output, 'w') as output_file:
+        json.dump(report, output_file, indent=2)
+    print(f'Results written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
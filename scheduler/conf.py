@@ -40,9 +40,21 @@ SERVICE_CMD_KEY_LIST = [
 ]
 
 PUB_EVENT_TYPE_SCHEDULING_PLAN_EXECUTED = config('PUB_EVENT_TYPE_SCHEDULING_PLAN_EXECUTED')
+PUB_EVENT_TYPE_SCHEDULER_STATS_REPORTED = config(
+    'PUB_EVENT_TYPE_SCHEDULER_STATS_REPORTED', default='SchedulerStatsReported'
+)
+PUB_EVENT_TYPE_SCHEDULER_EMERGENCY_SHEDDING_STARTED = config(
+    'PUB_EVENT_TYPE_SCHEDULER_EMERGENCY_SHEDDING_STARTED', default='SchedulerEmergencySheddingStarted'
+)
+PUB_EVENT_TYPE_SCHEDULER_EMERGENCY_SHEDDING_STOPPED = config(
+    'PUB_EVENT_TYPE_SCHEDULER_EMERGENCY_SHEDDING_STOPPED', default='SchedulerEmergencySheddingStopped'
+)
 
 PUB_EVENT_LIST = [
     PUB_EVENT_TYPE_SCHEDULING_PLAN_EXECUTED,
+    PUB_EVENT_TYPE_SCHEDULER_STATS_REPORTED,
+    PUB_EVENT_TYPE_SCHEDULER_EMERGENCY_SHEDDING_STARTED,
+    PUB_EVENT_TYPE_SCHEDULER_EMERGENCY_SHEDDING_STOPPED,
 ]
 
 
@@ -50,5 +62,65 @@ SERVICE_DETAILS = None
 
 DEFAULT_SCHEDULING_STRATEGY = config('DEFAULT_SCHEDULING_STRATEGY', default='round_robin')
 
+LOAD_SHEDDING_MODE = config('LOAD_SHEDDING_MODE', default='random')
+
+TRACE_SAMPLING_FORWARDED_RATE = config('TRACE_SAMPLING_FORWARDED_RATE', default=1.0, cast=float)
+TRACE_SAMPLING_SHED_RATE = config('TRACE_SAMPLING_SHED_RATE', default=1.0, cast=float)
+TRACE_SAMPLING_NO_PLAN_RATE = config('TRACE_SAMPLING_NO_PLAN_RATE', default=1.0, cast=float)
+
+METRICS_REPORT_INTERVAL = config('METRICS_REPORT_INTERVAL', default=0, cast=float)
+METRICS_SCRAPE_PORT = config('METRICS_SCRAPE_PORT', default=0, cast=int)
+
+DATA_BATCH_SIZE = config('DATA_BATCH_SIZE', default=1, cast=int)
+DATA_BATCH_MAX_WAIT_MS = config('DATA_BATCH_MAX_WAIT_MS', default=0, cast=int)
+
+DATA_WORKERS = config('DATA_WORKERS', default=1, cast=int)
+
+OUTPUT_BATCH_SIZE = config('OUTPUT_BATCH_SIZE', default=1, cast=int)
+OUTPUT_MAX_DELAY_MS = config('OUTPUT_MAX_DELAY_MS', default=10, cast=int)
+
+EVENT_PASSTHROUGH = config('EVENT_PASSTHROUGH', default=False, cast=bool)
+
+BACKLOG_REFRESH_INTERVAL_MS = config('BACKLOG_REFRESH_INTERVAL_MS', default=500, cast=int)
+
+EMERGENCY_SHEDDING_LAG_WATERMARK = config('EMERGENCY_SHEDDING_LAG_WATERMARK', default=0, cast=int)
+EMERGENCY_SHEDDING_AGE_WATERMARK_MS = config('EMERGENCY_SHEDDING_AGE_WATERMARK_MS', default=0, cast=int)
+EMERGENCY_SHEDDING_MAX_RATE = config('EMERGENCY_SHEDDING_MAX_RATE', default=0.9, cast=float)
+EMERGENCY_SHEDDING_EXIT_RATIO = config('EMERGENCY_SHEDDING_EXIT_RATIO', default=0.8, cast=float)
+EMERGENCY_SHEDDING_CHECK_INTERVAL_MS = config('EMERGENCY_SHEDDING_CHECK_INTERVAL_MS', default=500, cast=int)
+
+STICKY_ROUTING_KEY_FIELD = config('STICKY_ROUTING_KEY_FIELD', default='')
+STICKY_ROUTING_LOAD_FACTOR = config('STICKY_ROUTING_LOAD_FACTOR', default=1.25, cast=float)
+STICKY_ROUTING_LOAD_WINDOW = config('STICKY_ROUTING_LOAD_WINDOW', default=1000, cast=int)
+
+PLAN_SNAPSHOT_PATH = config('PLAN_SNAPSHOT_PATH', default='')
+
+BUFFERSTREAM_STATE_IDLE_TTL_S = config('BUFFERSTREAM_STATE_IDLE_TTL_S', default=600, cast=float)
+BUFFERSTREAM_STATE_CHECK_INTERVAL_S = config('BUFFERSTREAM_STATE_CHECK_INTERVAL_S', default=10, cast=float)
+
+DEDUP_WINDOW_S = config('DEDUP_WINDOW_S', default=0, cast=float)
+DEDUP_CAPACITY = config('DEDUP_CAPACITY', default=100000, cast=int)
+DEDUP_FALSE_POSITIVE_RATE = config('DEDUP_FALSE_POSITIVE_RATE', default=0.001, cast=float)
+
+FAIR_DISPATCH = config('FAIR_DISPATCH', default=False, cast=bool)
+
+RATE_LIMIT_BURST_S = config('RATE_LIMIT_BURST_S', default=1.0, cast=float)
+RATE_LIMIT_OVERFLOW = config('RATE_LIMIT_OVERFLOW', default='redirect')
+
+RECLAIM_MIN_IDLE_MS = config('RECLAIM_MIN_IDLE_MS', default=0, cast=int)
+RECLAIM_MAX_AGE_MS = config('RECLAIM_MAX_AGE_MS', default=0, cast=int)
+RECLAIM_INTERVAL_MS = config('RECLAIM_INTERVAL_MS', default=5000, cast=int)
+RECLAIM_COUNT = config('RECLAIM_COUNT', default=100, cast=int)
+
+DEADLINE_DEFAULT_BUDGET_MS = config('DEADLINE_DEFAULT_BUDGET_MS', default=0, cast=float)
+DEADLINE_EVENT_TIME_FIELD = config('DEADLINE_EVENT_TIME_FIELD', default='')
+
+SERVICE_RUNTIME = config('SERVICE_RUNTIME', default='threaded')
+ASYNC_READ_COUNT = config('ASYNC_READ_COUNT', default=100, cast=int)
+ASYNC_READ_BLOCK_MS = config('ASYNC_READ_BLOCK_MS', default=100, cast=int)
+ASYNC_READ_CONCURRENCY = config('ASYNC_READ_CONCURRENCY', default=1, cast=int)
+ASYNC_WRITE_CONCURRENCY = config('ASYNC_WRITE_CONCURRENCY', default=4, cast=int)
+ASYNC_QUEUE_SIZE = config('ASYNC_QUEUE_SIZE', default=64, cast=int)
+
 
 LOGGING_LEVEL = config('LOGGING_LEVEL', default='DEBUG')
@@ -0,0 +1,91 @@
+import time
+
+from .emergency import get_entry_id_timestamp_ms
+from .passthrough import PassthroughEvent, get_field_value
+
+
+# anything under this is taken as seconds, epoch milliseconds went over it in 1973
+MIN_EPOCH_MS = 10 ** 11
+
+
+def get_event_time_ms(event, event_time_field, event_time_field_name=None):
+    if isinstance(event, PassthroughEvent):
+        if event_time_field_name is None:
+            event_time_field_name = f'"{event_time_field}"'.encode('utf-8')
+        event_time = get_field_value(event.event_json, event_time_field_name)
+    else:
+        event_time = event.get(event_time_field)
+    if isinstance(event_time, bool) or not isinstance(event_time, (int, float)):
+        return None
+    return event_time if event_time >= MIN_EPOCH_MS else event_time * 1000
+
+
+class DeadlineChecker():
+    """
+    Tells the events that waited longer than the latency budget of their bufferstream (from the plan,
+    or the default budget), so they are dropped before being routed, instead of taking worker
+    capacity for a result the query can't use anymore.
+    The event time is its publish time field (epoch seconds or milliseconds) when set and present,
+    otherwise the time Redis added its entry to the service stream, from the entry id. The entry id time
+    is from the Redis server clock, it's moved to the local clock with the offset measured with the Redis
+    TIME every `clock_sync_interval_s`.
+    """
+
+    def __init__(self, default_budget_ms=0, event_time_field=None, clock_sync_interval_s=30):
+        self.default_budget_ms = default_budget_ms
+        self.clock_sync_interval = clock_sync_interval_s
+        # redis server clock minus the local clock
+        self.clock_offset_ms = 0
+        self.clock_synced_at = None
+        self.event_time_field = event_time_field
+        self.event_time_field_name = None
+        if event_time_field:
+            self.event_time_field_name = f'"{event_time_field}"'.encode('utf-8')
+        self.bufferstream_budgets_ms = {}
+        self.is_active = default_budget_ms > 0
+
+    def update_budgets(self, bufferstream_budgets_ms):
+        budgets = {}
+        for buffer_stream_key, budget_ms in (bufferstream_budgets_ms or {}).items():
+            budgets[buffer_stream_key] = float(budget_ms)
+        self.bufferstream_budgets_ms = budgets
+        self.is_active = self.default_budget_ms > 0 or any(budget > 0 for budget in budgets.values())
+
+    def is_clock_sync_due(self):
+        return self.clock_synced_at is None or time.monotonic() - self.clock_synced_at >= self.clock_sync_interval
+
+    def sync_clock(self, redis_time, local_time_ms):
+        seconds, microseconds = redis_time
+        self.clock_offset_ms = seconds * 1000 + microseconds / 1000 - local_time_ms
+
+    def get_event_time_ms(self, event_id, event):
+        if self.event_time_field:
+            event_time_ms = get_event_time_ms(event, self.event_time_field, self.event_time_field_name)
+            if event_time_ms is not None:
+                return event_time_ms
+        if event_id is None:
+            return None
+        entry_timestamp_ms = get_entry_id_timestamp_ms(event_id)
+        if entry_timestamp_ms is None:
+            return None
+        return entry_timestamp_ms - self.clock_offset_ms
+
+    def get_event_wait_ms(self, buffer_stream_key, event_id, event, now_ms):
+        """
+        Returns how long the event waited, if it's over its bufferstream budget, otherwise None.
+        """
+        budget_ms = self.bufferstream_budgets_ms.get(buffer_stream_key, self.default_budget_ms)
+        if budget_ms <= 0:
+            return None
+        event_time_ms = self.get_event_time_ms(event_id, event)
+        if event_time_ms is None:
+            return None
+        wait_ms = now_ms - event_time_ms
+        return wait_ms if wait_ms > budget_ms else None
+
+    def get_state(self):
+        return {
+            'default_budget_ms': self.default_budget_ms,
+            'bufferstream_budgets_ms': self.bufferstream_budgets_ms,
+            'clock_offset_ms': self.clock_offset_ms,
+        }
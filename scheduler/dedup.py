@@ -0,0 +1,92 @@
+import hashlib
+import math
+import time
+
+
+MASK_64 = (1 << 64) - 1
+
+
+def get_bloom_size(capacity, false_positive_rate):
+    bit_count = max(8, math.ceil(-capacity * math.log(false_positive_rate) / (math.log(2) ** 2)))
+    hash_count = max(1, round(bit_count / capacity * math.log(2)))
+    return bit_count, hash_count
+
+
+class BloomFilter():
+    """
+    Fixed size bit array, with the bit positions of a key derived from two 64 bit hashes
+    (double hashing), so each key is only hashed once whatever the number of bit positions.
+    """
+    __slots__ = ('bit_count', 'hash_count', 'bits', 'count')
+
+    def __init__(self, bit_count, hash_count):
+        self.bit_count = bit_count
+        self.hash_count = hash_count
+        self.bits = bytearray((bit_count + 7) // 8)
+        self.count = 0
+
+    def get_positions(self, first_hash, second_hash):
+        bit_count = self.bit_count
+        return [(first_hash + index * second_hash) % bit_count for index in range(self.hash_count)]
+
+    def contains(self, positions):
+        bits = self.bits
+        for position in positions:
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    def add(self, positions):
+        bits = self.bits
+        for position in positions:
+            bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+
+class DuplicateFilter():
+    """
+    Remembers the ids of the events seen in the last `window_s` seconds, to suppress the ones
+    delivered again (e.g.: pending entries claimed again by the reclaimer), in a fixed memory.
+    It's only kept in the process memory, so it starts empty on every restart.
+    It uses two bloom filter generations, the current one and the previous one, and an id is a
+    duplicate if either has it. The current generation becomes the previous one once it's `window_s`
+    old, or once it has `capacity` ids, so an id is remembered for at least `window_s` seconds
+    unless more than `capacity` ids are seen in that time. Each generation is sized for half of
+    the false positive rate, which is the rate of new events wrongly suppressed.
+    """
+
+    def __init__(self, window_s=60, capacity=100000, false_positive_rate=0.001):
+        self.window = window_s
+        self.capacity = capacity
+        self.false_positive_rate = false_positive_rate
+        self.bit_count, self.hash_count = get_bloom_size(capacity, false_positive_rate / 2)
+        self.current = BloomFilter(self.bit_count, self.hash_count)
+        self.previous = BloomFilter(self.bit_count, self.hash_count)
+        self.rotated_at = time.monotonic()
+        self.suppressed_count = 0
+
+    def rotate(self, now):
+        self.previous = self.current
+        self.current = BloomFilter(self.bit_count, self.hash_count)
+        self.rotated_at = now
+
+    def is_duplicate(self, event_id):
+        now = time.monotonic()
+        if now - self.rotated_at >= self.window or self.current.count >= self.capacity:
+            self.rotate(now)
+        key_hash = int.from_bytes(hashlib.blake2b(str(event_id).encode('utf-8'), digest_size=16).digest(), 'big')
+        # an odd second hash, so it's never a zero step that would give the same position k times
+        positions = self.current.get_positions(key_hash >> 64, (key_hash & MASK_64) | 1)
+        if self.current.contains(positions) or self.previous.contains(positions):
+            self.suppressed_count += 1
+            return True
+        self.current.add(positions)
+        return False
+
+    def get_state(self):
+        return {
+            'suppressed': self.suppressed_count,
+            'current_ids': self.current.count,
+            'previous_ids': self.previous.count,
+            'memory_bytes': len(self.current.bits) + len(self.previous.bits),
+        }
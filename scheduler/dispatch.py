@@ -0,0 +1,76 @@
+class FairDispatcher():
+    """
+    Orders the events of a read batch across their bufferstreams by weighted fair queueing
+    (self-clocked fair queueing), using the bufferstream weights of the plan (1 by default).
+    Each forwardable event gets a finish tag, `1 / weight` after the previous one of its bufferstream,
+    starting no earlier than the finish tag of the last dispatched event (the virtual time), and
+    the events are dispatched by increasing finish tag, so a bufferstream's order is kept.
+
+    Under overload only the first events of that order that fit in the budget are dispatched, and
+    the others are shed: the bufferstreams under their fair share keep all their events, and the
+    shedding is taken from the ones above it. Only the dispatched events advance the finish tags
+    of their bufferstream, so a bufferstream that had events shed is not penalised in the next batch.
+    The virtual time and finish tags are kept across batches, but events are never held for a later
+    batch, so the order only changes within each batch.
+    """
+
+    def __init__(self, state_store):
+        self.state_store = state_store
+        self.bufferstream_weights = {}
+        self.virtual_time = 0
+        self.budget_remainder = 0
+
+    def update_weights(self, bufferstream_weights):
+        weights = {}
+        for buffer_stream_key, weight in (bufferstream_weights or {}).items():
+            if float(weight) > 0:
+                weights[buffer_stream_key] = float(weight)
+        self.bufferstream_weights = weights
+
+    def get_budget(self, event_count, shedding_rate):
+        if shedding_rate <= 0:
+            return event_count
+        # the fraction of an event left out of a batch budget is carried to the next batches
+        budget = event_count * (1 - shedding_rate) + self.budget_remainder
+        dispatched_count = min(event_count, int(budget))
+        self.budget_remainder = budget - dispatched_count
+        return dispatched_count
+
+    def dispatch(self, bufferstream_dataflows, shedding_rate=0):
+        """
+        Takes a list of `(buffer_stream_key, events, data_flows)` and returns the `(buffer_stream_key, event,
+        data_flow)` of all the events in their dispatch order, with a None dataflow for the events shed.
+        Events that would not be forwarded anyway (shed by the plan or without a plan) are not queued.
+        """
+        dispatched = []
+        tagged_events = []
+        for group_index, (buffer_stream_key, events, data_flows) in enumerate(bufferstream_dataflows):
+            finish_tag = None
+            for event_index, data_flow in enumerate(data_flows):
+                if not data_flow:
+                    dispatched.append((buffer_stream_key, events[event_index], data_flow))
+                    continue
+                if finish_tag is None:
+                    state = self.state_store.get(buffer_stream_key)
+                    finish_tag = max(self.virtual_time, state.fair_finish_tag)
+                    step = 1 / self.bufferstream_weights.get(buffer_stream_key, 1.0)
+                finish_tag += step
+                tagged_events.append((finish_tag, group_index, event_index))
+        tagged_events.sort()
+
+        budget = self.get_budget(len(tagged_events), shedding_rate)
+        for position, (finish_tag, group_index, event_index) in enumerate(tagged_events):
+            buffer_stream_key, events, data_flows = bufferstream_dataflows[group_index]
+            if position < budget:
+                self.state_store.get(buffer_stream_key).fair_finish_tag = finish_tag
+                self.virtual_time = finish_tag
+                dispatched.append((buffer_stream_key, events[event_index], data_flows[event_index]))
+            else:
+                dispatched.append((buffer_stream_key, events[event_index], None))
+        return dispatched
+
+    def get_state(self):
+        return {
+            'virtual_time': self.virtual_time,
+            'bufferstream_weights': self.bufferstream_weights,
+        }
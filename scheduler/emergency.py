@@ -0,0 +1,128 @@
+import time
+
+
+EMERGENCY_SHEDDING_STARTED = 'started'
+EMERGENCY_SHEDDING_STOPPED = 'stopped'
+
+
+def get_entry_id_timestamp_ms(event_id):
+    if isinstance(event_id, bytes):
+        event_id = event_id.decode('utf-8')
+    if not isinstance(event_id, str):
+        return None
+    try:
+        return int(event_id.split('-', 1)[0])
+    except ValueError:
+        return None
+
+
+class EmergencyShedder():
+    """
+    Local self-protection of the scheduler against bursts on its own input stream, that don't
+    wait for the planner to publish a load shedding plan.
+
+    Every check interval it compares the consumer group backlog (lag + pending) of the service
+    stream, and the age of the oldest event read since the last check, to their watermarks.
+    The highest of these ratios is the pressure: above 1 the shedder is active, and sheds a
+    `1 - 1 / pressure` share of the routed events (capped by the max shedding rate), which is the
+    share that brings the input rate back to what keeps the backlog at its watermark.
+    It's only deactivated once the pressure goes under the exit ratio, so it doesn't flap around
+    the watermark.
+    """
+
+    def __init__(self, service_stream, load_shedder,
+                 lag_watermark=0, age_watermark_ms=0, max_shedding_rate=0.9, exit_ratio=0.8,
+                 check_interval_ms=500, logger=None):
+        self.service_stream = service_stream
+        self.load_shedder = load_shedder
+        self.lag_watermark = lag_watermark
+        self.age_watermark_ms = age_watermark_ms
+        self.max_shedding_rate = max_shedding_rate
+        self.exit_ratio = exit_ratio
+        self.check_interval = check_interval_ms / 1000
+        self.logger = logger
+        self.enabled = lag_watermark > 0 or age_watermark_ms > 0
+        self.group_name = f'cg-{service_stream.key}'
+        self.is_active = False
+        self.shedding_rate = 0
+        self.lag = 0
+        self.oldest_event_age_ms = 0
+        self.max_event_age_ms = 0
+        self.last_check_time = None
+
+    def record_oldest_event_id(self, event_id):
+        # entry ids start with the time Redis added the entry, so this age includes any clock skew to Redis
+        entry_timestamp_ms = get_entry_id_timestamp_ms(event_id)
+        if entry_timestamp_ms is None:
+            return
+        event_age_ms = time.time() * 1000 - entry_timestamp_ms
+        if event_age_ms > self.max_event_age_ms:
+            self.max_event_age_ms = event_age_ms
+
+    def read_lag(self):
+        redis_db = getattr(self.service_stream, 'redis_db', None)
+        if redis_db is None:
+            return 0
+        for group_info in redis_db.xinfo_groups(self.service_stream.key):
+            group_name = group_info.get('name')
+            if isinstance(group_name, bytes):
+                group_name = group_name.decode('utf-8')
+            if group_name == self.group_name:
+                # 'lag' is only available from Redis 7, and can be None if it can't be computed
+                return group_info.get('pending', 0) + (group_info.get('lag') or 0)
+        return 0
+
+    def get_pressure(self):
+        pressure = 0
+        if self.lag_watermark > 0:
+            pressure = self.lag / self.lag_watermark
+        if self.age_watermark_ms > 0:
+            pressure = max(pressure, self.oldest_event_age_ms / self.age_watermark_ms)
+        return pressure
+
+    def is_check_due(self):
+        if self.last_check_time is None:
+            return True
+        return time.perf_counter() - self.last_check_time >= self.check_interval
+
+    def check(self):
+        """
+        Updates the shedding state, and returns whether it started or stopped shedding, if it changed.
+        """
+        self.last_check_time = time.perf_counter()
+        try:
+            self.lag = self.read_lag()
+        except Exception as e:
+            if self.logger is not None:
+                self.logger.error('Error reading the service stream lag:')
+                self.logger.exception(e)
+        self.oldest_event_age_ms = self.max_event_age_ms
+        self.max_event_age_ms = 0
+
+        pressure = self.get_pressure()
+        if pressure >= 1:
+            self.shedding_rate = min(self.max_shedding_rate, 1 - 1 / pressure)
+            if not self.is_active:
+                self.is_active = True
+                return EMERGENCY_SHEDDING_STARTED
+        elif self.is_active:
+            self.shedding_rate = 0
+            if pressure < self.exit_ratio:
+                self.is_active = False
+                return EMERGENCY_SHEDDING_STOPPED
+        return None
+
+    def is_shedding_event(self, buffer_stream_key):
+        if not self.is_active or self.shedding_rate == 0:
+            return False
+        return self.load_shedder.is_shedding_event(buffer_stream_key, self.shedding_rate)
+
+    def get_state(self):
+        return {
+            'is_active': self.is_active,
+            'shedding_rate': self.shedding_rate,
+            'lag': self.lag,
+            'oldest_event_age_ms': self.oldest_event_age_ms,
+            'lag_watermark': self.lag_watermark,
+            'age_watermark_ms': self.age_watermark_ms,
+        }
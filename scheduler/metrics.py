@@ -0,0 +1,256 @@
+from array import array
+
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily, REGISTRY
+from prometheus_client import start_http_server
+
+from .sampling import ROUTING_CATEGORIES
+from .strategies.dataflow import get_dataflow_label
+
+
+ROUTING_CATEGORY_INDEXES = {category: index for index, category in enumerate(ROUTING_CATEGORIES)}
+
+HISTOGRAM_SUB_BUCKET_BITS = 4
+HISTOGRAM_SUB_BUCKETS = 1 << HISTOGRAM_SUB_BUCKET_BITS
+HISTOGRAM_LINEAR_LIMIT = HISTOGRAM_SUB_BUCKETS * 2
+HISTOGRAM_MAX_SHIFT = 31
+HISTOGRAM_BUCKETS = HISTOGRAM_LINEAR_LIMIT + HISTOGRAM_MAX_SHIFT * HISTOGRAM_SUB_BUCKETS
+HISTOGRAM_MAX_VALUE = (HISTOGRAM_LINEAR_LIMIT << HISTOGRAM_MAX_SHIFT) - 1
+
+
+class LatencyHistogram():
+    """
+    HDR-style log-linear histogram of latencies in microseconds, with a fixed array of buckets.
+    Values up to 32us have their own bucket, and each power of two above that is split in 16 linear
+    sub-buckets, which keeps the relative error of the reported percentiles under ~6%.
+    """
+
+    def __init__(self):
+        self.counts = array('Q', bytes(8 * HISTOGRAM_BUCKETS))
+        self.total_count = 0
+        self.total_us = 0
+        self.max_us = 0
+
+    def record(self, seconds):
+        value = int(seconds * 1000000)
+        if value < 0:
+            value = 0
+        elif value > HISTOGRAM_MAX_VALUE:
+            value = HISTOGRAM_MAX_VALUE
+        if value < HISTOGRAM_LINEAR_LIMIT:
+            index = value
+        else:
+            shift = value.bit_length() - HISTOGRAM_SUB_BUCKET_BITS - 1
+            index = (
+                HISTOGRAM_LINEAR_LIMIT + (shift - 1) * HISTOGRAM_SUB_BUCKETS + (value >> shift) - HISTOGRAM_SUB_BUCKETS
+            )
+        self.counts[index] += 1
+        self.total_count += 1
+        self.total_us += value
+        if value > self.max_us:
+            self.max_us = value
+
+    def get_bucket_value(self, index):
+        if index < HISTOGRAM_LINEAR_LIMIT:
+            return index
+        shift = (index - HISTOGRAM_LINEAR_LIMIT) // HISTOGRAM_SUB_BUCKETS + 1
+        top = (index - HISTOGRAM_LINEAR_LIMIT) % HISTOGRAM_SUB_BUCKETS + HISTOGRAM_SUB_BUCKETS
+        # middle of the bucket
+        return (top << shift) + (1 << (shift - 1))
+
+    def get_percentile(self, percentile):
+        if self.total_count == 0:
+            return 0
+        target_count = max(1, int(self.total_count * percentile / 100 + 0.5))
+        cumulative_count = 0
+        for index, count in enumerate(self.counts):
+            cumulative_count += count
+            if cumulative_count >= target_count:
+                return min(self.get_bucket_value(index), self.max_us)
+        return self.max_us
+
+    def get_summary(self):
+        mean_us = self.total_us / self.total_count if self.total_count else 0
+        return {
+            'count': self.total_count,
+            'mean_us': mean_us,
+            'p50_us': self.get_percentile(50),
+            'p90_us': self.get_percentile(90),
+            'p99_us': self.get_percentile(99),
+            'max_us': self.max_us,
+        }
+
+
+class SchedulerMetrics():
+    """
+    Cumulative per-bufferstream, per-dataflow and per-destination event counters, plus routing
+    and write latency histograms. The counters are preallocated arrays looked up by keys that
+    already exist on the hot path (bufferstream key, destination key and the plan's dataflow
+    objects), so recording an event does not build any new container or string.
+    """
+
+    def __init__(self):
+        self.bufferstream_counters = {}
+        self.destination_counters = {}
+        self.dataflow_label_counters = {}
+        self.dataflow_counters = {}
+        self.duplicate_counters = {}
+        self.throttle_counters = {}
+        self.expired_counters = {}
+        self.routing_latency = LatencyHistogram()
+        self.write_latency = LatencyHistogram()
+
+    def register_plan(self, plan):
+        dataflow_counters = {}
+        for routing_table in plan.routing_tables.values():
+            for data_flow in routing_table.dataflows:
+                label = get_dataflow_label(data_flow)
+                counter = self.dataflow_label_counters.get(label)
+                if counter is None:
+                    counter = array('Q', [0])
+                    self.dataflow_label_counters[label] = counter
+                dataflow_counters[id(data_flow)] = counter
+        self.dataflow_counters = dataflow_counters
+
+    def record_event(self, buffer_stream_key, routing_category, data_flow):
+        counters = self.bufferstream_counters.get(buffer_stream_key)
+        if counters is None:
+            counters = array('Q', bytes(8 * len(ROUTING_CATEGORIES)))
+            self.bufferstream_counters[buffer_stream_key] = counters
+        counters[ROUTING_CATEGORY_INDEXES[routing_category]] += 1
+        if data_flow:
+            dataflow_counter = self.dataflow_counters.get(id(data_flow))
+            if dataflow_counter is not None:
+                dataflow_counter[0] += 1
+
+    def record_destination_event(self, destination):
+        counter = self.destination_counters.get(destination)
+        if counter is None:
+            counter = array('Q', [0])
+            self.destination_counters[destination] = counter
+        counter[0] += 1
+
+    def record_duplicate_event(self, buffer_stream_key):
+        counter = self.duplicate_counters.get(buffer_stream_key)
+        if counter is None:
+            counter = array('Q', [0])
+            self.duplicate_counters[buffer_stream_key] = counter
+        counter[0] += 1
+
+    def record_expired_event(self, buffer_stream_key):
+        counter = self.expired_counters.get(buffer_stream_key)
+        if counter is None:
+            counter = array('Q', [0])
+            self.expired_counters[buffer_stream_key] = counter
+        counter[0] += 1
+
+    def record_throttled_event(self, destination, is_redirected):
+        counters = self.throttle_counters.get(destination)
+        if counters is None:
+            counters = array('Q', [0, 0])
+            self.throttle_counters[destination] = counters
+        counters[0 if is_redirected else 1] += 1
+
+    def record_routing_latency(self, seconds):
+        self.routing_latency.record(seconds)
+
+    def record_write_latency(self, seconds):
+        self.write_latency.record(seconds)
+
+    def get_stats(self):
+        return {
+            'bufferstreams': {
+                buffer_stream_key: dict(zip(ROUTING_CATEGORIES, counters))
+                for buffer_stream_key, counters in list(self.bufferstream_counters.items())
+            },
+            'dataflows': {label: counter[0] for label, counter in list(self.dataflow_label_counters.items())},
+            'destinations': {
+                destination: counter[0] for destination, counter in list(self.destination_counters.items())
+            },
+            'duplicates': {
+                buffer_stream_key: counter[0] for buffer_stream_key, counter in list(self.duplicate_counters.items())
+            },
+            'expired': {
+                buffer_stream_key: counter[0] for buffer_stream_key, counter in list(self.expired_counters.items())
+            },
+            'throttled': {
+                destination: {'redirected': counters[0], 'shed': counters[1]}
+                for destination, counters in list(self.throttle_counters.items())
+            },
+            'routing_latency': self.routing_latency.get_summary(),
+            'write_latency': self.write_latency.get_summary(),
+        }
+
+
+class SchedulerMetricsCollector():
+    """
+    Prometheus collector that reads the scheduler metrics only when scraped.
+    """
+
+    def __init__(self, metrics, service_name):
+        self.metrics = metrics
+        self.service_name = service_name
+
+    def collect(self):
+        stats = self.metrics.get_stats()
+        events = CounterMetricFamily(
+            'scheduler_bufferstream_events', 'Routed data events per bufferstream and category',
+            labels=['service', 'bufferstream', 'category']
+        )
+        for buffer_stream_key, category_counts in stats['bufferstreams'].items():
+            for category, count in category_counts.items():
+                events.add_metric([self.service_name, buffer_stream_key, category], count)
+        yield events
+
+        dataflow_events = CounterMetricFamily(
+            'scheduler_dataflow_events', 'Data events routed per dataflow', labels=['service', 'dataflow']
+        )
+        for label, count in stats['dataflows'].items():
+            dataflow_events.add_metric([self.service_name, label], count)
+        yield dataflow_events
+
+        destination_events = CounterMetricFamily(
+            'scheduler_destination_events', 'Data events sent per destination stream', labels=['service', 'destination']
+        )
+        for destination, count in stats['destinations'].items():
+            destination_events.add_metric([self.service_name, destination], count)
+        yield destination_events
+
+        duplicate_events = CounterMetricFamily(
+            'scheduler_bufferstream_duplicates', 'Redelivered data events suppressed per bufferstream',
+            labels=['service', 'bufferstream']
+        )
+        for buffer_stream_key, count in stats['duplicates'].items():
+            duplicate_events.add_metric([self.service_name, buffer_stream_key], count)
+        yield duplicate_events
+
+        expired_events = CounterMetricFamily(
+            'scheduler_bufferstream_expired', 'Data events dropped past their latency budget per bufferstream',
+            labels=['service', 'bufferstream']
+        )
+        for buffer_stream_key, count in stats['expired'].items():
+            expired_events.add_metric([self.service_name, buffer_stream_key], count)
+        yield expired_events
+
+        throttled_events = CounterMetricFamily(
+            'scheduler_destination_throttled', 'Data events over a destination capacity, redirected or shed',
+            labels=['service', 'destination', 'action']
+        )
+        for destination, action_counts in stats['throttled'].items():
+            for action, count in action_counts.items():
+                throttled_events.add_metric([self.service_name, destination, action], count)
+        yield throttled_events
+
+        for latency_name in ['routing_latency', 'write_latency']:
+            latency = GaugeMetricFamily(
+                f'scheduler_{latency_name}_microseconds', f'Data event {latency_name.replace("_", " ")} percentiles',
+                labels=['service', 'quantile']
+            )
+            summary = stats[latency_name]
+            for quantile_name in ['p50_us', 'p90_us', 'p99_us', 'max_us']:
+                latency.add_metric([self.service_name, quantile_name[:-3]], summary[quantile_name])
+            yield latency
+
+
+def start_metrics_scrape_endpoint(metrics, service_name, port):
+    REGISTRY.register(SchedulerMetricsCollector(metrics, service_name))
+    start_http_server(port)
@@ -0,0 +1,149 @@
+import time
+
+
+class DestinationStreamPool():
+    """
+    Pool of destination stream handles, keyed by the destination stream key.
+    It is kept in sync with the first-hop destinations of the current plan,
+    instead of being limited to an arbitrary number of cached streams.
+    """
+
+    def __init__(self, stream_factory):
+        self.stream_factory = stream_factory
+        self.streams = {}
+
+    def get(self, destination):
+        stream = self.streams.get(destination)
+        if stream is None:
+            stream = self.stream_factory.create(destination, stype='streamOnly')
+            self.streams[destination] = stream
+        return stream
+
+    def warm_up(self, destinations, timeout_s=None):
+        """
+        Returns the streams of the destinations, reusing the pool ones and creating the missing ones,
+        without changing the pool, so it can run before the plan swap. The connection of each stream
+        is validated once, which also leaves an open connection in its pool for the first writes.
+        Destinations that fail, or that are left once `timeout_s` is over, are left out,
+        they are created on their first event instead.
+        """
+        streams = {}
+        failed_destinations = {}
+        validated_connections = {}
+        deadline = time.perf_counter() + timeout_s if timeout_s is not None else None
+        for destination in destinations:
+            if deadline is not None and time.perf_counter() >= deadline:
+                failed_destinations[destination] = TimeoutError(f'warm up took more than {timeout_s}s')
+                continue
+            stream = self.streams.get(destination)
+            try:
+                if stream is None:
+                    stream = self.stream_factory.create(destination, stype='streamOnly')
+                redis_db = getattr(stream, 'redis_db', None)
+                if redis_db is not None and id(redis_db) not in validated_connections:
+                    redis_db.ping()
+                    validated_connections[id(redis_db)] = redis_db
+            except Exception as e:
+                failed_destinations[destination] = e
+                continue
+            streams[destination] = stream
+        return streams, failed_destinations
+
+    def install(self, streams, destinations=()):
+        # keeps the streams of the plan destinations created in the pool since the warm up
+        streams = dict(streams)
+        for destination in destinations:
+            if destination not in streams and destination in self.streams:
+                streams[destination] = self.streams[destination]
+        retired_destinations = set(self.streams.keys()) - set(streams.keys())
+        self.streams = streams
+        return retired_destinations
+
+    def retain(self, destinations):
+        retired_destinations = set(self.streams.keys()) - set(destinations)
+        for destination in retired_destinations:
+            del self.streams[destination]
+        return retired_destinations
+
+    def __len__(self):
+        return len(self.streams)
+
+
+class GroupedOutputStage():
+    """
+    Collects the serialized outgoing events per destination stream and writes them
+    in a single pipelined batch of XADDs, once either the batch size or the max delay
+    of the oldest pending event is reached.
+    """
+
+    def __init__(self, max_batch_size, max_delay_ms, logger):
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay_ms / 1000
+        self.logger = logger
+        self.pending_destinations = {}
+        self.pending_count = 0
+        self.oldest_pending_time = None
+        self.has_failed_writes = False
+
+    def add(self, destination_stream, event_msg):
+        pending = self.pending_destinations.get(destination_stream.key)
+        if pending is None:
+            pending = (destination_stream, [])
+            self.pending_destinations[destination_stream.key] = pending
+        pending[1].append(event_msg)
+        if self.pending_count == 0:
+            self.oldest_pending_time = time.perf_counter()
+        self.pending_count += 1
+        if self.pending_count >= self.max_batch_size:
+            self.flush()
+
+    def is_flush_due(self):
+        if self.pending_count == 0:
+            return False
+        if self.pending_count >= self.max_batch_size:
+            return True
+        return time.perf_counter() - self.oldest_pending_time >= self.max_delay
+
+    def flush_if_due(self):
+        if self.is_flush_due():
+            self.flush()
+
+    def _group_by_connection(self, pending_list):
+        pipelined_groups = {}
+        unpipelined = []
+        for destination_stream, event_msgs in pending_list:
+            redis_db = getattr(destination_stream, 'redis_db', None)
+            if redis_db is None:
+                unpipelined.append((destination_stream, event_msgs))
+            else:
+                pipelined_groups.setdefault(id(redis_db), (redis_db, []))[1].append((destination_stream, event_msgs))
+        return pipelined_groups.values(), unpipelined
+
+    def flush(self):
+        if self.pending_count == 0:
+            return 0
+        pending_list = list(self.pending_destinations.values())
+        flushed_count = self.pending_count
+        self.pending_destinations = {}
+        self.pending_count = 0
+        self.oldest_pending_time = None
+
+        pipelined_groups, unpipelined = self._group_by_connection(pending_list)
+        try:
+            for redis_db, destinations_msgs in pipelined_groups:
+                pipeline = redis_db.pipeline(transaction=False)
+                for destination_stream, event_msgs in destinations_msgs:
+                    write_kwargs = getattr(destination_stream, 'default_write_kwargs', {})
+                    for event_msg in event_msgs:
+                        pipeline.xadd(destination_stream.key, event_msg, **write_kwargs)
+                pipeline.execute()
+
+            for destination_stream, event_msgs in unpipelined:
+                destination_stream.write_events(*event_msgs)
+        except Exception:
+            # so the read events of this flush are not acked
+            self.has_failed_writes = True
+            raise
+
+        self.logger.debug(f'Flushed {flushed_count} events to {len(pending_list)} destination streams')
+        return flushed_count
@@ -0,0 +1,191 @@
+import json
+import re
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+JSON_CODEC = 'json'
+MSGPACK_CODEC = 'msgpack'
+EVENT_CODEC_FIELD = 'codec'
+
+AVAILABLE_CODECS = [JSON_CODEC]
+if msgpack is not None:
+    AVAILABLE_CODECS.append(MSGPACK_CODEC)
+
+
+ID_FIELD = b'"id"'
+BUFFER_STREAM_KEY_FIELD = b'"buffer_stream_key"'
+ROUTING_FIELDS = [b'"data_flow"', b'"data_path"', b'"plan_version"']
+NUMBER_PATTERN = re.compile(rb'-?(?:0|[1-9]\d*)(\.\d+)?([eE][+-]?\d+)?')
+STRING_PATTERN = re.compile(rb'"(?:[^"\\]|\\.)*"')
+WHITESPACE = b' \t\n\r'
+
+
+def is_json_object(event_json):
+    stripped = event_json.strip(WHITESPACE)
+    return stripped.startswith(b'{') and stripped.endswith(b'}')
+
+
+def get_nesting_depth(json_prefix):
+    # strings are emptied first, so the brackets inside them are not counted
+    json_prefix = STRING_PATTERN.sub(b'""', json_prefix)
+    return json_prefix.count(b'{') + json_prefix.count(b'[') - json_prefix.count(b'}') - json_prefix.count(b']')
+
+
+def find_top_level_field(event_json, field):
+    """
+    Position right after the colon of the `field` key of the top level object, or -1 if it only
+    shows up as a nested key, or as a value.
+    Any quote inside a json string value is escaped, so the field name can't be matched inside one.
+    """
+    start = event_json.find(field)
+    while start >= 0:
+        previous = start - 1
+        while previous >= 0 and event_json[previous] in WHITESPACE:
+            previous -= 1
+        position = start + len(field)
+        while position < len(event_json) and event_json[position] in WHITESPACE:
+            position += 1
+        is_key = previous >= 0 and event_json[previous] in b'{,' and event_json[position:position + 1] == b':'
+        if is_key and get_nesting_depth(event_json[:start]) == 1:
+            return position + 1
+        start = event_json.find(field, start + 1)
+    return -1
+
+
+def get_field_value(event_json, field):
+    """
+    Value of a string or number field, found with plain bytes searches instead of a json decode.
+    Returns None if the field is missing, or if it's not possible to be sure it's the top level field
+    without decoding the event: when its name shows up more than once, or the value has escapes.
+    """
+    if event_json.count(field) != 1:
+        return None
+    position = find_top_level_field(event_json, field)
+    if position < 0:
+        return None
+    while position < len(event_json) and event_json[position] in WHITESPACE:
+        position += 1
+    if event_json[position:position + 1] == b'"':
+        end = event_json.find(b'"', position + 1)
+        value = event_json[position + 1:end]
+        if end < 0 or b'\\' in value:
+            return None
+        return value.decode('utf-8')
+    number_match = NUMBER_PATTERN.match(event_json, position)
+    if number_match is None:
+        return None
+    if number_match.group(1) is None and number_match.group(2) is None:
+        return int(number_match.group())
+    return float(number_match.group())
+
+
+class PassthroughEvent():
+    """
+    Data event that was only partially decoded: just its routing fields are extracted
+    from the original json bytes, which are kept to be forwarded as they are.
+    """
+    __slots__ = ('id', 'buffer_stream_key', 'event_json')
+
+    def __init__(self, event_id, buffer_stream_key, event_json):
+        self.id = event_id
+        self.buffer_stream_key = buffer_stream_key
+        self.event_json = event_json
+
+    def decode(self):
+        return json.loads(self.event_json)
+
+    def __repr__(self):
+        return f'PassthroughEvent(id={self.id!r}, buffer_stream_key={self.buffer_stream_key!r})'
+
+
+def extract_passthrough_event(json_msg):
+    """
+    Returns the event as a `PassthroughEvent`, or None if it can't be safely routed
+    without decoding it, in which case the event should go through the dict based path.
+    """
+    event_json = json_msg.get(b'event', json_msg.get('event'))
+    if event_json is None:
+        return None
+    if isinstance(event_json, str):
+        event_json = event_json.encode('utf-8')
+    # the routing fields are spliced before the closing brace, and validated like the decoded events' keys
+    if not is_json_object(event_json):
+        return None
+    buffer_stream_key = get_field_value(event_json, BUFFER_STREAM_KEY_FIELD)
+    if not isinstance(buffer_stream_key, str) or find_top_level_field(event_json, ID_FIELD) < 0:
+        return None
+    # the routing fields are appended to the event, so the event can't have them already
+    for routing_field in ROUTING_FIELDS:
+        if routing_field in event_json:
+            return None
+    # the id is only used for logging, it's left unset when it can't be told apart from nested ids
+    return PassthroughEvent(get_field_value(event_json, ID_FIELD), buffer_stream_key, event_json)
+
+
+def splice_fields(event_json, fields_fragment):
+    # the event has to be a json object, as checked by `extract_passthrough_event`
+    body = event_json.rstrip()[:-1].rstrip()
+    if body.endswith(b'{'):
+        return body + fields_fragment + b'}'
+    return body + b', ' + fields_fragment + b'}'
+
+
+def msgpack_event_serializer(event_data):
+    return {'event': msgpack.packb(event_data, use_bin_type=True), EVENT_CODEC_FIELD: MSGPACK_CODEC}
+
+
+class PassthroughEncoder():
+    """
+    Encodes the routed passthrough events by splicing the routing fields into the original
+    event bytes, using the encoded form the plan dataflows already carry.
+    Destinations can have a different codec set in the plan options, those get the decoded event
+    encoded with that codec instead. Each event is encoded once per codec, whatever the number of
+    destinations that use it.
+    """
+
+    def __init__(self):
+        self.stream_codecs = {}
+
+    def register_plan(self, plan):
+        stream_codecs = {}
+        unavailable_codecs = {}
+        for destination, codec in plan.options.get('stream_codecs', {}).items():
+            if codec not in AVAILABLE_CODECS:
+                unavailable_codecs[destination] = codec
+            elif codec != JSON_CODEC:
+                stream_codecs[destination] = codec
+        self.stream_codecs = stream_codecs
+        return unavailable_codecs
+
+    def get_stream_codec(self, destination):
+        return self.stream_codecs.get(destination, JSON_CODEC)
+
+    def get_stream_serializer(self, destination):
+        if self.get_stream_codec(destination) == MSGPACK_CODEC:
+            return msgpack_event_serializer
+        return None
+
+    def get_routing_fragment(self, data_flow, plan_version):
+        # the plan dataflows are already encoded, only dataflows not from a compiled plan are encoded here
+        encoded_dataflow = getattr(data_flow, 'encoded', None)
+        if encoded_dataflow is None:
+            encoded_dataflow = json.dumps(data_flow).encode('utf-8')
+        return (
+            b'"data_flow": ' + encoded_dataflow + b', "data_path": [], "plan_version": '
+            + str(plan_version).encode('utf-8')
+        )
+
+    def encode(self, event, data_flow, plan_version, codec=JSON_CODEC):
+        if codec == JSON_CODEC:
+            return {'event': splice_fields(event.event_json, self.get_routing_fragment(data_flow, plan_version))}
+        event_data = event.decode()
+        event_data.update({
+            'data_flow': data_flow,
+            'data_path': [],
+            'plan_version': plan_version,
+        })
+        return msgpack_event_serializer(event_data)
@@ -0,0 +1,54 @@
+class PlanSnapshot():
+    """
+    Immutable snapshot of a compiled plan, as seen by the data path.
+    The strategy and its routing tables are published together, with a single reference swap,
+    so an event is never routed by a strategy with another plan's tables.
+    """
+    __slots__ = ('version', 'strategy_name', 'strategy', 'routing_tables', 'options')
+
+    def __init__(self, version, strategy_name, strategy, routing_tables, options=None):
+        self.version = version
+        self.strategy_name = strategy_name
+        self.strategy = strategy
+        self.routing_tables = routing_tables
+        # extra execution plan settings that are not part of the strategy, eg: trace sampling rates
+        self.options = options if options is not None else {}
+
+    def get_bufferstream_dataflow(self, buffer_stream_key):
+        routing_table = self.routing_tables.get(buffer_stream_key)
+        if routing_table is None:
+            return []
+        return self.strategy.select_dataflow(buffer_stream_key, routing_table)
+
+    def get_bufferstream_dataflows(self, buffer_stream_key, n):
+        routing_table = self.routing_tables.get(buffer_stream_key)
+        if routing_table is None:
+            return [[]] * n
+        return self.strategy.select_dataflows(buffer_stream_key, routing_table, n)
+
+    def get_event_dataflow(self, buffer_stream_key, event):
+        routing_table = self.routing_tables.get(buffer_stream_key)
+        if routing_table is None:
+            return []
+        return self.strategy.select_event_dataflow(buffer_stream_key, routing_table, event)
+
+    def get_event_dataflows(self, buffer_stream_key, events):
+        routing_table = self.routing_tables.get(buffer_stream_key)
+        if routing_table is None:
+            return [[]] * len(events)
+        return self.strategy.select_event_dataflows(buffer_stream_key, routing_table, events)
+
+    def get_dataflows(self):
+        dataflows = set()
+        for routing_table in self.routing_tables.values():
+            dataflows.update(routing_table.dataflows)
+        return dataflows
+
+    def get_first_hop_destinations(self):
+        destinations = set()
+        for routing_table in self.routing_tables.values():
+            destinations.update(routing_table.first_hop_destinations)
+        return destinations
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(version={self.version}, strategy_name={self.strategy_name})'
@@ -0,0 +1,101 @@
+REDIRECT_OVERFLOW = 'redirect'
+SHED_OVERFLOW = 'shed'
+
+
+class TokenBucket():
+    __slots__ = ('rate', 'burst', 'tokens', 'updated_at')
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = now
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+
+class DestinationRateLimiter():
+    """
+    Token bucket per destination stream, filled at the destination capacity (events per second)
+    from the plan, and holding up to `burst_s` seconds of it. An event is only admitted on a dataflow
+    if all of its first hop destinations have a token left, and then it takes one from each.
+    Over budget events go to the highest weighted dataflow of their routing table that has tokens,
+    when the overflow is `redirect`, otherwise they're shed.
+    When the events are routed by several data worker processes, each has its `capacity_share`.
+    """
+
+    def __init__(self, burst_s=1.0, capacity_share=1.0, overflow=REDIRECT_OVERFLOW):
+        self.burst_s = burst_s
+        self.capacity_share = capacity_share
+        self.overflow = overflow
+        self.buckets = {}
+
+    def update(self, destination_capacities, now):
+        buckets = {}
+        for destination, capacity in (destination_capacities or {}).items():
+            rate = float(capacity) * self.capacity_share
+            if rate <= 0:
+                continue
+            burst = max(1.0, rate * self.burst_s)
+            bucket = self.buckets.get(destination)
+            if bucket is None:
+                bucket = TokenBucket(rate, burst, now)
+            else:
+                # keeps the tokens left, so a new plan doesn't hand out a new burst
+                bucket.refill(now)
+                bucket.rate = rate
+                bucket.burst = burst
+                bucket.tokens = min(bucket.tokens, burst)
+            buckets[destination] = bucket
+        self.buckets = buckets
+
+    def get_blocking_destination(self, data_flow, now):
+        buckets = self.buckets
+        for destination in data_flow.first_hop_destinations:
+            bucket = buckets.get(destination)
+            if bucket is None:
+                continue
+            if bucket.tokens < 1:
+                bucket.refill(now)
+                if bucket.tokens < 1:
+                    return destination
+        return None
+
+    def take(self, data_flow):
+        buckets = self.buckets
+        for destination in data_flow.first_hop_destinations:
+            bucket = buckets.get(destination)
+            if bucket is not None:
+                bucket.tokens -= 1
+
+    def select_alternative_dataflow(self, routing_table, data_flow, now):
+        if self.overflow != REDIRECT_OVERFLOW or routing_table is None:
+            return None
+        weights = routing_table.weights
+        for index in sorted(range(routing_table.size), key=lambda index: -weights[index]):
+            alternative_data_flow = routing_table.dataflows[index]
+            if alternative_data_flow is data_flow or weights[index] <= 0:
+                continue
+            if self.get_blocking_destination(alternative_data_flow, now) is None:
+                self.take(alternative_data_flow)
+                return alternative_data_flow
+        return None
+
+    def limit(self, routing_table, data_flow, now):
+        """
+        Returns the dataflow the event can go to (None if it's shed), and the destination
+        that was over budget on its selected dataflow, if any.
+        """
+        blocking_destination = self.get_blocking_destination(data_flow, now)
+        if blocking_destination is None:
+            self.take(data_flow)
+            return data_flow, None
+        return self.select_alternative_dataflow(routing_table, data_flow, now), blocking_destination
+
+    def get_state(self):
+        return {
+            destination: {'rate': bucket.rate, 'burst': bucket.burst, 'tokens': bucket.tokens}
+            for destination, bucket in list(self.buckets.items())
+        }
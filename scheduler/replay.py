@@ -0,0 +1,428 @@
+#!/usr/bin/env python
+import argparse
+import concurrent.futures
+import datetime
+import heapq
+import itertools
+import json
+import platform
+import random
+
+import redis
+
+from scheduler.benchmark import InMemoryStreamFactory, create_benchmark_service
+from scheduler.emergency import get_entry_id_timestamp_ms
+from scheduler.metrics import LatencyHistogram
+
+from scheduler.conf import (
+    REDIS_ADDRESS,
+    REDIS_PORT,
+    SERVICE_STREAM_KEY,
+    LISTEN_EVENT_TYPE_NEW_QUERY_SCHEDULING_PLANNED,
+    LISTEN_EVENT_TYPE_SERVICE_WORKER_SLR_PROFILE_PLANNED,
+    LISTEN_EVENT_TYPE_SERVICE_WORKER_OVERLOADED_PLANNED,
+    LISTEN_EVENT_TYPE_SERVICE_WORKER_BEST_IDLE_PLANNED,
+    LISTEN_EVENT_TYPE_UNNECESSARY_LOAD_SHEDDING_PLANNED,
+)
+
+
+PLAN_RECORD = 'plan'
+EVENT_RECORD = 'event'
+
+
+def read_trace(trace_path, max_events=None):
+    """
+    Reads a recorded trace: one json record per line, `{"type": "plan"|"event", "time": <seconds>, "event": {...}}`,
+    where the event of a plan record is the event data of a plan event, and the event of an event
+    record is a data event. Records without a time keep the time of the previous record.
+    """
+    n_events = 0
+    with open(trace_path) as trace_file:
+        for line in trace_file:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if record['type'] == EVENT_RECORD:
+                if max_events is not None and n_events >= max_events:
+                    return
+                n_events += 1
+            yield record
+
+
+def adapt_strategy_plan(strategy_plan, strategy_name):
+    """
+    Replaces the strategy of a recorded plan, converting the dataflow entries
+    from/to the `-LS` format (with a zero load shedding rate) if needed.
+    """
+    has_load_shedding = '-LS' in strategy_name
+    dataflows = {}
+    for buffer_stream_key, dataflow_choices in strategy_plan['dataflows'].items():
+        adapted_choices = []
+        for choice in dataflow_choices:
+            if has_load_shedding and len(choice) == 2:
+                choice = [0.0] + list(choice)
+            elif not has_load_shedding and len(choice) == 3:
+                choice = list(choice[1:])
+            adapted_choices.append(choice)
+        dataflows[buffer_stream_key] = adapted_choices
+    return dict(strategy_plan, name=strategy_name, dataflows=dataflows)
+
+
+class SimulatedWorker():
+    """
+    Single server FIFO queue, serving its events at a fixed capacity in events per second.
+    A capacity of zero is an infinite capacity.
+    """
+    __slots__ = ('capacity', 'service_time', 'busy_until', 'busy_time', 'events', 'total_delay', 'max_delay',
+                 'max_backlog')
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.service_time = 1 / capacity if capacity > 0 else 0
+        self.busy_until = 0
+        self.busy_time = 0
+        self.events = 0
+        self.total_delay = 0
+        self.max_delay = 0
+        self.max_backlog = 0
+
+    def process(self, arrival_time):
+        backlog_time = self.busy_until - arrival_time
+        if backlog_time > 0:
+            if self.capacity > 0 and backlog_time * self.capacity > self.max_backlog:
+                self.max_backlog = backlog_time * self.capacity
+            start_time = self.busy_until
+        else:
+            start_time = arrival_time
+        self.busy_until = start_time + self.service_time
+        self.busy_time += self.service_time
+        self.events += 1
+        delay = self.busy_until - arrival_time
+        self.total_delay += delay
+        if delay > self.max_delay:
+            self.max_delay = delay
+        return self.busy_until
+
+    def get_report(self, duration):
+        return {
+            'capacity': self.capacity,
+            'events': self.events,
+            'utilization': self.busy_time / duration if duration > 0 else 0,
+            'mean_delay_ms': self.total_delay / self.events * 1000 if self.events else 0,
+            'max_delay_ms': self.max_delay * 1000,
+            'max_backlog': self.max_backlog,
+        }
+
+
+class SplitTracker():
+    """
+    Compares the split of the routed events over the dataflows to the plan weights,
+    per plan version and bufferstream, as the total variation distance between the two.
+    The routed share the plan expects of each dataflow is its weight without its load shedding rate.
+    """
+
+    def __init__(self):
+        self.routing_tables = {}
+        self.counts = {}
+
+    def record(self, plan_version, buffer_stream_key, routing_table, data_flow):
+        group_key = (plan_version, buffer_stream_key)
+        counts = self.counts.get(group_key)
+        if counts is None:
+            self.routing_tables[group_key] = routing_table
+            counts = {}
+            self.counts[group_key] = counts
+        counts[data_flow.key] = counts.get(data_flow.key, 0) + 1
+
+    def get_split_error(self):
+        total_events = 0
+        weighted_distance = 0
+        for group_key, counts in self.counts.items():
+            routing_table = self.routing_tables[group_key]
+            weights = routing_table.weights
+            if routing_table.load_shedding_rates is not None:
+                weights = [weight * (1 - rate) for weight, rate in zip(weights, routing_table.load_shedding_rates)]
+            total_weight = sum(weights)
+            if total_weight <= 0:
+                continue
+            group_events = sum(counts.values())
+            expected_shares = {}
+            for dataflow, weight in zip(routing_table.dataflows, weights):
+                expected_shares[dataflow.key] = expected_shares.get(dataflow.key, 0) + weight / total_weight
+            distance = sum(
+                abs(counts.get(key, 0) / group_events - expected_shares.get(key, 0))
+                for key in set(expected_shares) | set(counts)
+            ) / 2
+            weighted_distance += distance * group_events
+            total_events += group_events
+        return weighted_distance / total_events if total_events else 0
+
+
+class ReplaySimulation():
+    """
+    Replays a recorded trace through the scheduler plans and strategies (the real ones, from a scheduler
+    service over in-memory streams), and simulates the dataflows of the routed events on workers
+    with fixed capacities: the stages of a dataflow run one after the other, and the destinations
+    of a stage in parallel.
+    """
+
+    def __init__(self, strategy_name=None, capacities=None, default_capacity=0, capacity_scale=1.0):
+        self.strategy_name = strategy_name
+        self.capacities = capacities if capacities is not None else {}
+        self.default_capacity = default_capacity
+        self.capacity_scale = capacity_scale
+        self.service = create_benchmark_service(InMemoryStreamFactory(), {})
+        self.workers = {}
+        self.split_tracker = SplitTracker()
+        self.latency_histogram = LatencyHistogram()
+        self.target_shed_rates = {}
+        self.events = 0
+        self.shed_events = 0
+        self.no_plan_events = 0
+        self.expected_shed_events = 0
+        self.plans = 0
+        self.first_time = None
+        self.last_time = 0
+
+    def get_worker(self, destination):
+        worker = self.workers.get(destination)
+        if worker is None:
+            worker = SimulatedWorker(self.capacities.get(destination, self.default_capacity) * self.capacity_scale)
+            self.workers[destination] = worker
+        return worker
+
+    def get_target_shed_rate(self, routing_table):
+        target_shed_rate = self.target_shed_rates.get(id(routing_table))
+        if target_shed_rate is None:
+            total_weight = sum(routing_table.weights)
+            target_shed_rate = 0
+            if routing_table.load_shedding_rates is not None and total_weight > 0:
+                target_shed_rate = sum(
+                    weight * rate for weight, rate in zip(routing_table.weights, routing_table.load_shedding_rates)
+                ) / total_weight
+            self.target_shed_rates[id(routing_table)] = target_shed_rate
+        return target_shed_rate
+
+    def replay_plan(self, event_data):
+        if self.strategy_name is not None:
+            execution_plan = event_data['plan']['execution_plan']
+            execution_plan['strategy'] = adapt_strategy_plan(execution_plan['strategy'], self.strategy_name)
+        self.service.process_adaptive_plan(event_data)
+        self.target_shed_rates = {}
+        self.plans += 1
+
+    def replay_event(self, event_time, event_data):
+        self.events += 1
+        plan = self.service.current_plan
+        buffer_stream_key = event_data['buffer_stream_key']
+        routing_table = plan.routing_tables.get(buffer_stream_key)
+        if routing_table is None:
+            self.no_plan_events += 1
+            return
+        self.expected_shed_events += self.get_target_shed_rate(routing_table)
+        data_flow = plan.get_event_dataflow(buffer_stream_key, event_data)
+        if data_flow is None:
+            self.shed_events += 1
+            return
+        self.split_tracker.record(plan.version, buffer_stream_key, routing_table, data_flow)
+        stage_time = event_time
+        for stage in data_flow:
+            stage_time = max(self.get_worker(destination).process(stage_time) for destination in stage)
+        self.latency_histogram.record(stage_time - event_time)
+
+    def replay(self, records):
+        for record in records:
+            event_time = record.get('time', self.last_time)
+            if self.first_time is None:
+                self.first_time = event_time
+            self.last_time = event_time
+            if record['type'] == PLAN_RECORD:
+                self.replay_plan(record['event'])
+            elif record['type'] == EVENT_RECORD:
+                self.replay_event(event_time, record['event'])
+
+    def get_report(self):
+        duration = self.last_time - self.first_time if self.first_time is not None else 0
+        routed_events = self.events - self.no_plan_events
+        return {
+            'strategy': self.strategy_name,
+            'capacity_scale': self.capacity_scale,
+            'plans': self.plans,
+            'events': self.events,
+            'duration_s': duration,
+            'no_plan_events': self.no_plan_events,
+            'shed_events': self.shed_events,
+            'shed_fraction': self.shed_events / routed_events if routed_events else 0,
+            'target_shed_fraction': self.expected_shed_events / routed_events if routed_events else 0,
+            'split_error': self.split_tracker.get_split_error(),
+            'latency_p50_us': self.latency_histogram.get_percentile(50),
+            'latency_p99_us': self.latency_histogram.get_percentile(99),
+            'latency_max_us': self.latency_histogram.max_us,
+            'workers': {
+                destination: worker.get_report(duration) for destination, worker in sorted(self.workers.items())
+            },
+        }
+
+
+def run_replay_case(trace_path, strategy_name=None, capacities=None, default_capacity=0, capacity_scale=1.0,
+                    max_events=None, seed=42):
+    random.seed(seed)
+    simulation = ReplaySimulation(
+        strategy_name=strategy_name, capacities=capacities,
+        default_capacity=default_capacity, capacity_scale=capacity_scale
+    )
+    simulation.replay(read_trace(trace_path, max_events=max_events))
+    return simulation.get_report()
+
+
+def run_sweep(trace_path, strategies, capacity_scales, capacities=None, default_capacity=0, max_events=None,
+              seed=42, processes=1):
+    cases = [
+        {
+            'trace_path': trace_path,
+            'strategy_name': strategy_name,
+            'capacities': capacities,
+            'default_capacity': default_capacity,
+            'capacity_scale': capacity_scale,
+            'max_events': max_events,
+            'seed': seed,
+        }
+        for strategy_name, capacity_scale in itertools.product(strategies, capacity_scales)
+    ]
+    if processes <= 1:
+        return [run_replay_case(**case) for case in cases]
+    # each case reads the trace on its own, so the events are never sent between the processes
+    with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as executor:
+        futures = [executor.submit(run_replay_case, **case) for case in cases]
+        return [future.result() for future in futures]
+
+
+def export_redis_trace(redis_db, output_path, data_stream_key, plan_stream_keys, start_id='-', end_id='+',
+                       batch_size=10000):
+    """
+    Writes a trace from the entries still kept in the scheduler data stream and the plan streams,
+    ordered by their entry ids, which also give the time of each record.
+    """
+    stream_records = [(data_stream_key, EVENT_RECORD)] + [(key, PLAN_RECORD) for key in plan_stream_keys]
+
+    def iter_stream(stream_key, record_type):
+        last_id = start_id
+        exclusive = False
+        while True:
+            range_start = f'({last_id}' if exclusive else last_id
+            entries = redis_db.xrange(stream_key, min=range_start, max=end_id, count=batch_size)
+            if not entries:
+                return
+            for entry_id, fields in entries:
+                yield get_entry_id_timestamp_ms(entry_id) / 1000, record_type, fields
+            last_id = entries[-1][0].decode('utf-8') if isinstance(entries[-1][0], bytes) else entries[-1][0]
+            exclusive = True
+
+    # each stream is already ordered by its entry ids
+    merged_records = heapq.merge(
+        *[iter_stream(*stream_record) for stream_record in stream_records], key=lambda record: record[0]
+    )
+    n_records = 0
+    with open(output_path, 'w') as output_file:
+        for record_time, record_type, fields in merged_records:
+            event_json = fields.get(b'event', fields.get('event'))
+            if event_json is None:
+                continue
+            if isinstance(event_json, bytes):
+                event_json = event_json.decode('utf-8')
+            output_file.write(
+                json.dumps({'type': record_type, 'time': record_time, 'event': json.loads(event_json)}) + '\n'
+            )
+            n_records += 1
+    return n_records
+
+
+def parse_capacities(capacities):
+    if not capacities:
+        return {}
+    if capacities.endswith('.json'):
+        with open(capacities) as capacities_file:
+            return json.load(capacities_file)
+    parsed_capacities = {}
+    for capacity in capacities.split(','):
+        destination, rate = capacity.split('=')
+        parsed_capacities[destination] = float(rate)
+    return parsed_capacities
+
+
+def record_main(args):
+    plan_stream_keys = [
+        LISTEN_EVENT_TYPE_NEW_QUERY_SCHEDULING_PLANNED,
+        LISTEN_EVENT_TYPE_SERVICE_WORKER_SLR_PROFILE_PLANNED,
+        LISTEN_EVENT_TYPE_SERVICE_WORKER_OVERLOADED_PLANNED,
+        LISTEN_EVENT_TYPE_SERVICE_WORKER_BEST_IDLE_PLANNED,
+        LISTEN_EVENT_TYPE_UNNECESSARY_LOAD_SHEDDING_PLANNED,
+    ]
+    redis_db = redis.Redis(host=REDIS_ADDRESS, port=REDIS_PORT)
+    n_records = export_redis_trace(
+        redis_db, args.trace, SERVICE_STREAM_KEY, plan_stream_keys, start_id=args.start_id, end_id=args.end_id
+    )
+    print(f'{n_records} records written to {args.trace}')
+
+
+def replay_main(args):
+    strategies = args.strategies.split(',') if args.strategies else [None]
+    capacity_scales = [float(scale) for scale in args.capacity_scales.split(',')]
+    results = run_sweep(
+        args.trace, strategies, capacity_scales,
+        capacities=parse_capacities(args.capacities), default_capacity=args.default_capacity,
+        max_events=args.max_events, seed=args.seed, processes=args.processes
+    )
+    for result in results:
+        strategy_name = result['strategy'] or 'recorded'
+        print(
+            f'{strategy_name} x{result["capacity_scale"]}: {result["events"]} events, '
+            f'shed {result["shed_fraction"]:.3f} (target {result["target_shed_fraction"]:.3f}), '
+            f'split error {result["split_error"]:.3f}, p99 {result["latency_p99_us"] / 1000:.1f}ms'
+        )
+    report = {
+        'created_at': datetime.datetime.utcnow().isoformat(),
+        'python_version': platform.python_version(),
+        'trace': args.trace,
+        'seed': args.seed,
+        'results': results,
+    }
+    with open(args.output, 'w') as output_file:
+        json.dump(report, output_file, indent=2)
+    print(f'Results written to {args.output}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Scheduler trace replay and strategy simulation.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    record_parser = subparsers.add_parser('record', help='export a trace from the redis data and plan streams')
+    record_parser.add_argument('trace')
+    record_parser.add_argument('--start-id', default='-')
+    record_parser.add_argument('--end-id', default='+')
+    record_parser.set_defaults(func=record_main)
+
+    replay_parser = subparsers.add_parser('replay', help='replay a trace through the strategies')
+    replay_parser.add_argument('trace')
+    replay_parser.add_argument(
+        '--strategies', default=None, help='comma separated strategy names, defaults to the recorded plans strategies'
+    )
+    replay_parser.add_argument(
+        '--capacities', default=None,
+        help='worker capacities in events/sec, as "<destination>=<rate>,..." or a json file'
+    )
+    replay_parser.add_argument('--default-capacity', type=float, default=0, help='0 is an infinite capacity')
+    replay_parser.add_argument('--capacity-scales', default='1.0', help='comma separated capacity multipliers')
+    replay_parser.add_argument('--max-events', type=int, default=None)
+    replay_parser.add_argument('--processes', type=int, default=1)
+    replay_parser.add_argument('--seed', type=int, default=42)
+    replay_parser.add_argument('--output', default='replay_output.json')
+    replay_parser.set_defaults(func=replay_main)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
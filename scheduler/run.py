@@ -2,6 +2,7 @@
 from event_service_utils.streams.redis import RedisStreamFactory
 
 from scheduler.service import Scheduler
+from scheduler.workers import PlanBroadcaster, start_data_workers
 
 from scheduler.conf import (
     REDIS_ADDRESS,
@@ -15,14 +16,113 @@ from scheduler.conf import (
     SERVICE_DETAILS,
     REDIS_MAX_STREAM_SIZE,
     DEFAULT_SCHEDULING_STRATEGY,
+    DATA_BATCH_SIZE,
+    DATA_BATCH_MAX_WAIT_MS,
+    OUTPUT_BATCH_SIZE,
+    OUTPUT_MAX_DELAY_MS,
+    DATA_WORKERS,
+    LOAD_SHEDDING_MODE,
+    TRACE_SAMPLING_FORWARDED_RATE,
+    TRACE_SAMPLING_SHED_RATE,
+    TRACE_SAMPLING_NO_PLAN_RATE,
+    METRICS_REPORT_INTERVAL,
+    METRICS_SCRAPE_PORT,
+    EVENT_PASSTHROUGH,
+    BACKLOG_REFRESH_INTERVAL_MS,
+    EMERGENCY_SHEDDING_LAG_WATERMARK,
+    EMERGENCY_SHEDDING_AGE_WATERMARK_MS,
+    EMERGENCY_SHEDDING_MAX_RATE,
+    EMERGENCY_SHEDDING_EXIT_RATIO,
+    EMERGENCY_SHEDDING_CHECK_INTERVAL_MS,
+    STICKY_ROUTING_KEY_FIELD,
+    STICKY_ROUTING_LOAD_FACTOR,
+    STICKY_ROUTING_LOAD_WINDOW,
+    PLAN_SNAPSHOT_PATH,
+    BUFFERSTREAM_STATE_IDLE_TTL_S,
+    BUFFERSTREAM_STATE_CHECK_INTERVAL_S,
+    DEDUP_WINDOW_S,
+    DEDUP_CAPACITY,
+    DEDUP_FALSE_POSITIVE_RATE,
+    FAIR_DISPATCH,
+    RATE_LIMIT_BURST_S,
+    RATE_LIMIT_OVERFLOW,
+    RECLAIM_MIN_IDLE_MS,
+    RECLAIM_MAX_AGE_MS,
+    RECLAIM_INTERVAL_MS,
+    RECLAIM_COUNT,
+    DEADLINE_DEFAULT_BUDGET_MS,
+    DEADLINE_EVENT_TIME_FIELD,
+    SERVICE_RUNTIME,
+    ASYNC_READ_COUNT,
+    ASYNC_READ_BLOCK_MS,
+    ASYNC_READ_CONCURRENCY,
+    ASYNC_WRITE_CONCURRENCY,
+    ASYNC_QUEUE_SIZE,
 )
 
 
-def run_service():
+def build_service():
     tracer_configs = {
         'reporting_host': TRACER_REPORTING_HOST,
         'reporting_port': TRACER_REPORTING_PORT,
     }
+    data_batch_configs = {
+        'size': DATA_BATCH_SIZE,
+        'max_wait_ms': DATA_BATCH_MAX_WAIT_MS,
+    }
+    output_configs = {
+        'batch_size': OUTPUT_BATCH_SIZE,
+        'max_delay_ms': OUTPUT_MAX_DELAY_MS,
+    }
+    trace_sampling_rates = {
+        'forwarded': TRACE_SAMPLING_FORWARDED_RATE,
+        'shed': TRACE_SAMPLING_SHED_RATE,
+        'no_plan': TRACE_SAMPLING_NO_PLAN_RATE,
+    }
+    metrics_configs = {
+        'report_interval': METRICS_REPORT_INTERVAL,
+        'scrape_port': METRICS_SCRAPE_PORT,
+    }
+    backlog_configs = {
+        'refresh_interval_ms': BACKLOG_REFRESH_INTERVAL_MS,
+    }
+    emergency_shedding_configs = {
+        'lag_watermark': EMERGENCY_SHEDDING_LAG_WATERMARK,
+        'age_watermark_ms': EMERGENCY_SHEDDING_AGE_WATERMARK_MS,
+        'max_shedding_rate': EMERGENCY_SHEDDING_MAX_RATE,
+        'exit_ratio': EMERGENCY_SHEDDING_EXIT_RATIO,
+        'check_interval_ms': EMERGENCY_SHEDDING_CHECK_INTERVAL_MS,
+    }
+    sticky_routing_configs = {
+        'routing_key_field': STICKY_ROUTING_KEY_FIELD or None,
+        'load_factor': STICKY_ROUTING_LOAD_FACTOR,
+        'load_window': STICKY_ROUTING_LOAD_WINDOW,
+    }
+    bufferstream_state_configs = {
+        'idle_ttl_s': BUFFERSTREAM_STATE_IDLE_TTL_S,
+        'check_interval_s': BUFFERSTREAM_STATE_CHECK_INTERVAL_S,
+    }
+    dedup_configs = {
+        'window_s': DEDUP_WINDOW_S,
+        'capacity': DEDUP_CAPACITY,
+        'false_positive_rate': DEDUP_FALSE_POSITIVE_RATE,
+    }
+    rate_limit_configs = {
+        'burst_s': RATE_LIMIT_BURST_S,
+        # each data worker process only routes its share of the events
+        'capacity_share': 1 / max(1, DATA_WORKERS),
+        'overflow': RATE_LIMIT_OVERFLOW,
+    }
+    ack_configs = {
+        'reclaim_min_idle_ms': RECLAIM_MIN_IDLE_MS,
+        'reclaim_max_age_ms': RECLAIM_MAX_AGE_MS,
+        'reclaim_interval_ms': RECLAIM_INTERVAL_MS,
+        'reclaim_count': RECLAIM_COUNT,
+    }
+    deadline_configs = {
+        'default_budget_ms': DEADLINE_DEFAULT_BUDGET_MS,
+        'event_time_field': DEADLINE_EVENT_TIME_FIELD or None,
+    }
     stream_factory = RedisStreamFactory(host=REDIS_ADDRESS, port=REDIS_PORT, max_stream_length=REDIS_MAX_STREAM_SIZE)
     service = Scheduler(
         service_stream_key=SERVICE_STREAM_KEY,
@@ -32,9 +132,70 @@ def run_service():
         stream_factory=stream_factory,
         default_scheduling_strategy=DEFAULT_SCHEDULING_STRATEGY,
         logging_level=LOGGING_LEVEL,
-        tracer_configs=tracer_configs
+        tracer_configs=tracer_configs,
+        data_batch_configs=data_batch_configs,
+        output_configs=output_configs,
+        load_shedding_mode=LOAD_SHEDDING_MODE,
+        trace_sampling_rates=trace_sampling_rates,
+        metrics_configs=metrics_configs,
+        event_passthrough=EVENT_PASSTHROUGH,
+        backlog_configs=backlog_configs,
+        emergency_shedding_configs=emergency_shedding_configs,
+        sticky_routing_configs=sticky_routing_configs,
+        plan_snapshot_path=PLAN_SNAPSHOT_PATH or None,
+        bufferstream_state_configs=bufferstream_state_configs,
+        dedup_configs=dedup_configs,
+        fair_dispatch=FAIR_DISPATCH,
+        rate_limit_configs=rate_limit_configs,
+        ack_configs=ack_configs,
+        deadline_configs=deadline_configs,
+    )
+    return service
+
+
+def run_data_worker(worker_index, control_conn):
+    try:
+        service = build_service()
+        service.run_data_worker(worker_index, control_conn)
+    except KeyboardInterrupt:
+        pass
+
+
+def run_async_service(service):
+    redis_configs = {
+        'host': REDIS_ADDRESS,
+        'port': REDIS_PORT,
+    }
+    runtime_configs = {
+        'read_count': ASYNC_READ_COUNT,
+        'read_block_ms': ASYNC_READ_BLOCK_MS,
+        'read_concurrency': ASYNC_READ_CONCURRENCY,
+        'write_concurrency': ASYNC_WRITE_CONCURRENCY,
+        'queue_size': ASYNC_QUEUE_SIZE,
+    }
+    service.run_async(redis_configs, runtime_configs)
+
+
+def run_service():
+    if DATA_WORKERS <= 1:
+        service = build_service()
+        if SERVICE_RUNTIME == 'async':
+            run_async_service(service)
+        else:
+            service.run()
+        return
+
+    processes, control_conns = start_data_workers(run_data_worker, DATA_WORKERS)
+    service = build_service()
+    if SERVICE_RUNTIME == 'async':
+        service.logger.warning(
+            f'SERVICE_RUNTIME=async is not supported with DATA_WORKERS={DATA_WORKERS}, '
+            'the data workers use the threaded runtime instead.'
+        )
+    plan_broadcaster = PlanBroadcaster(
+        control_conns, logger=service.logger, processes=processes, worker_target=run_data_worker
     )
-    service.run()
+    service.run_command_plane(plan_broadcaster)
 
 
 def main():
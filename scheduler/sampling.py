@@ -0,0 +1,46 @@
+import random
+
+
+FORWARDED_EVENT = 'forwarded'
+SHED_EVENT = 'shed'
+NO_PLAN_EVENT = 'no_plan'
+
+ROUTING_CATEGORIES = (FORWARDED_EVENT, SHED_EVENT, NO_PLAN_EVENT)
+
+
+def get_routing_category(data_flow):
+    if data_flow is None:
+        return SHED_EVENT
+    if len(data_flow) == 0:
+        return NO_PLAN_EVENT
+    return FORWARDED_EVENT
+
+
+class TraceSampler():
+    """
+    Head-based trace sampling with an independent rate per routing category.
+    The decision is taken once per event, before any span is created, so the
+    unsampled events skip tracing entirely.
+    """
+
+    def __init__(self, sampling_rates=None):
+        self.sampling_rates = {category: 1.0 for category in ROUTING_CATEGORIES}
+        self.update(sampling_rates)
+
+    def update(self, sampling_rates):
+        if not sampling_rates:
+            return
+        new_sampling_rates = self.sampling_rates.copy()
+        for category, sampling_rate in sampling_rates.items():
+            if category not in new_sampling_rates:
+                continue
+            new_sampling_rates[category] = min(max(float(sampling_rate), 0.0), 1.0)
+        self.sampling_rates = new_sampling_rates
+
+    def is_sampled(self, category):
+        sampling_rate = self.sampling_rates[category]
+        if sampling_rate >= 1.0:
+            return True
+        if sampling_rate <= 0.0:
+            return False
+        return random.random() < sampling_rate
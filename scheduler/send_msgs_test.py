@@ -7,7 +7,7 @@ from scheduler.conf import (
     REDIS_ADDRESS,
     REDIS_PORT,
     SERVICE_STREAM_KEY,
-    SERVICE_CMD_KEY,
+    LISTEN_EVENT_TYPE_NEW_QUERY_SCHEDULING_PLANNED,
 )
 
 
@@ -15,17 +15,26 @@ def make_dict_key_bites(d):
     return {k.encode('utf-8'): v for k, v in d.items()}
 
 
-def new_action_msg(action, event_data):
-    event_data['action'] = action
+def new_msg(event_data):
     event_data.update({'id': str(uuid.uuid4())})
     return {'event': json.dumps(event_data)}
 
 
 def send_action_msgs(service_cmd):
-    msg_1 = new_action_msg(
-        'executeAdaptivePlan',
+    msg_1 = new_msg(
         {
-            'dataflow': {'f32c1d9e6352644a5894305ecb478b0d': ['od-data', 'ed-data', 'wm-data']}
+            'plan': {
+                'execution_plan': {
+                    'strategy': {
+                        'name': 'QQoS-W-HP',
+                        'dataflows': {
+                            'f32c1d9e6352644a5894305ecb478b0d': [
+                                [1.0, [['od-data'], ['ed-data'], ['wm-data']]]
+                            ]
+                        }
+                    }
+                }
+            }
         }
     )
     # msg_2 = new_action_msg(
@@ -57,9 +66,8 @@ def send_data_msg(service_stream):
 
 def main():
     stream_factory = RedisStreamFactory(host=REDIS_ADDRESS, port=REDIS_PORT)
-    service_cmd = stream_factory.create(SERVICE_CMD_KEY, stype='streamOnly')
+    service_cmd = stream_factory.create(LISTEN_EVENT_TYPE_NEW_QUERY_SCHEDULING_PLANNED, stype='streamOnly')
     service_stream = stream_factory.create(SERVICE_STREAM_KEY, stype='streamOnly')
-    import ipdb; ipdb.set_trace()
     send_action_msgs(service_cmd)
     send_data_msg(service_stream)
 
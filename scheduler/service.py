@@ -1,15 +1,37 @@
-import functools
 import random
 import threading
+import time
 
 from event_service_utils.logging.decorators import timer_logger
 from event_service_utils.services.event_driven import BaseEventDrivenCMDService, tags, EVENT_ID_TAG
 from event_service_utils.tracing.jaeger import init_tracer
 
+from .acks import DataStreamAcker, PendingEntryReclaimer
+from .async_runtime import run_async_runtime
+from .backlog import DestinationBacklogView
+from .deadline import DeadlineChecker
+from .dedup import DuplicateFilter
+from .dispatch import FairDispatcher
+from .emergency import EmergencyShedder, EMERGENCY_SHEDDING_STARTED
+from .metrics import SchedulerMetrics, start_metrics_scrape_endpoint
+from .output import DestinationStreamPool, GroupedOutputStage
+from .passthrough import PassthroughEncoder, PassthroughEvent, extract_passthrough_event
+from .plan import PlanSnapshot
+from .ratelimit import DestinationRateLimiter
+from .sampling import TraceSampler, get_routing_category
+from .snapshot import PlanSnapshotStore
+from .strategies.state import BufferstreamStateStore
+from .workers import PlanReceiver
+from .strategies.dataflow import DataflowRegistry
+from .strategies.load_shedding import LOAD_SHEDDERS
+from .strategies.routing_table import RoutingTable
 from .strategies.weighted_rand import WeightedRandomStrategy
 from .strategies.single_best_dataflow import SingleBestStrategy
 from .strategies.round_robin import RoundRobinStrategy
+from .strategies.smooth_weighted_round_robin import SmoothWeightedRoundRobinStrategy
+from .strategies.consistent_hash import ConsistentHashStrategy
 from .strategies.random import RandomStrategy
+from .strategies.power_of_two_choices import PowerOfTwoChoicesStrategy
 
 from .conf import (
     LISTEN_EVENT_TYPE_NEW_QUERY_SCHEDULING_PLANNED,
@@ -18,9 +40,15 @@ from .conf import (
     LISTEN_EVENT_TYPE_SERVICE_WORKER_BEST_IDLE_PLANNED,
     LISTEN_EVENT_TYPE_UNNECESSARY_LOAD_SHEDDING_PLANNED,
     PUB_EVENT_TYPE_SCHEDULING_PLAN_EXECUTED,
+    PUB_EVENT_TYPE_SCHEDULER_STATS_REPORTED,
+    PUB_EVENT_TYPE_SCHEDULER_EMERGENCY_SHEDDING_STARTED,
+    PUB_EVENT_TYPE_SCHEDULER_EMERGENCY_SHEDDING_STOPPED,
 )
 
 
+ROUTING_CATEGORY_TAG = 'routing-category'
+
+
 class Scheduler(BaseEventDrivenCMDService):
     def __init__(self,
                  service_stream_key, service_cmd_key_list,
@@ -28,7 +56,23 @@ class Scheduler(BaseEventDrivenCMDService):
                  stream_factory,
                  default_scheduling_strategy,
                  logging_level,
-                 tracer_configs):
+                 tracer_configs,
+                 data_batch_configs=None,
+                 output_configs=None,
+                 load_shedding_mode='random',
+                 trace_sampling_rates=None,
+                 metrics_configs=None,
+                 event_passthrough=False,
+                 backlog_configs=None,
+                 emergency_shedding_configs=None,
+                 sticky_routing_configs=None,
+                 plan_snapshot_path=None,
+                 bufferstream_state_configs=None,
+                 dedup_configs=None,
+                 fair_dispatch=False,
+                 rate_limit_configs=None,
+                 ack_configs=None,
+                 deadline_configs=None):
         tracer = init_tracer(self.__class__.__name__, **tracer_configs)
         super(Scheduler, self).__init__(
             name=self.__class__.__name__,
@@ -43,65 +87,548 @@ class Scheduler(BaseEventDrivenCMDService):
         self.cmd_validation_fields = ['id']
         self.data_validation_fields = ['id', 'buffer_stream_key']
 
+        self.plan_broadcaster = None
         self.bufferstream_to_dataflow = {
             # 'f32c1d9e6352644a5894305ecb478b0d': [['object-detection-data'], ['wm-data']]
         }
+        self.load_shedding_mode = load_shedding_mode
+        self.trace_sampler = TraceSampler(trace_sampling_rates)
+        self.event_passthrough = event_passthrough
+        self.passthrough_encoder = PassthroughEncoder()
+        self.setup_metrics(metrics_configs)
+        self.setup_destination_backlogs(backlog_configs)
+        if sticky_routing_configs is None:
+            sticky_routing_configs = {}
+        self.sticky_routing_configs = sticky_routing_configs
+        self.setup_bufferstream_states(bufferstream_state_configs)
         self.setup_scheduling_strategies(default_scheduling_strategy)
+        self.setup_data_batching(data_batch_configs)
+        self.setup_output_stage(output_configs)
+        self.setup_emergency_shedding(emergency_shedding_configs)
+        self.setup_dedup(dedup_configs)
+        self.setup_fair_dispatch(fair_dispatch)
+        self.setup_rate_limiting(rate_limit_configs)
+        self.setup_data_acks(ack_configs)
+        self.setup_deadlines(deadline_configs)
+        self.setup_plan_snapshot(plan_snapshot_path)
+
+    def setup_bufferstream_states(self, bufferstream_state_configs):
+        if bufferstream_state_configs is None:
+            bufferstream_state_configs = {}
+        # per bufferstream selection state of all the strategies and of the plan load shedder,
+        # retired with the bufferstreams that leave the plan and evicted when idle
+        self.bufferstream_states = BufferstreamStateStore(**bufferstream_state_configs)
 
     def setup_scheduling_strategies(self, default_scheduling_strategy):
+        states = self.bufferstream_states
+        # shared by all the strategies with load shedding plans, so the shedding pace
+        # of a bufferstream is kept when switching between them
+        self.load_shedder = LOAD_SHEDDERS[self.load_shedding_mode](state_store=states)
+        # all the strategies intern their dataflows in the same registry, so equal dataflows
+        # from different plans and strategies are the same object
+        self.dataflow_registry = DataflowRegistry()
+        registry = self.dataflow_registry
         self.scheduling_strategies = {
-            'QQoS-W-HP': WeightedRandomStrategy(self),
-            'QQoS-W-HP-LS': WeightedRandomStrategy(self),
-            'random': RandomStrategy(self),
-            'QQoS-TK-LP': SingleBestStrategy(self),
-            'QQoS-TK-LP-LS': SingleBestStrategy(self),
-            'round_robin': RoundRobinStrategy(self),
+            'QQoS-W-HP': WeightedRandomStrategy(self, dataflow_registry=registry, state_store=states),
+            'QQoS-W-HP-LS': WeightedRandomStrategy(
+                self, load_shedder=self.load_shedder, dataflow_registry=registry, state_store=states
+            ),
+            'random': RandomStrategy(self, dataflow_registry=registry, state_store=states),
+            'QQoS-TK-LP': SingleBestStrategy(self, dataflow_registry=registry, state_store=states),
+            'QQoS-TK-LP-LS': SingleBestStrategy(
+                self, load_shedder=self.load_shedder, dataflow_registry=registry, state_store=states
+            ),
+            'round_robin': RoundRobinStrategy(self, dataflow_registry=registry, state_store=states),
+            'smooth_weighted_round_robin': SmoothWeightedRoundRobinStrategy(
+                self, dataflow_registry=registry, state_store=states
+            ),
+            'smooth_weighted_round_robin-LS': SmoothWeightedRoundRobinStrategy(
+                self, load_shedder=self.load_shedder, dataflow_registry=registry, state_store=states
+            ),
+            'power_of_two_choices': PowerOfTwoChoicesStrategy(
+                self, self.destination_backlogs, dataflow_registry=registry, state_store=states
+            ),
+            'power_of_two_choices-LS': PowerOfTwoChoicesStrategy(
+                self, self.destination_backlogs, load_shedder=self.load_shedder, dataflow_registry=registry,
+                state_store=states
+            ),
+            'consistent_hash': ConsistentHashStrategy(
+                self, dataflow_registry=registry, state_store=states, **self.sticky_routing_configs
+            ),
+            'consistent_hash-LS': ConsistentHashStrategy(
+                self, load_shedder=self.load_shedder, dataflow_registry=registry, state_store=states,
+                **self.sticky_routing_configs
+            ),
+        }
+        if default_scheduling_strategy not in self.scheduling_strategies:
+            self.logger.warning(
+                f'No strategy named "{default_scheduling_strategy}" available, using "QQoS-W-HP" as default strategy.'
+            )
+            default_scheduling_strategy = 'QQoS-W-HP'
+        self.current_plan = PlanSnapshot(
+            version=0,
+            strategy_name=default_scheduling_strategy,
+            strategy=self.scheduling_strategies[default_scheduling_strategy],
+            routing_tables={}
+        )
+        self.last_plan_version = 0
+
+    @property
+    def current_strategy(self):
+        return self.current_plan.strategy
+
+    def setup_destination_backlogs(self, backlog_configs):
+        if backlog_configs is None:
+            backlog_configs = {}
+        self.destination_backlogs = DestinationBacklogView(
+            self.get_destination_streams,
+            refresh_interval_ms=backlog_configs.get('refresh_interval_ms', 500),
+            logger=self.logger
+        )
+
+    def setup_metrics(self, metrics_configs):
+        if metrics_configs is None:
+            metrics_configs = {}
+        self.metrics = SchedulerMetrics()
+        self.metrics_report_interval = metrics_configs.get('report_interval', 0)
+        self.metrics_scrape_port = metrics_configs.get('scrape_port', 0)
+        self.metrics_worker_index = None
+
+    def setup_data_batching(self, data_batch_configs):
+        if data_batch_configs is None:
+            data_batch_configs = {}
+        self.data_batch_size = data_batch_configs.get('size', 1)
+        self.data_batch_max_wait_ms = data_batch_configs.get('max_wait_ms', 0)
+        if self.data_batch_size > 1 and self.data_batch_max_wait_ms > 0:
+            # bounds how long a batch read blocks waiting for more entries on the service stream
+            self.limit_data_read_block(self.data_batch_max_wait_ms)
+
+    def setup_output_stage(self, output_configs):
+        if output_configs is None:
+            output_configs = {}
+        self.destination_streams = DestinationStreamPool(self.stream_factory)
+        self.plan_warm_up_ms = 0
+        self.output_stage = None
+        output_batch_size = output_configs.get('batch_size', 1)
+        output_max_delay_ms = output_configs.get('max_delay_ms', 0)
+        if output_batch_size > 1:
+            self.output_stage = GroupedOutputStage(
+                max_batch_size=output_batch_size, max_delay_ms=output_max_delay_ms, logger=self.logger
+            )
+            if output_max_delay_ms > 0:
+                # the data loop needs to wake up in time to flush pending events on their deadline
+                self.limit_data_read_block(output_max_delay_ms)
+
+    def setup_plan_snapshot(self, plan_snapshot_path):
+        self.plan_snapshot_store = None
+        if plan_snapshot_path:
+            self.plan_snapshot_store = PlanSnapshotStore(plan_snapshot_path, self.logger)
+            # before any data loop starts, so the events are routed with the last plan right away
+            self.restore_plan_snapshot()
+
+    def restore_plan_snapshot(self):
+        try:
+            snapshot = self.plan_snapshot_store.load()
+        except Exception as e:
+            self.logger.error(f'Error loading plan snapshot from {self.plan_snapshot_store.path}:')
+            self.logger.exception(e)
+            return
+        if snapshot is None:
+            return
+        strategy = self.scheduling_strategies.get(snapshot['strategy_name'])
+        if strategy is None:
+            self.logger.error(f'No strategy named "{snapshot["strategy_name"]}" available for the plan snapshot.')
+            return
+        routing_tables = {
+            buffer_stream_key: RoutingTable.from_snapshot(routing_table, dataflow_registry=self.dataflow_registry)
+            for buffer_stream_key, routing_table in snapshot['routing_tables'].items()
         }
-        default_scheduling_strategy = 'QQoS-W-HP'
-        self.current_strategy = self.scheduling_strategies[default_scheduling_strategy]
+        plan = PlanSnapshot(
+            version=snapshot['version'],
+            strategy_name=snapshot['strategy_name'],
+            strategy=strategy,
+            routing_tables=routing_tables,
+            options=snapshot['options']
+        )
+        self.install_compiled_plan(plan, self.warm_up_plan(plan))
+        strategy.set_state(snapshot['strategy_state'])
+        self.logger.info(f'Restored plan snapshot: {plan}')
+
+    def save_plan_snapshot(self, plan):
+        if self.plan_snapshot_store is None:
+            return
+        try:
+            self.plan_snapshot_store.save(plan, plan.strategy.get_state())
+        except Exception as e:
+            self.logger.error(f'Error saving plan snapshot to {self.plan_snapshot_store.path}:')
+            self.logger.exception(e)
+
+    def setup_emergency_shedding(self, emergency_shedding_configs):
+        if emergency_shedding_configs is None:
+            emergency_shedding_configs = {}
+        # its own shedder and states, so it does not share the uniform shedding pace of the plan load shedding
+        self.emergency_bufferstream_states = BufferstreamStateStore(
+            idle_ttl_s=self.bufferstream_states.idle_ttl, check_interval_s=self.bufferstream_states.check_interval
+        )
+        self.emergency_shedder = EmergencyShedder(
+            self.service_stream,
+            LOAD_SHEDDERS[self.load_shedding_mode](state_store=self.emergency_bufferstream_states),
+            lag_watermark=emergency_shedding_configs.get('lag_watermark', 0),
+            age_watermark_ms=emergency_shedding_configs.get('age_watermark_ms', 0),
+            max_shedding_rate=emergency_shedding_configs.get('max_shedding_rate', 0.9),
+            exit_ratio=emergency_shedding_configs.get('exit_ratio', 0.8),
+            check_interval_ms=emergency_shedding_configs.get('check_interval_ms', 500),
+            logger=self.logger
+        )
+        if self.emergency_shedder.enabled:
+            # the data loop needs to wake up to check if it can stop shedding
+            self.limit_data_read_block(emergency_shedding_configs.get('check_interval_ms', 500))
+
+    def setup_dedup(self, dedup_configs):
+        if dedup_configs is None:
+            dedup_configs = {}
+        self.duplicate_filter = None
+        if dedup_configs.get('window_s', 0) > 0:
+            self.duplicate_filter = DuplicateFilter(
+                window_s=dedup_configs['window_s'],
+                capacity=dedup_configs.get('capacity', 100000),
+                false_positive_rate=dedup_configs.get('false_positive_rate', 0.001),
+            )
+
+    def setup_fair_dispatch(self, fair_dispatch):
+        self.fair_dispatcher = None
+        if fair_dispatch:
+            self.fair_dispatcher = FairDispatcher(self.bufferstream_states)
+            if self.data_batch_size <= 1:
+                self.logger.warning('Fair dispatch works on the events of a batch read, but DATA_BATCH_SIZE is 1.')
+
+    def setup_rate_limiting(self, rate_limit_configs):
+        if rate_limit_configs is None:
+            rate_limit_configs = {}
+        # only enforced for the destinations with a capacity in the current plan
+        self.rate_limiter = DestinationRateLimiter(**rate_limit_configs)
+
+    def setup_data_acks(self, ack_configs):
+        if ack_configs is None:
+            ack_configs = {}
+        self.data_acker = DataStreamAcker(self.service_stream)
+        # read entries are only acked once their outgoing events are written
+        self.unacked_event_ids = []
+        self.has_failed_writes = False
+        self.data_consumer_name = None
+        self.pending_reclaimer = None
+        if ack_configs.get('reclaim_min_idle_ms', 0) > 0:
+            self.pending_reclaimer = PendingEntryReclaimer(
+                self.service_stream,
+                min_idle_ms=ack_configs['reclaim_min_idle_ms'],
+                max_age_ms=ack_configs.get('reclaim_max_age_ms', 0),
+                interval_ms=ack_configs.get('reclaim_interval_ms', 5000),
+                count=ack_configs.get('reclaim_count', 100),
+                logger=self.logger
+            )
+
+    def setup_deadlines(self, deadline_configs):
+        if deadline_configs is None:
+            deadline_configs = {}
+        self.deadline_checker = DeadlineChecker(
+            default_budget_ms=deadline_configs.get('default_budget_ms', 0),
+            event_time_field=deadline_configs.get('event_time_field'),
+        )
+
+    def limit_data_read_block(self, block_ms):
+        current_block_ms = getattr(self.service_stream, 'block', 0)
+        if not current_block_ms or block_ms < current_block_ms:
+            self.service_stream.block = block_ms
 
     def publish_scheduling_plan_executed(self, adaptive_plan):
         event_type = PUB_EVENT_TYPE_SCHEDULING_PLAN_EXECUTED
         new_event_data = {
             'id': self.service_based_random_event_id(),
-            'plan': adaptive_plan
+            'plan': adaptive_plan,
+            'plan_version': self.current_plan.version,
+            'warm_up_ms': self.plan_warm_up_ms,
+        }
+        self.publish_event_type_to_stream(event_type=event_type, new_event_data=new_event_data)
+
+    def publish_scheduler_stats_reported(self):
+        event_type = PUB_EVENT_TYPE_SCHEDULER_STATS_REPORTED
+        new_event_data = {
+            'id': self.service_based_random_event_id(),
+            'plan_version': self.current_plan.version,
+            'stats': self.metrics.get_stats(),
+        }
+        if self.metrics_worker_index is not None:
+            new_event_data['worker'] = self.metrics_worker_index
+        self.publish_event_type_to_stream(event_type=event_type, new_event_data=new_event_data)
+
+    def publish_emergency_shedding_changed(self, transition):
+        if transition == EMERGENCY_SHEDDING_STARTED:
+            event_type = PUB_EVENT_TYPE_SCHEDULER_EMERGENCY_SHEDDING_STARTED
+        else:
+            event_type = PUB_EVENT_TYPE_SCHEDULER_EMERGENCY_SHEDDING_STOPPED
+        new_event_data = {
+            'id': self.service_based_random_event_id(),
+            'plan_version': self.current_plan.version,
+            'emergency_shedding': self.emergency_shedder.get_state(),
         }
         self.publish_event_type_to_stream(event_type=event_type, new_event_data=new_event_data)
 
-    def execute_adaptive_plan(self, strategy_data):
+    def update_emergency_shedding(self, event_list):
+        emergency_shedder = self.emergency_shedder
+        if event_list:
+            emergency_shedder.record_oldest_event_id(event_list[0][0])
+        if not emergency_shedder.is_check_due():
+            return
+        transition = emergency_shedder.check()
+        if transition is not None:
+            self.logger.warning(f'Emergency load shedding {transition}: {emergency_shedder.get_state()}')
+            self.publish_emergency_shedding_changed(transition)
+
+    def apply_emergency_shedding(self, buffer_stream_key, data_flow):
+        # on top of the current strategy, only events that would be forwarded can be shed
+        if data_flow and self.emergency_shedder.is_shedding_event(buffer_stream_key):
+            return None
+        return data_flow
+
+    def is_duplicate_event(self, buffer_stream_key, event_id):
+        if event_id is None or not self.duplicate_filter.is_duplicate(event_id):
+            return False
+        self.logger.debug(f'[Duplicate] dropping event "{event_id}" from bufferstream "{buffer_stream_key}"')
+        self.metrics.record_duplicate_event(buffer_stream_key)
+        return True
+
+    def is_expired_event(self, buffer_stream_key, event_id, event, now_ms):
+        if buffer_stream_key is None:
+            return False
+        wait_ms = self.deadline_checker.get_event_wait_ms(buffer_stream_key, event_id, event, now_ms)
+        if wait_ms is None:
+            return False
+        self.logger.debug(
+            f'[Expired] dropping event "{event_id}" from bufferstream "{buffer_stream_key}" after {wait_ms:.0f}ms'
+        )
+        self.metrics.record_expired_event(buffer_stream_key)
+        return True
+
+    def is_backlog_refresh_due(self):
+        backlog_view = getattr(self.current_strategy, 'backlog_view', None)
+        return backlog_view is not None and backlog_view.is_refresh_due()
+
+    def refresh_destination_backlogs(self):
+        # blocking XINFO GROUPS round trips, kept out of the per-event dataflow selection
+        self.current_strategy.backlog_view.refresh()
+
+    def sync_deadline_clock(self):
+        self.deadline_checker.clock_synced_at = time.monotonic()
+        redis_db = getattr(self.service_stream, 'redis_db', None)
+        if redis_db is None:
+            return
+        try:
+            request_time_ms = time.time() * 1000
+            redis_time = redis_db.time()
+            # the server time is taken about halfway through the round trip
+            self.deadline_checker.sync_clock(redis_time, (request_time_ms + time.time() * 1000) / 2)
+        except Exception as e:
+            self.logger.error('Error reading the Redis server time for the latency budgets:')
+            self.logger.exception(e)
+
+    def throttle_dataflow(self, plan, buffer_stream_key, data_flow):
+        if not data_flow:
+            return data_flow
+        routing_table = plan.routing_tables.get(buffer_stream_key)
+        data_flow, blocking_destination = self.rate_limiter.limit(routing_table, data_flow, time.monotonic())
+        if blocking_destination is not None:
+            self.metrics.record_throttled_event(blocking_destination, is_redirected=data_flow is not None)
+        return data_flow
+
+    def report_metrics(self):
+        time.sleep(self.metrics_report_interval)
+        try:
+            self.publish_scheduler_stats_reported()
+        except Exception as e:
+            self.logger.error('Error reporting scheduler stats:')
+            self.logger.exception(e)
+
+    def start_metrics_reporting(self, worker_index=None):
+        metrics_service_name = self.name
+        metrics_scrape_port = self.metrics_scrape_port
+        if worker_index is not None:
+            # a data worker only has the stats of the events it routed, reported under its own label and port
+            self.metrics_worker_index = worker_index
+            metrics_service_name = f'{self.name}-worker-{worker_index}'
+            if metrics_scrape_port > 0:
+                metrics_scrape_port += worker_index
+        if metrics_scrape_port > 0:
+            start_metrics_scrape_endpoint(self.metrics, metrics_service_name, metrics_scrape_port)
+        if self.metrics_report_interval > 0:
+            self.metrics_thread = threading.Thread(
+                target=self.run_forever, args=(self.report_metrics,), daemon=True
+            )
+            self.metrics_thread.start()
+
+    def execute_adaptive_plan(self, strategy_data, plan_options=None):
         strategy_name = strategy_data['name']
         strategy = self.scheduling_strategies.get(strategy_name)
         if strategy is None:
             self.logger.error(f'No strategy named "{strategy_name}" available that meets adaptive plan.')
             self.logger.error(f'Will ignore new stragegy plan.')
             return
-        self.current_strategy = strategy
-        self.current_strategy.update(strategy_data)
+        # compiled without touching the live strategy, its tables are only installed once the plan is committed
+        routing_tables = strategy.compile_routing_tables(strategy_data)
+        # each attempt takes a new version, so a plan aborted by the data workers never shares it with the next one
+        self.last_plan_version = max(self.last_plan_version, self.current_plan.version) + 1
+        plan = PlanSnapshot(
+            version=self.last_plan_version,
+            strategy_name=strategy_name,
+            strategy=strategy,
+            routing_tables=routing_tables,
+            options=plan_options
+        )
+        destination_streams = self.warm_up_plan(plan)
+        if self.plan_broadcaster is not None:
+            self.broadcast_compiled_plan(plan)
+        self.install_compiled_plan(plan, destination_streams)
+        self.save_plan_snapshot(plan)
+
+    def broadcast_compiled_plan(self, plan):
+        if not self.plan_broadcaster.broadcast(plan):
+            raise RuntimeError(
+                f'Plan version {plan.version} for strategy "{plan.strategy_name}" was not staged by all data workers,'
+                ' aborted it.'
+            )
+
+    def warm_up_plan(self, plan, timeout_s=None):
+        start_time = time.perf_counter()
+        destination_streams, failed_destinations = self.destination_streams.warm_up(
+            plan.get_first_hop_destinations(), timeout_s
+        )
+        self.plan_warm_up_ms = (time.perf_counter() - start_time) * 1000
+        for destination, error in failed_destinations.items():
+            self.logger.warning(
+                f'Could not warm up destination "{destination}" for plan version {plan.version}: {error}'
+            )
+        self.logger.debug(f'Plan version {plan.version} warmed up in {self.plan_warm_up_ms:.2f}ms')
+        return destination_streams
+
+    def install_compiled_plan(self, plan, destination_streams=None):
+        previous_strategy = self.current_plan.strategy
+        if previous_strategy is not plan.strategy:
+            previous_strategy.release_routing_tables()
+        plan.strategy.install_routing_tables(plan.routing_tables)
+        self.trace_sampler.update(plan.options.get('trace_sampling'))
+        if self.fair_dispatcher is not None:
+            self.fair_dispatcher.update_weights(plan.options.get('bufferstream_weights'))
+        self.rate_limiter.update(plan.options.get('destination_capacities'), time.monotonic())
+        self.deadline_checker.update_budgets(plan.options.get('latency_budgets_ms'))
+        self.metrics.register_plan(plan)
+        unavailable_codecs = self.passthrough_encoder.register_plan(plan)
+        if unavailable_codecs:
+            self.logger.warning(
+                f'Codecs not available, sending json to these destinations instead: {unavailable_codecs}'
+            )
+        # single reference swap, the data path only ever reads the plan through `self.current_plan`
+        self.current_plan = plan
+        if destination_streams is None:
+            retired_destinations = self.destination_streams.retain(plan.get_first_hop_destinations())
+        else:
+            retired_destinations = self.destination_streams.install(
+                destination_streams, plan.get_first_hop_destinations()
+            )
+        if retired_destinations:
+            self.logger.debug(f'Retired destination streams: {retired_destinations}')
+        self.dataflow_registry.retain(plan.get_dataflows())
+        retired_count = self.bufferstream_states.retain(plan.routing_tables.keys())
+        retired_count += self.emergency_bufferstream_states.retain(plan.routing_tables.keys())
+        if retired_count:
+            self.logger.debug(f'Retired {retired_count} bufferstream states')
+
+    def evict_idle_bufferstream_states(self):
+        evicted_count = self.bufferstream_states.evict_idle_if_due()
+        evicted_count += self.emergency_bufferstream_states.evict_idle_if_due()
+        if evicted_count:
+            self.logger.debug(f'Evicted {evicted_count} idle bufferstream states')
 
-    @functools.lru_cache(maxsize=5)
     def get_destination_streams(self, destination):
-        return self.stream_factory.create(destination, stype='streamOnly')
+        return self.destination_streams.get(destination)
+
+    def serialize_and_buffer_event_with_trace(self, event_data, serializer, destination_stream):
+        event_data = self.inject_current_tracer_into_event_data(event_data)
+        self.output_stage.add(destination_stream, serializer(event_data))
+
+    def buffer_event_with_trace(self, event_data, destination_stream, serializer=None):
+        if serializer is None:
+            serializer = self.default_event_serializer
+        self.event_trace_for_method_with_event_data(
+            method=self.serialize_and_buffer_event_with_trace,
+            method_args=(),
+            method_kwargs={
+                'event_data': event_data,
+                'serializer': serializer,
+                'destination_stream': destination_stream
+            },
+            get_event_tracer=False,
+            tracer_tags={
+                tags.MESSAGE_BUS_DESTINATION: destination_stream.key,
+                tags.SPAN_KIND: tags.SPAN_KIND_PRODUCER,
+                EVENT_ID_TAG: event_data['id'],
+            }
+        )
 
-    def send_event_to_first_service_in_dataflow(self, event_data):
+    def write_event_without_trace(self, event_data, destination_stream, serializer=None):
+        # keeps the tracer headers the event already carries, so downstream spans still
+        # link to the upstream trace when this service does not sample the event
+        if serializer is None:
+            serializer = self.default_event_serializer
+        self.write_event_msg(serializer(event_data), destination_stream)
+
+    def send_event_to_first_service_in_dataflow(self, event_data, is_traced=True):
         event_dataflow = event_data.get('data_flow', [[]])
-        next_destinations = event_dataflow[0] if len(event_dataflow) != 0 else []
+        next_destinations = getattr(event_dataflow, 'first_hop_destinations', None)
+        if next_destinations is None:
+            next_destinations = event_dataflow[0] if len(event_dataflow) != 0 else []
         for destination in next_destinations:
-            self.logger.debug(f'Sending event to "{destination}": {event_data}')
+            # lazy log formatting, so the whole event is only formatted when debugging
+            self.logger.debug('Sending event to "%s": %s', destination, event_data)
+            self.metrics.record_destination_event(destination)
             destination_stream = self.get_destination_streams(destination)
-            self.write_event_with_trace(event_data, destination_stream)
+            serializer = self.passthrough_encoder.get_stream_serializer(destination)
+            if not is_traced:
+                self.write_event_without_trace(event_data, destination_stream, serializer)
+            elif self.output_stage is not None:
+                self.buffer_event_with_trace(event_data, destination_stream, serializer)
+            else:
+                self.write_data_event_with_trace(event_data, destination_stream, serializer)
+
+    def write_data_event_with_trace(self, event_data, destination_stream, serializer=None):
+        # only the data events writes hold back the acks, the published events are written directly
+        try:
+            self.write_event_with_trace(event_data, destination_stream, serializer)
+        except Exception:
+            self.has_failed_writes = True
+            raise
 
     def get_random_buffer_stream_dataflow(self):
         return random.choice(self._random_bufferstream_to_dataflow)
 
     def get_bufferstream_dataflow(self, buffer_stream_key):
-        return self.current_strategy.get_bufferstream_dataflow(buffer_stream_key)
+        return self.current_plan.get_bufferstream_dataflow(buffer_stream_key)
+
+    def get_bufferstream_dataflows(self, buffer_stream_key, n):
+        return self.current_plan.get_bufferstream_dataflows(buffer_stream_key, n)
 
     def apply_dataflow_to_event(self, event_data):
+        plan = self.current_plan
+        buffer_stream_key = event_data['buffer_stream_key']
+        data_flow = plan.get_event_dataflow(buffer_stream_key, event_data)
+        return self.apply_selected_dataflow_to_event(event_data, data_flow, plan.version)
+
+    def apply_selected_dataflow_to_event(self, event_data, data_flow, plan_version, is_traced=True):
         buffer_stream_key = event_data['buffer_stream_key']
-        data_flow = self.get_bufferstream_dataflow(buffer_stream_key)
 
         # if is load shedding
-        if data_flow is None:
+        if data_flow is None and not is_traced:
+            self.log_event_load_shedding(event_data)
+            return None
+        elif data_flow is None:
             self.event_trace_for_method_with_event_data(
                 method=self.log_event_load_shedding,
                 method_args=(),
@@ -122,28 +649,320 @@ class Scheduler(BaseEventDrivenCMDService):
             event_data.update({
                 'data_flow': data_flow,
                 'data_path': [],
+                'plan_version': plan_version,
             })
         else:
-            self.logger.warning(f'Event data wihout a known buffer stream dataflow plan: {event_data}. Ignoring event.')
+            self.logger.warning(
+                'Event data wihout a known buffer stream dataflow plan: %s. Ignoring event.', event_data
+            )
             return None
         return event_data
 
     def log_event_load_shedding(self, event_data):
-        self.logger.debug(f'[Load shedding] dropping event: {event_data}')
+        self.logger.debug('[Load shedding] dropping event: %s', event_data)
 
-    @timer_logger
-    def process_data_event(self, event_data, json_msg):
-        if not super(Scheduler, self).process_data_event(event_data, json_msg):
+    def process_data_event_wrapper(self, event_data, json_msg, event_id=None, now_ms=None):
+        # the consumer span is only opened once the event routing category is known,
+        # and only for the sampled events, see `route_data_event_wrapper`
+        self.process_data_event(event_data, json_msg, event_id, now_ms)
+
+    def process_data_event(self, event_data, json_msg, event_id=None, now_ms=None):
+        # same validation as the base service, but without its debug log of the whole event on every call
+        if not self.event_validation_fields(event_data, self.data_validation_fields):
+            self.logger.info(f'Ignoring bad event data: {event_data}')
+            return False
+        buffer_stream_key = event_data['buffer_stream_key']
+        if self.duplicate_filter is not None and self.is_duplicate_event(buffer_stream_key, event_data['id']):
             return False
-        new_event_data = self.apply_dataflow_to_event(event_data)
+        if self.deadline_checker.is_active:
+            if now_ms is None:
+                now_ms = time.time() * 1000
+            if self.is_expired_event(buffer_stream_key, event_id, event_data, now_ms):
+                return False
+        routing_start_time = time.perf_counter()
+        plan = self.current_plan
+        data_flow = plan.get_event_dataflow(buffer_stream_key, event_data)
+        if self.emergency_shedder.is_active:
+            data_flow = self.apply_emergency_shedding(buffer_stream_key, data_flow)
+        if self.rate_limiter.buckets:
+            data_flow = self.throttle_dataflow(plan, buffer_stream_key, data_flow)
+        self.route_data_event_wrapper(event_data, data_flow, plan.version, routing_start_time)
+
+    def route_data_event(self, event_data, data_flow, plan_version, is_traced=True, routing_start_time=None):
+        if routing_start_time is None:
+            routing_start_time = time.perf_counter()
+        # a sampled event is already in its consumer span (see `trace_route_data_event`), so when it's shed
+        # it's only logged, without a second span
+        new_event_data = self.apply_selected_dataflow_to_event(event_data, data_flow, plan_version, is_traced=False)
+        self.metrics.record_event(event_data['buffer_stream_key'], get_routing_category(data_flow), data_flow)
+        write_start_time = time.perf_counter()
+        self.metrics.record_routing_latency(write_start_time - routing_start_time)
         if new_event_data:
-            self.send_event_to_first_service_in_dataflow(new_event_data)
+            self.send_event_to_first_service_in_dataflow(new_event_data, is_traced)
+            self.metrics.record_write_latency(time.perf_counter() - write_start_time)
+
+    def route_data_event_wrapper(self, event_data, data_flow, plan_version, routing_start_time=None):
+        routing_category = get_routing_category(data_flow)
+        if not self.trace_sampler.is_sampled(routing_category):
+            self.route_data_event(
+                event_data, data_flow, plan_version, is_traced=False, routing_start_time=routing_start_time
+            )
+            return
+        self.trace_route_data_event(event_data, data_flow, plan_version, routing_category, routing_start_time)
+
+    def trace_route_data_event(self, event_data, data_flow, plan_version, routing_category, routing_start_time):
+        self.event_trace_for_method_with_event_data(
+            method=self.route_data_event,
+            method_args=(),
+            method_kwargs={
+                'event_data': event_data,
+                'data_flow': data_flow,
+                'plan_version': plan_version,
+                'routing_start_time': routing_start_time,
+            },
+            get_event_tracer=True,
+            tracer_tags={
+                tags.SPAN_KIND: tags.SPAN_KIND_CONSUMER,
+                EVENT_ID_TAG: event_data['id'],
+                ROUTING_CATEGORY_TAG: routing_category,
+            }
+        )
+
+    def write_event_msg(self, event_msg, destination_stream):
+        if self.output_stage is not None:
+            self.output_stage.add(destination_stream, event_msg)
+            return
+        try:
+            destination_stream.write_events(event_msg)
+        except Exception:
+            # the entries read are left pending, see `flush_data_acks`
+            self.has_failed_writes = True
+            raise
+
+    def route_passthrough_data_event(self, event, data_flow, plan_version, routing_start_time=None):
+        if routing_start_time is None:
+            routing_start_time = time.perf_counter()
+        routing_category = get_routing_category(data_flow)
+        if self.trace_sampler.is_sampled(routing_category):
+            # the sampled events take the dict based path, which opens their consumer and producer spans
+            self.trace_route_data_event(event.decode(), data_flow, plan_version, routing_category, routing_start_time)
+            return
+
+        self.metrics.record_event(event.buffer_stream_key, routing_category, data_flow)
+        write_start_time = time.perf_counter()
+        self.metrics.record_routing_latency(write_start_time - routing_start_time)
+        if data_flow is None:
+            self.log_event_load_shedding(event)
+            return
+        if len(data_flow) == 0:
+            self.logger.warning('Event data wihout a known buffer stream dataflow plan: %s. Ignoring event.', event)
+            return
+
+        codec_msgs = {}
+        for destination in data_flow.first_hop_destinations:
+            self.logger.debug('Sending event to "%s": %s', destination, event)
+            self.metrics.record_destination_event(destination)
+            codec = self.passthrough_encoder.get_stream_codec(destination)
+            event_msg = codec_msgs.get(codec)
+            if event_msg is None:
+                event_msg = self.passthrough_encoder.encode(event, data_flow, plan_version, codec)
+                codec_msgs[codec] = event_msg
+            self.write_event_msg(event_msg, self.get_destination_streams(destination))
+        self.metrics.record_write_latency(time.perf_counter() - write_start_time)
+
+    def read_data_events_batch(self):
+        event_list = list(self.service_stream.read_events(count=self.data_batch_size))
+        if self.data_batch_max_wait_ms <= 0:
+            return event_list
+
+        deadline = time.perf_counter() + self.data_batch_max_wait_ms / 1000
+        while event_list and len(event_list) < self.data_batch_size and time.perf_counter() < deadline:
+            more_events = list(self.service_stream.read_events(count=self.data_batch_size - len(event_list)))
+            if not more_events:
+                break
+            event_list.extend(more_events)
+        return event_list
+
+    def group_data_events_by_bufferstream(self, event_list):
+        bufferstream_events = {}
+        check_deadlines = self.deadline_checker.is_active
+        now_ms = time.time() * 1000
+        for event_id, json_msg in event_list:
+            try:
+                if self.event_passthrough:
+                    event = extract_passthrough_event(json_msg)
+                    if event is not None:
+                        if self.duplicate_filter is not None:
+                            # the passthrough id is unset when it can't be read without decoding the event
+                            dedup_id = event.id if event.id is not None else event.decode().get('id')
+                            if self.is_duplicate_event(event.buffer_stream_key, dedup_id):
+                                continue
+                        if check_deadlines and self.is_expired_event(event.buffer_stream_key, event_id, event, now_ms):
+                            continue
+                        bufferstream_events.setdefault(event.buffer_stream_key, []).append(event)
+                        continue
+                event_data = self.default_event_deserializer(json_msg)
+                if not self.event_validation_fields(event_data, self.data_validation_fields):
+                    self.logger.info(f'Ignoring bad event data: {event_data}')
+                    continue
+                if self.duplicate_filter is not None and self.is_duplicate_event(
+                        event_data['buffer_stream_key'], event_data['id']):
+                    continue
+                if check_deadlines and self.is_expired_event(
+                        event_data['buffer_stream_key'], event_id, event_data, now_ms):
+                    continue
+                bufferstream_events.setdefault(event_data['buffer_stream_key'], []).append(event_data)
+            except Exception as e:
+                self.logger.error(f'Error processing {json_msg}:')
+                self.logger.exception(e)
+        return bufferstream_events
+
+    def route_selected_data_event(self, event_data, data_flow, plan_version, routing_start_time):
+        try:
+            if isinstance(event_data, PassthroughEvent):
+                self.route_passthrough_data_event(event_data, data_flow, plan_version, routing_start_time)
+            else:
+                self.route_data_event_wrapper(event_data, data_flow, plan_version, routing_start_time)
+        except Exception as e:
+            self.logger.error(f'Error processing {event_data}:')
+            self.logger.exception(e)
+
+    def route_data_events_fairly(self, bufferstream_events, plan):
+        bufferstream_dataflows = []
+        selection_times = {}
+        for buffer_stream_key, events in bufferstream_events.items():
+            selection_start_time = time.perf_counter()
+            bufferstream_dataflows.append(
+                (buffer_stream_key, events, plan.get_event_dataflows(buffer_stream_key, events))
+            )
+            selection_times[buffer_stream_key] = (time.perf_counter() - selection_start_time) / len(events)
+        # under emergency shedding, the events over their bufferstream fair share are shed instead of random ones
+        shedding_rate = self.emergency_shedder.shedding_rate if self.emergency_shedder.is_active else 0
+        dispatched_events = self.fair_dispatcher.dispatch(bufferstream_dataflows, shedding_rate)
+        for buffer_stream_key, event_data, data_flow in dispatched_events:
+            if self.rate_limiter.buckets:
+                data_flow = self.throttle_dataflow(plan, buffer_stream_key, data_flow)
+            routing_start_time = time.perf_counter() - selection_times[buffer_stream_key]
+            self.route_selected_data_event(event_data, data_flow, plan.version, routing_start_time)
+
+    @timer_logger
+    def process_data_events_batch(self, event_list):
+        bufferstream_events = self.group_data_events_by_bufferstream(event_list)
+        plan = self.current_plan
+        if self.fair_dispatcher is not None:
+            self.route_data_events_fairly(bufferstream_events, plan)
+            return
+        for buffer_stream_key, events in bufferstream_events.items():
+            selection_start_time = time.perf_counter()
+            data_flows = plan.get_event_dataflows(buffer_stream_key, events)
+            if self.emergency_shedder.is_active:
+                data_flows = [
+                    self.apply_emergency_shedding(buffer_stream_key, data_flow) for data_flow in data_flows
+                ]
+            if self.rate_limiter.buckets:
+                data_flows = [
+                    self.throttle_dataflow(plan, buffer_stream_key, data_flow) for data_flow in data_flows
+                ]
+            # the group's single selection call time is split evenly into its events routing latency
+            event_selection_time = (time.perf_counter() - selection_start_time) / len(events)
+            for event_data, data_flow in zip(events, data_flows):
+                routing_start_time = time.perf_counter() - event_selection_time
+                self.route_selected_data_event(event_data, data_flow, plan.version, routing_start_time)
+
+    def process_data_events(self, event_list):
+        if self.deadline_checker.is_active and self.deadline_checker.is_clock_sync_due():
+            self.sync_deadline_clock()
+        if self.is_backlog_refresh_due():
+            self.refresh_destination_backlogs()
+        if self.data_batch_size > 1 or self.event_passthrough or self.fair_dispatcher is not None:
+            self.process_data_events_batch(event_list)
+            return
+        now_ms = time.time() * 1000
+        for event_id, json_msg in event_list:
+            try:
+                event_data = self.default_event_deserializer(json_msg)
+                # same order as the batch path: validation, duplicates, then the latency budget
+                self.process_data_event_wrapper(event_data, json_msg, event_id, now_ms)
+            except Exception as e:
+                self.logger.error(f'Error processing {json_msg}:')
+                self.logger.exception(e)
+
+    def ack_data_events(self, event_ids):
+        if not self.ack_data_stream_events or not event_ids:
+            return
+        self.unacked_event_ids.extend(event_ids)
+        self.flush_data_acks()
+
+    def flush_data_acks(self):
+        if not self.unacked_event_ids:
+            return
+        output_stage = self.output_stage
+        if output_stage is not None and output_stage.pending_count > 0:
+            # acked with the next flush that writes all the pending events
+            return
+        event_ids = self.unacked_event_ids
+        self.unacked_event_ids = []
+        if self.has_failed_writes or (output_stage is not None and output_stage.has_failed_writes):
+            # left pending, so they're claimed again by the reclaimer
+            self.has_failed_writes = False
+            if output_stage is not None:
+                output_stage.has_failed_writes = False
+            self.logger.warning(f'Not acking {len(event_ids)} events read before a failed write')
+            return
+        self.data_acker.ack(event_ids)
+
+    def reclaim_pending_data_events(self):
+        event_list, dropped_ids = self.pending_reclaimer.claim()
+        if dropped_ids:
+            self.logger.warning(f'Dropping {len(dropped_ids)} pending events too old to be routed')
+            self.data_acker.ack(dropped_ids)
+        if not event_list:
+            return
+        self.logger.info(f'Routing {len(event_list)} reclaimed pending events')
+        try:
+            self.process_data_events(event_list)
+        finally:
+            self.ack_data_events([event_id for event_id, json_msg in event_list])
+
+    def process_data_batch(self):
+        self.logger.debug('Processing DATA..')
+        event_list = self.read_data_events_batch()
+        if self.emergency_shedder.enabled:
+            self.update_emergency_shedding(event_list)
+        if not event_list:
+            return
+        try:
+            self.process_data_events(event_list)
+        finally:
+            # one XACK for the whole batch, even for the events that failed
+            self.ack_data_events([event_id for event_id, json_msg in event_list])
+
+    def process_data(self):
+        self.process_data_batch()
+        if self.output_stage is not None:
+            try:
+                self.output_stage.flush_if_due()
+            except Exception as e:
+                # the output stage flags the failed write, so the events read are left pending
+                self.logger.error('Error flushing the buffered DATA events:')
+                self.logger.exception(e)
+        self.flush_data_acks()
+        if self.pending_reclaimer is not None and self.pending_reclaimer.is_due():
+            self.reclaim_pending_data_events()
+        self.evict_idle_bufferstream_states()
 
     def process_adaptive_plan(self, event_data):
         adaptive_plan = event_data['plan']
         execution_plan = adaptive_plan['execution_plan']
         scheduling_strategy = execution_plan['strategy']
-        self.execute_adaptive_plan(scheduling_strategy)
+        plan_options = {}
+        plan_option_names = [
+            'trace_sampling', 'stream_codecs', 'bufferstream_weights', 'destination_capacities', 'latency_budgets_ms'
+        ]
+        for option in plan_option_names:
+            if option in execution_plan:
+                plan_options[option] = execution_plan[option]
+        self.execute_adaptive_plan(scheduling_strategy, plan_options)
         self.publish_scheduling_plan_executed(event_data['plan'])
 
     def process_event_type(self, event_type, event_data, json_msg):
@@ -162,14 +981,62 @@ class Scheduler(BaseEventDrivenCMDService):
     def log_state(self):
         super(Scheduler, self).log_state()
         self._log_dict('Bufferstream to Dataflow', self.bufferstream_to_dataflow)
+        self.logger.info(f'Current plan: {self.current_plan}')
         self.current_strategy.log_state()
+        if self.duplicate_filter is not None:
+            self.logger.info(f'Duplicate filter: {self.duplicate_filter.get_state()}')
+        if self.fair_dispatcher is not None:
+            self.logger.info(f'Fair dispatcher: {self.fair_dispatcher.get_state()}')
+        if self.rate_limiter.buckets:
+            self.logger.info(f'Destination rate limits: {self.rate_limiter.get_state()}')
+        if self.pending_reclaimer is not None:
+            self.logger.info(f'Pending entries reclaimer: {self.pending_reclaimer.get_state()}')
+        if self.deadline_checker.is_active:
+            self.logger.info(f'Latency budgets: {self.deadline_checker.get_state()}')
 
     def run(self):
         super(Scheduler, self).run()
+        self.set_data_consumer_name(f'{self.name}-data')
         self.log_state()
+        self.start_metrics_reporting()
         self.cmd_thread = threading.Thread(target=self.run_forever, args=(self.process_cmd,))
         self.data_thread = threading.Thread(target=self.run_forever, args=(self.process_data,))
         self.cmd_thread.start()
         self.data_thread.start()
         self.cmd_thread.join()
         self.data_thread.join()
+
+    def run_async(self, redis_configs, runtime_configs):
+        super(Scheduler, self).run()
+        self.log_state()
+        if self.metrics_scrape_port > 0:
+            start_metrics_scrape_endpoint(self.metrics, self.name, self.metrics_scrape_port)
+        run_async_runtime(self, redis_configs, runtime_configs)
+
+    def set_data_consumer_name(self, consumer_name):
+        consumer_group = self.service_stream.input_consumer_group
+        self.service_stream.input_consumer_group = consumer_group.consumer(consumer_name)
+        self.data_consumer_name = consumer_name
+        if self.pending_reclaimer is not None:
+            self.pending_reclaimer.consumer_name = consumer_name
+
+    def run_command_plane(self, plan_broadcaster):
+        super(Scheduler, self).run()
+        self.plan_broadcaster = plan_broadcaster
+        self.log_state()
+        self.cmd_thread = threading.Thread(target=self.run_forever, args=(self.process_cmd,))
+        self.cmd_thread.start()
+        self.cmd_thread.join()
+
+    def run_data_worker(self, worker_index, control_conn):
+        super(Scheduler, self).run()
+        self.set_data_consumer_name(f'{self.name}-worker-{worker_index}')
+        self.plan_receiver = PlanReceiver(self, control_conn)
+        self.log_state()
+        self.start_metrics_reporting(worker_index)
+        self.control_thread = threading.Thread(target=self.run_forever, args=(self.plan_receiver.process_control,))
+        self.data_thread = threading.Thread(target=self.run_forever, args=(self.process_data,))
+        self.control_thread.start()
+        self.data_thread.start()
+        self.control_thread.join()
+        self.data_thread.join()
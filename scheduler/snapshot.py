@@ -0,0 +1,58 @@
+import json
+import os
+import tempfile
+
+
+PLAN_SNAPSHOT_FORMAT_VERSION = 1
+
+
+def dump_plan_snapshot(plan, strategy_state=None):
+    return {
+        'format_version': PLAN_SNAPSHOT_FORMAT_VERSION,
+        'version': plan.version,
+        'strategy_name': plan.strategy_name,
+        'options': plan.options,
+        'routing_tables': {
+            buffer_stream_key: routing_table.to_snapshot()
+            for buffer_stream_key, routing_table in plan.routing_tables.items()
+        },
+        'strategy_state': strategy_state if strategy_state is not None else {},
+    }
+
+
+class PlanSnapshotStore():
+    """
+    Local file with the last installed compiled plan, and the state of its strategy,
+    so a restarted scheduler can route with it right away, before any new plan is received.
+    The file is replaced atomically: it's written to a temporary file in the same directory,
+    which is then renamed over it, so it's never seen half-written, even on a crash.
+    """
+
+    def __init__(self, path, logger):
+        self.path = path
+        self.logger = logger
+
+    def save(self, plan, strategy_state=None):
+        snapshot_data = json.dumps(dump_plan_snapshot(plan, strategy_state), separators=(',', ':'))
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(prefix='.plan-snapshot-', dir=directory)
+        try:
+            with os.fdopen(fd, 'w') as tmp_file:
+                tmp_file.write(snapshot_data)
+                tmp_file.flush()
+                os.fsync(tmp_file.fileno())
+            os.replace(tmp_path, self.path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path) as snapshot_file:
+            snapshot = json.load(snapshot_file)
+        if snapshot.get('format_version') != PLAN_SNAPSHOT_FORMAT_VERSION:
+            self.logger.warning(f'Ignoring plan snapshot with unknown format: {snapshot.get("format_version")}')
+            return None
+        return snapshot
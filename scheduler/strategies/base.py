@@ -1,22 +1,87 @@
-import random
+from .dataflow import DataflowRegistry
+from .load_shedding import RandomLoadShedder
+from .routing_table import RoutingTable
+from .state import BufferstreamStateStore
+
 
 class BaseStrategy():
 
-    def __init__(self, parent_service):
+    def __init__(self, parent_service, load_shedder=None, dataflow_registry=None, state_store=None):
         self.parent_service = parent_service
         self.logger = self.parent_service.logger
+        self.bufferstream_routing_tables = {}
+        if load_shedder is None:
+            load_shedder = RandomLoadShedder()
+        self.load_shedder = load_shedder
+        if dataflow_registry is None:
+            dataflow_registry = DataflowRegistry()
+        self.dataflow_registry = dataflow_registry
+        if state_store is None:
+            state_store = BufferstreamStateStore()
+        self.state_store = state_store
+
+    def compile_routing_tables(self, strategy_plan):
+        has_load_shedding = '-LS' in strategy_plan['name']
+        routing_tables = {}
+        for buffer_stream_key, dataflow_choices in strategy_plan['dataflows'].items():
+            routing_table = RoutingTable.from_plan_choices(
+                dataflow_choices, has_load_shedding=has_load_shedding, dataflow_registry=self.dataflow_registry
+            )
+            if routing_table is not None:
+                routing_tables[buffer_stream_key] = routing_table
+        return routing_tables
+
+    def install_routing_tables(self, routing_tables):
+        self.bufferstream_routing_tables = routing_tables
+
+    def release_routing_tables(self):
+        # once another strategy has the current plan, this one shouldn't keep the previous plan alive
+        self.install_routing_tables({})
 
     def update(self, strategy_plan):
-        raise NotImplementedError()
+        routing_tables = self.compile_routing_tables(strategy_plan)
+        self.install_routing_tables(routing_tables)
+        return routing_tables
 
     def get_bufferstream_dataflow(self, buffer_stream_key):
+        routing_table = self.bufferstream_routing_tables.get(buffer_stream_key)
+        if routing_table is None:
+            return []
+        return self.select_dataflow(buffer_stream_key, routing_table)
+
+    def get_bufferstream_dataflows(self, buffer_stream_key, n):
+        routing_table = self.bufferstream_routing_tables.get(buffer_stream_key)
+        if routing_table is None:
+            return [[]] * n
+        return self.select_dataflows(buffer_stream_key, routing_table, n)
+
+    def select_dataflow(self, buffer_stream_key, routing_table):
         raise NotImplementedError()
 
-    def is_shedding_event(self, load_shedding_rate):
-        if load_shedding_rate is None or load_shedding_rate == 0:
-            return False
-        shed_roll = random.randint(0, 100) / 100
-        return shed_roll <= load_shedding_rate
+    def select_dataflows(self, buffer_stream_key, routing_table, n):
+        return [self.select_dataflow(buffer_stream_key, routing_table) for _ in range(n)]
+
+    def select_event_dataflow(self, buffer_stream_key, routing_table, event):
+        # only the strategies that route by some event field need the event itself
+        return self.select_dataflow(buffer_stream_key, routing_table)
+
+    def select_event_dataflows(self, buffer_stream_key, routing_table, events):
+        return self.select_dataflows(buffer_stream_key, routing_table, len(events))
+
+    def is_shedding_event(self, load_shedding_rate, buffer_stream_key=None):
+        return self.load_shedder.is_shedding_event(buffer_stream_key, load_shedding_rate)
+
+    def get_shedding_events(self, load_shedding_rates, buffer_stream_key=None):
+        return self.load_shedder.get_shedding_events(buffer_stream_key, load_shedding_rates)
+
+    def get_state(self):
+        # selection state that should survive a restart, as json serializable data
+        return {}
+
+    def set_state(self, state):
+        pass
 
     def log_state(self):
         self.logger.info(f'Strategy: {self.__class__.__name__}')
+        self.logger.info(f'Bufferstream to routing tables: {self.bufferstream_routing_tables}')
+        self.logger.info(f'Bufferstream states memory: {self.state_store.get_memory_report()}')
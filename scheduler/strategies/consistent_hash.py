@@ -0,0 +1,196 @@
+import hashlib
+import math
+
+from ..passthrough import PassthroughEvent, get_field_value
+from .base import BaseStrategy
+
+
+MASK_64 = (1 << 64) - 1
+
+
+def get_stable_hash(value):
+    # python's hash of str is salted per process, the data workers have to agree on the keys ranking
+    return int.from_bytes(hashlib.blake2b(str(value).encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def get_event_routing_key(event, routing_key_field, routing_key_field_name=None):
+    if isinstance(event, PassthroughEvent):
+        if routing_key_field_name is None:
+            routing_key_field_name = f'"{routing_key_field}"'.encode('utf-8')
+        routing_key = get_field_value(event.event_json, routing_key_field_name)
+        if routing_key is not None or routing_key_field_name not in event.event_json:
+            return routing_key
+        # the bytes search can't tell the value (e.g.: escaped string), the key must match the decoded event one
+        event = event.decode()
+    return event.get(routing_key_field)
+
+
+def mix_hash(value):
+    # splitmix64 finalizer, to derive the per dataflow hashes of a key from its single stable hash
+    value = (value ^ (value >> 30)) * 0xbf58476d1ce4e5b9 & MASK_64
+    value = (value ^ (value >> 27)) * 0x94d049bb133111eb & MASK_64
+    return value ^ (value >> 31)
+
+
+class RendezvousTable():
+    """
+    Weighted rendezvous hashing over a routing table: a key goes to the dataflow with the highest
+    `weight / -ln(hash(key, dataflow))` score, which selects each dataflow with a probability that is
+    its share of the weights. The scores only depend on the key, the dataflow key and its weight,
+    and scaling all the weights doesn't change their order, so when the weights change the only keys
+    that move are the ones that go to a dataflow whose share increased.
+    """
+    __slots__ = ('routing_table', 'seeds', 'weights', 'shares')
+
+    def __init__(self, routing_table):
+        self.routing_table = routing_table
+        weights = routing_table.weights
+        total_weight = sum(weights)
+        if total_weight <= 0:
+            weights = (1,) * routing_table.size
+            total_weight = routing_table.size
+        self.weights = weights
+        self.shares = tuple(weight / total_weight for weight in weights)
+        self.seeds = tuple(get_stable_hash(dataflow.key) for dataflow in routing_table.dataflows)
+
+    def get_ranked_indexes(self, key_hash):
+        scores = []
+        for index, (seed, weight) in enumerate(zip(self.seeds, self.weights)):
+            if weight <= 0:
+                continue
+            unit_hash = (mix_hash(key_hash ^ seed) + 0.5) / (MASK_64 + 1)
+            scores.append((weight / -math.log(unit_hash), index))
+        scores.sort(reverse=True)
+        return [index for _, index in scores]
+
+
+class BoundedLoads():
+    """
+    Consistent hashing with bounded loads over the routing keys: each active key is assigned to
+    a dataflow, and a dataflow can't be assigned more than the load factor times its expected keys,
+    the sum of its share in the plans of the keys assigned (at least one key).
+    A new key goes to the first dataflow of its ranking that is under the bound, and an assigned key
+    only moves when its dataflow is over the bound, so a single key never moves.
+    The keys not routed in the last `window_size` events are unassigned.
+    The loads are kept per dataflow, so the bufferstreams sharing the same dataflows share their load.
+    """
+
+    def __init__(self, load_factor=1.25, window_size=1000):
+        self.load_factor = load_factor
+        self.window_size = window_size
+        # key -> [dataflow key, its index, rendezvous table, window the key was last routed in]
+        self.assignments = {}
+        self.loads = {}
+        self.expected_loads = {}
+        self.window = 0
+        self.total = 0
+
+    def get_bound(self, dataflow_key, added_share=0):
+        return max(1, self.load_factor * (self.expected_loads.get(dataflow_key, 0) + added_share))
+
+    def add_expected_loads(self, rendezvous_table, sign):
+        expected_loads = self.expected_loads
+        for dataflow, share in zip(rendezvous_table.routing_table.dataflows, rendezvous_table.shares):
+            expected_loads[dataflow.key] = expected_loads.get(dataflow.key, 0) + sign * share
+
+    def unassign(self, key):
+        dataflow_key, _, rendezvous_table, _ = self.assignments.pop(key)
+        self.loads[dataflow_key] -= 1
+        self.add_expected_loads(rendezvous_table, -1)
+
+    def assign(self, key, rendezvous_table, ranked_indexes):
+        dataflows = rendezvous_table.routing_table.dataflows
+        selected_index = ranked_indexes[0]
+        for index in ranked_indexes:
+            dataflow_key = dataflows[index].key
+            if self.loads.get(dataflow_key, 0) + 1 <= self.get_bound(dataflow_key, rendezvous_table.shares[index]):
+                selected_index = index
+                break
+        dataflow_key = dataflows[selected_index].key
+        self.loads[dataflow_key] = self.loads.get(dataflow_key, 0) + 1
+        self.add_expected_loads(rendezvous_table, 1)
+        self.assignments[key] = [dataflow_key, selected_index, rendezvous_table, self.window]
+        return selected_index
+
+    def select_index(self, key, rendezvous_table, ranked_indexes):
+        assignment = self.assignments.get(key)
+        if assignment is not None:
+            dataflow_key, index, assigned_rendezvous_table, _ = assignment
+            is_over_bound = self.loads[dataflow_key] > self.get_bound(dataflow_key)
+            if assigned_rendezvous_table is rendezvous_table and not is_over_bound:
+                assignment[3] = self.window
+                return index
+            self.unassign(key)
+        return self.assign(key, rendezvous_table, ranked_indexes)
+
+    def record(self):
+        self.total += 1
+        if self.total >= self.window_size:
+            self.expire()
+
+    def expire(self):
+        for key, (_, _, _, window) in list(self.assignments.items()):
+            if window < self.window:
+                self.unassign(key)
+        self.window += 1
+        self.total = 0
+
+
+class ConsistentHashStrategy(BaseStrategy):
+    """
+    Sticky routing: the events with the same routing key (the bufferstream, or the value of an
+    optional event field) are routed to the same dataflow, using consistent (rendezvous) hashing
+    with bounded loads over the dataflows plan weights. A key only moves to its next ranked dataflow
+    when its own dataflow is over the keys bound, or when a plan increases another dataflow share.
+    """
+
+    def __init__(self, parent_service, load_shedder=None, dataflow_registry=None, state_store=None,
+                 routing_key_field=None, load_factor=1.25, load_window=1000):
+        super(ConsistentHashStrategy, self).__init__(
+            parent_service, load_shedder=load_shedder, dataflow_registry=dataflow_registry, state_store=state_store
+        )
+        self.routing_key_field = routing_key_field
+        self.routing_key_field_name = None
+        if routing_key_field:
+            self.routing_key_field_name = f'"{routing_key_field}"'.encode('utf-8')
+        self.bounded_loads = BoundedLoads(load_factor=load_factor, window_size=load_window)
+
+    def get_rendezvous_table(self, buffer_stream_key, routing_table):
+        state = self.state_store.get(buffer_stream_key)
+        rendezvous_table = state.rendezvous_table
+        if rendezvous_table is None or rendezvous_table.routing_table is not routing_table:
+            rendezvous_table = RendezvousTable(routing_table)
+            state.rendezvous_table = rendezvous_table
+        return rendezvous_table
+
+    def get_routing_key(self, buffer_stream_key, event):
+        if self.routing_key_field and event is not None:
+            routing_key = get_event_routing_key(event, self.routing_key_field, self.routing_key_field_name)
+            if routing_key is not None:
+                return routing_key
+        return buffer_stream_key
+
+    def select_index(self, buffer_stream_key, rendezvous_table, routing_key):
+        ranked_indexes = rendezvous_table.get_ranked_indexes(get_stable_hash(routing_key))
+        return self.bounded_loads.select_index((buffer_stream_key, routing_key), rendezvous_table, ranked_indexes)
+
+    def select_event_dataflow(self, buffer_stream_key, routing_table, event):
+        rendezvous_table = self.get_rendezvous_table(buffer_stream_key, routing_table)
+        selected_choice_index = self.select_index(
+            buffer_stream_key, rendezvous_table, self.get_routing_key(buffer_stream_key, event)
+        )
+        dataflow = routing_table.dataflows[selected_choice_index]
+        if self.is_shedding_event(routing_table.get_load_shedding_rate(selected_choice_index), buffer_stream_key):
+            dataflow = None
+        self.bounded_loads.record()
+        return dataflow
+
+    def select_dataflow(self, buffer_stream_key, routing_table):
+        return self.select_event_dataflow(buffer_stream_key, routing_table, None)
+
+    def select_event_dataflows(self, buffer_stream_key, routing_table, events):
+        return [self.select_event_dataflow(buffer_stream_key, routing_table, event) for event in events]
+
+    def log_state(self):
+        super(ConsistentHashStrategy, self).log_state()
+        self.logger.debug(f'Dataflows bounded loads: {self.bounded_loads.loads}')
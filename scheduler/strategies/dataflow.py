@@ -0,0 +1,52 @@
+import json
+
+
+def get_dataflow_label(data_flow):
+    return '>'.join('+'.join(stage) for stage in data_flow)
+
+
+class Dataflow(tuple):
+    """
+    Immutable dataflow of a plan: a tuple of stages, each one a tuple of destination stream keys.
+    It is serialized the same way as the nested lists dataflow in the plan, and carries everything
+    the data path needs from it, computed only once: its first-hop destinations, its json encoding
+    and a stable key, that is the same for equal dataflows across plans and processes.
+    """
+
+    def __new__(cls, stages):
+        return super(Dataflow, cls).__new__(cls, (tuple(stage) for stage in stages))
+
+    def __init__(self, stages):
+        self.key = get_dataflow_label(self)
+        self.first_hop_destinations = self[0] if len(self) != 0 else ()
+        self.encoded = json.dumps(self).encode('utf-8')
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.key!r})'
+
+
+class DataflowRegistry():
+    """
+    Interns the plans dataflows, so each distinct dataflow is a single `Dataflow` object,
+    shared by all the routing tables (and strategies) that use it.
+    """
+
+    def __init__(self):
+        self.dataflows = {}
+
+    def intern(self, data_flow):
+        stages = tuple(tuple(stage) for stage in data_flow)
+        dataflow = self.dataflows.get(stages)
+        if dataflow is None:
+            dataflow = Dataflow(stages)
+            self.dataflows[dataflow] = dataflow
+        return dataflow
+
+    def retain(self, dataflows):
+        retained_dataflows = set(dataflows)
+        self.dataflows = {
+            stages: dataflow for stages, dataflow in self.dataflows.items() if dataflow in retained_dataflows
+        }
+
+    def __len__(self):
+        return len(self.dataflows)
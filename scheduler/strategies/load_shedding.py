@@ -0,0 +1,71 @@
+import random
+
+from .state import BufferstreamStateStore
+
+
+SHEDDING_ROLLS = tuple(roll / 100 for roll in range(0, 101))
+
+UNIFORM_SHEDDING_RESOLUTION = 1000000
+
+
+class RandomLoadShedder():
+    """
+    Independent random roll per event, with a 1% granularity.
+    """
+
+    def __init__(self, state_store=None):
+        pass
+
+    def is_shedding_event(self, buffer_stream_key, load_shedding_rate):
+        if load_shedding_rate is None or load_shedding_rate == 0:
+            return False
+        shed_roll = random.randint(0, 100) / 100
+        return shed_roll <= load_shedding_rate
+
+    def get_shedding_events(self, buffer_stream_key, load_shedding_rates):
+        # same distribution as the `is_shedding_event` roll, but for all the events in a single call
+        load_shedding_rates = list(load_shedding_rates)
+        shedding_rolls = random.choices(SHEDDING_ROLLS, k=len(load_shedding_rates))
+        return [
+            bool(load_shedding_rate) and shed_roll <= load_shedding_rate
+            for load_shedding_rate, shed_roll in zip(load_shedding_rates, shedding_rolls)
+        ]
+
+
+class UniformLoadShedder():
+    """
+    Deterministic shedding using a fractional accumulator per bufferstream:
+    each event adds its load shedding rate to the bufferstream accumulator, and the event that
+    makes it reach one whole event is shed. Drops are spaced evenly, at the exact configured rate.
+    The accumulators are kept in integer parts-per-million, so they don't drift with float rounding.
+    """
+
+    def __init__(self, state_store=None):
+        if state_store is None:
+            state_store = BufferstreamStateStore()
+        self.state_store = state_store
+
+    def is_shedding_event(self, buffer_stream_key, load_shedding_rate):
+        if load_shedding_rate is None or load_shedding_rate == 0:
+            return False
+        state = self.state_store.get(buffer_stream_key)
+        accumulator = state.shedding_accumulator
+        accumulator += round(load_shedding_rate * UNIFORM_SHEDDING_RESOLUTION)
+        is_shedding = accumulator >= UNIFORM_SHEDDING_RESOLUTION
+        if is_shedding:
+            accumulator -= UNIFORM_SHEDDING_RESOLUTION
+            if accumulator >= UNIFORM_SHEDDING_RESOLUTION:
+                accumulator = 0
+        state.shedding_accumulator = accumulator
+        return is_shedding
+
+    def get_shedding_events(self, buffer_stream_key, load_shedding_rates):
+        return [
+            self.is_shedding_event(buffer_stream_key, load_shedding_rate) for load_shedding_rate in load_shedding_rates
+        ]
+
+
+LOAD_SHEDDERS = {
+    'random': RandomLoadShedder,
+    'uniform': UniformLoadShedder,
+}
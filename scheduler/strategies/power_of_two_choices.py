@@ -0,0 +1,46 @@
+from .base import BaseStrategy
+
+
+class PowerOfTwoChoicesStrategy(BaseStrategy):
+    """
+    Samples two dataflows by their plan weights, and picks the one whose first-hop destinations
+    have the shorter backlog, according to the cached destinations backlog view.
+    The view is refreshed by the service before routing each batch, never from the routing path.
+    """
+
+    def __init__(self, parent_service, backlog_view, load_shedder=None, dataflow_registry=None, state_store=None):
+        super(PowerOfTwoChoicesStrategy, self).__init__(
+            parent_service, load_shedder=load_shedder, dataflow_registry=dataflow_registry, state_store=state_store
+        )
+        self.backlog_view = backlog_view
+
+    def install_routing_tables(self, routing_tables):
+        super(PowerOfTwoChoicesStrategy, self).install_routing_tables(routing_tables)
+        destinations = set()
+        for routing_table in routing_tables.values():
+            destinations.update(routing_table.first_hop_destinations)
+        self.backlog_view.set_destinations(destinations)
+
+    def select_index(self, routing_table):
+        first_index = routing_table.select_weighted_index()
+        if routing_table.size == 1:
+            return first_index
+        second_index = routing_table.select_weighted_index()
+        if second_index == first_index:
+            return first_index
+        dataflows = routing_table.dataflows
+        first_backlog = self.backlog_view.get_dataflow_backlog(dataflows[first_index])
+        second_backlog = self.backlog_view.get_dataflow_backlog(dataflows[second_index])
+        return second_index if second_backlog < first_backlog else first_index
+
+    def select_dataflow(self, buffer_stream_key, routing_table):
+        selected_choice_index = self.select_index(routing_table)
+        if self.is_shedding_event(routing_table.get_load_shedding_rate(selected_choice_index), buffer_stream_key):
+            return None
+        dataflow = routing_table.dataflows[selected_choice_index]
+        self.backlog_view.record_sent(dataflow)
+        return dataflow
+
+    def log_state(self):
+        super(PowerOfTwoChoicesStrategy, self).log_state()
+        self.logger.debug(f'Destinations backlog: {self.backlog_view.backlogs}')
@@ -0,0 +1,89 @@
+import bisect
+import random
+
+from .dataflow import Dataflow
+
+
+class RoutingTable():
+    """
+    Immutable, precompiled form of a bufferstream's dataflow choices in a plan.
+
+    The plan entries are `[cum_weight, dataflow]`, or `[load_shedding_rate, cum_weight, dataflow]`
+    for the `-LS` plans, and are unzipped only once when the plan is compiled, with each dataflow
+    turned into a `Dataflow`, interned by the given registry.
+    The cumulative weights are used as a prefix-sum array, so a weighted selection
+    is a single binary search over it, with the same distribution as `random.choices`.
+    The weight of each choice, for the deterministic strategies, is the difference between
+    consecutive cumulative weights.
+    """
+    __slots__ = (
+        'dataflows', 'cum_weights', 'total_weight', 'load_shedding_rates', 'size', '_hi', '_indexes',
+        'first_hop_destinations', 'weights'
+    )
+
+    def __init__(self, dataflows, cum_weights, load_shedding_rates=None):
+        self.dataflows = tuple(dataflows)
+        self.cum_weights = tuple(cum_weights)
+        self.total_weight = self.cum_weights[-1] if self.cum_weights else 0
+        self.load_shedding_rates = tuple(load_shedding_rates) if load_shedding_rates is not None else None
+        self.size = len(self.dataflows)
+        self._hi = self.size - 1
+        self._indexes = range(self.size)
+        self.first_hop_destinations = frozenset(
+            destination for dataflow in self.dataflows for destination in dataflow.first_hop_destinations
+        )
+        self.weights = tuple(
+            max(0, cum_weight - previous_cum_weight)
+            for previous_cum_weight, cum_weight in zip((0,) + self.cum_weights[:-1], self.cum_weights)
+        )
+
+    @classmethod
+    def from_plan_choices(cls, zipped_dataflow_weighted_choices, has_load_shedding=False, dataflow_registry=None):
+        if len(zipped_dataflow_weighted_choices) == 0:
+            return None
+        if has_load_shedding:
+            load_shedding_rates, cum_weights, dataflows = zip(*zipped_dataflow_weighted_choices)
+        else:
+            cum_weights, dataflows = zip(*zipped_dataflow_weighted_choices)
+            load_shedding_rates = None
+        intern = dataflow_registry.intern if dataflow_registry is not None else Dataflow
+        return cls([intern(dataflow) for dataflow in dataflows], cum_weights, load_shedding_rates)
+
+    def to_snapshot(self):
+        return {
+            'dataflows': self.dataflows,
+            'cum_weights': self.cum_weights,
+            'load_shedding_rates': self.load_shedding_rates,
+        }
+
+    @classmethod
+    def from_snapshot(cls, snapshot, dataflow_registry=None):
+        intern = dataflow_registry.intern if dataflow_registry is not None else Dataflow
+        return cls(
+            [intern(dataflow) for dataflow in snapshot['dataflows']],
+            snapshot['cum_weights'],
+            snapshot['load_shedding_rates']
+        )
+
+    def get_load_shedding_rate(self, index):
+        if self.load_shedding_rates is None:
+            return 0
+        return self.load_shedding_rates[index]
+
+    def select_weighted_index(self):
+        return bisect.bisect(self.cum_weights, random.random() * self.total_weight, 0, self._hi)
+
+    def select_weighted_indexes(self, n):
+        return random.choices(self._indexes, cum_weights=self.cum_weights, k=n)
+
+    def select_uniform_index(self):
+        return random.randrange(self.size)
+
+    def select_uniform_indexes(self, n):
+        return random.choices(self._indexes, k=n)
+
+    def __repr__(self):
+        return (
+            f'{self.__class__.__name__}(dataflows={self.dataflows}, cum_weights={self.cum_weights}, '
+            f'load_shedding_rates={self.load_shedding_rates})'
+        )
@@ -3,27 +3,16 @@ from .base import BaseStrategy
 
 class SingleBestStrategy(BaseStrategy):
 
-    def __init__(self, parent_service):
-        super(SingleBestStrategy, self).__init__(parent_service)
-        self.bufferstream_to_dataflow = {}
-        self.bufferstream_load_shedding = {}
-
-    def update(self, strategy_plan):
-        dataflows_dict = strategy_plan['dataflows']
-        for buffer_stream_key, dataflows in dataflows_dict.items():
-            if '-LS' in strategy_plan['name']:
-                self.bufferstream_to_dataflow[buffer_stream_key] = dataflows[0][2]
-                self.bufferstream_load_shedding[buffer_stream_key] = dataflows[0][0]
-            else:
-                self.bufferstream_to_dataflow[buffer_stream_key] = dataflows[0][1]
-
-    def get_bufferstream_dataflow(self, buffer_stream_key):
-        dataflow = self.bufferstream_to_dataflow.get(buffer_stream_key, [])
-        load_shedding_rate = self.bufferstream_load_shedding.get(buffer_stream_key, 0)
-        if self.is_shedding_event(load_shedding_rate):
+    def select_dataflow(self, buffer_stream_key, routing_table):
+        dataflow = routing_table.dataflows[0]
+        if self.is_shedding_event(routing_table.get_load_shedding_rate(0), buffer_stream_key):
             dataflow = None
         return dataflow
 
-    def log_state(self):
-        super(SingleBestStrategy, self).log_state()
-        self.logger.info(f'Bufferstream to dataflow: {self.bufferstream_to_dataflow}')
+    def select_dataflows(self, buffer_stream_key, routing_table, n):
+        dataflow = routing_table.dataflows[0]
+        load_shedding_rate = routing_table.get_load_shedding_rate(0)
+        if not load_shedding_rate:
+            return [dataflow] * n
+        shedding_events = self.get_shedding_events([load_shedding_rate] * n, buffer_stream_key)
+        return [None if is_shedding else dataflow for is_shedding in shedding_events]
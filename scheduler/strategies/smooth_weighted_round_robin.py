@@ -0,0 +1,59 @@
+from .base import BaseStrategy
+
+
+class SmoothWeightedRoundRobinStrategy(BaseStrategy):
+    """
+    Deterministic weighted selection (nginx smooth weighted round-robin): on each selection every
+    choice's current weight is increased by its plan weight, the choice with the highest current
+    weight is selected, and its current weight is decreased by the total weight.
+    Over every window of total-weight selections each choice is selected exactly its weight times,
+    and the selections of a choice are spread out over the window instead of being consecutive.
+    """
+
+    def get_current_weights(self, buffer_stream_key, routing_table):
+        # the current weights are only valid for the routing table they were built for,
+        # so they restart from zero with each new plan
+        state = self.state_store.get(buffer_stream_key)
+        smooth_weights = state.smooth_weights
+        if smooth_weights is None or smooth_weights[0] is not routing_table:
+            weights = routing_table.weights
+            if sum(weights) <= 0:
+                weights = (1,) * routing_table.size
+            smooth_weights = (routing_table, weights, sum(weights), [0] * routing_table.size)
+            state.smooth_weights = smooth_weights
+        return smooth_weights
+
+    def select_index(self, buffer_stream_key, routing_table):
+        _, weights, total_weight, current_weights = self.get_current_weights(buffer_stream_key, routing_table)
+        selected_choice_index = 0
+        for index, weight in enumerate(weights):
+            current_weights[index] += weight
+            if current_weights[index] > current_weights[selected_choice_index]:
+                selected_choice_index = index
+        current_weights[selected_choice_index] -= total_weight
+        return selected_choice_index
+
+    def select_dataflow(self, buffer_stream_key, routing_table):
+        selected_choice_index = self.select_index(buffer_stream_key, routing_table)
+        if self.is_shedding_event(routing_table.get_load_shedding_rate(selected_choice_index), buffer_stream_key):
+            return None
+        return routing_table.dataflows[selected_choice_index]
+
+    def get_state(self):
+        return {
+            'bufferstream_current_weights': {
+                key: state.smooth_weights[3] for key, state in self.state_store.items()
+                if state.smooth_weights is not None
+            }
+        }
+
+    def set_state(self, state):
+        for buffer_stream_key, current_weights in state.get('bufferstream_current_weights', {}).items():
+            routing_table = self.bufferstream_routing_tables.get(buffer_stream_key)
+            if routing_table is None or len(current_weights) != routing_table.size:
+                continue
+            self.get_current_weights(buffer_stream_key, routing_table)[3][:] = current_weights
+
+    def log_state(self):
+        super(SmoothWeightedRoundRobinStrategy, self).log_state()
+        self.logger.debug(f'Bufferstream to current weights: {self.get_state()["bufferstream_current_weights"]}')
@@ -0,0 +1,91 @@
+import sys
+import time
+
+
+class BufferstreamState():
+    """
+    Selection state of a bufferstream, shared by all the strategies and the plan load shedder,
+    with one slot per kind of state instead of one dict per strategy.
+    """
+    __slots__ = (
+        'last_seen', 'round_robin_index', 'smooth_weights', 'rendezvous_table', 'shedding_accumulator',
+        'fair_finish_tag'
+    )
+
+    def __init__(self, last_seen):
+        self.last_seen = last_seen
+        self.round_robin_index = 0
+        self.smooth_weights = None
+        self.rendezvous_table = None
+        self.shedding_accumulator = 0
+        self.fair_finish_tag = 0
+
+
+class BufferstreamStateStore():
+    """
+    Per-bufferstream state records, retired explicitly when their bufferstream is no longer in the plan,
+    and evicted once they're idle for longer than the idle TTL (zero disables the eviction).
+    The records are touched with a coarse clock, only updated on the eviction checks,
+    so keeping them fresh costs a single attribute read on the data path.
+    """
+
+    def __init__(self, idle_ttl_s=0, check_interval_s=10):
+        self.idle_ttl = idle_ttl_s
+        self.check_interval = check_interval_s
+        self.states = {}
+        self.now = time.monotonic()
+        self.evicted_count = 0
+        self.retired_count = 0
+
+    def get(self, buffer_stream_key):
+        state = self.states.get(buffer_stream_key)
+        if state is None:
+            state = BufferstreamState(self.now)
+            self.states[buffer_stream_key] = state
+        else:
+            state.last_seen = self.now
+        return state
+
+    def items(self):
+        return list(self.states.items())
+
+    def retain(self, buffer_stream_keys):
+        retained_keys = set(buffer_stream_keys)
+        states = self.states
+        self.states = {key: state for key, state in states.items() if key in retained_keys}
+        retired_count = len(states) - len(self.states)
+        self.retired_count += retired_count
+        return retired_count
+
+    def evict_idle(self, now=None):
+        self.now = now if now is not None else time.monotonic()
+        if self.idle_ttl <= 0:
+            return 0
+        min_last_seen = self.now - self.idle_ttl
+        states = self.states
+        self.states = {key: state for key, state in states.items() if state.last_seen >= min_last_seen}
+        evicted_count = len(states) - len(self.states)
+        self.evicted_count += evicted_count
+        return evicted_count
+
+    def evict_idle_if_due(self):
+        if time.monotonic() - self.now >= self.check_interval:
+            return self.evict_idle()
+        return 0
+
+    def get_memory_report(self):
+        states = self.states
+        approximate_bytes = sys.getsizeof(states)
+        for state in states.values():
+            approximate_bytes += sys.getsizeof(state)
+            if state.smooth_weights is not None:
+                approximate_bytes += sys.getsizeof(state.smooth_weights[3])
+        return {
+            'bufferstreams': len(states),
+            'approximate_bytes': approximate_bytes,
+            'retired': self.retired_count,
+            'evicted': self.evicted_count,
+        }
+
+    def __len__(self):
+        return len(self.states)
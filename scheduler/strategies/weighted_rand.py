@@ -1,41 +1,26 @@
-import random
 from .base import BaseStrategy
 
 
 class WeightedRandomStrategy(BaseStrategy):
 
-    def __init__(self, parent_service):
-        super(WeightedRandomStrategy, self).__init__(parent_service)
-        self.bufferstream_to_dataflow_choices = {}
-        self.bufferstream_load_shedding_choices = {}
-        self.has_load_shedding = False
-
-    def update(self, strategy_plan):
-        dataflows = strategy_plan['dataflows']
-        self.has_load_shedding = '-LS' in strategy_plan['name']
-        self.bufferstream_to_dataflow_choices = dataflows
-
-    def get_bufferstream_dataflow(self, buffer_stream_key):
-        return self.get_weighted_random_buffer_stream_dataflow(buffer_stream_key)
-
-    def get_weighted_random_buffer_stream_dataflow(self, buffer_stream_key):
-        zipped_dataflow_weighted_choices = self.bufferstream_to_dataflow_choices.get(buffer_stream_key, [])
-        if len(zipped_dataflow_weighted_choices) == 0:
-            return zipped_dataflow_weighted_choices
-
-        if self.has_load_shedding:
-            load_shedding_choices, cum_weights, dataflow_choices = list(zip(*zipped_dataflow_weighted_choices))
-        else:
-            cum_weights, dataflow_choices = list(zip(*zipped_dataflow_weighted_choices))
-
-        selected_choice_index = random.choices(range(len(dataflow_choices)), cum_weights=cum_weights, k=1)[0]
-        single_choice = dataflow_choices[selected_choice_index]
-        if self.has_load_shedding:
-            load_shedding_rate = load_shedding_choices[selected_choice_index]
-            if self.is_shedding_event(load_shedding_rate):
-                single_choice = None
+    def select_dataflow(self, buffer_stream_key, routing_table):
+        selected_choice_index = routing_table.select_weighted_index()
+        single_choice = routing_table.dataflows[selected_choice_index]
+        if self.is_shedding_event(routing_table.get_load_shedding_rate(selected_choice_index), buffer_stream_key):
+            single_choice = None
         return single_choice
 
-    def log_state(self):
-        super(WeightedRandomStrategy, self).log_state()
-        self.logger.info(f'Bufferstream to dataflow choices: {self.bufferstream_to_dataflow_choices}')
+    def select_dataflows(self, buffer_stream_key, routing_table, n):
+        selected_choice_indexes = routing_table.select_weighted_indexes(n)
+        dataflows = routing_table.dataflows
+        load_shedding_rates = routing_table.load_shedding_rates
+        if load_shedding_rates is None:
+            return [dataflows[index] for index in selected_choice_indexes]
+
+        shedding_events = self.get_shedding_events(
+            [load_shedding_rates[index] for index in selected_choice_indexes], buffer_stream_key
+        )
+        return [
+            None if is_shedding else dataflows[index]
+            for index, is_shedding in zip(selected_choice_indexes, shedding_events)
+        ]
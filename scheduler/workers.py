@@ -0,0 +1,185 @@
+import multiprocessing
+import time
+
+from .plan import PlanSnapshot
+
+
+PREPARE_PLAN = 'prepare'
+COMMIT_PLAN = 'commit'
+ABORT_PLAN = 'abort'
+PLAN_PREPARED = 'prepared'
+PLAN_PREPARE_FAILED = 'failed'
+
+
+class PlanBroadcaster():
+    """
+    Command-plane side of the plan fan-out to the data worker processes.
+    Each compiled plan is broadcasted with a two-phase commit over the workers control channels:
+    the plan is only committed if every live worker staged it, otherwise it is aborted on all of them,
+    so a plan is never applied on only some of the workers.
+    The prepared replies are all awaited within the same `reply_timeout`, and the replies left
+    in the channels by workers that replied too late to earlier plans are dropped.
+    A worker that died doesn't block the plans: given its process and `worker_target`, it's started
+    again and gets the last committed plan, otherwise it's only removed from the fan-out.
+    """
+
+    def __init__(self, control_conns, logger, reply_timeout=5, processes=None, worker_target=None):
+        self.control_conns = list(control_conns)
+        self.processes = list(processes) if processes is not None else None
+        self.worker_target = worker_target
+        self.logger = logger
+        self.reply_timeout = reply_timeout
+        self.last_committed_plan = None
+
+    def _send(self, control_conn, message):
+        try:
+            control_conn.send(message)
+            return True
+        except (BrokenPipeError, EOFError, OSError) as e:
+            self.logger.error(f'Failed to send plan control message to data worker: {e}')
+            return False
+
+    def _wait_prepared_reply(self, control_conn, plan_version, deadline):
+        """
+        Returns whether the worker prepared the plan, or None if the worker is gone.
+        """
+        try:
+            while True:
+                remaining_time = deadline - time.monotonic()
+                if remaining_time <= 0 or not control_conn.poll(remaining_time):
+                    self.logger.error(f'Data worker did not reply to plan version {plan_version} in time')
+                    return False
+                reply, reply_version = control_conn.recv()
+                if reply_version < plan_version:
+                    self.logger.warning(f'Dropping late reply of data worker to plan version {reply_version}')
+                    continue
+                return reply == PLAN_PREPARED and reply_version == plan_version
+        except (BrokenPipeError, EOFError, OSError) as e:
+            self.logger.error(f'Failed to receive plan control reply from data worker: {e}')
+            return None
+
+    def is_worker_alive(self, worker_index):
+        if self.processes is None:
+            return True
+        return self.processes[worker_index].is_alive()
+
+    def replace_dead_workers(self):
+        """
+        Starts again (or removes) the dead workers, and returns the indexes of the started ones.
+        """
+        started_indexes = []
+        for worker_index in reversed(range(len(self.control_conns))):
+            if self.is_worker_alive(worker_index):
+                continue
+            self.control_conns[worker_index].close()
+            if self.worker_target is None:
+                self.logger.error(f'Data worker {worker_index} is dead, removing it from the plan fan-out')
+                del self.control_conns[worker_index]
+                del self.processes[worker_index]
+                continue
+            self.logger.error(f'Data worker {worker_index} is dead, starting it again')
+            process, control_conn = start_data_worker(self.worker_target, worker_index)
+            self.processes[worker_index] = process
+            self.control_conns[worker_index] = control_conn
+            started_indexes.append(worker_index)
+        return started_indexes
+
+    def recover_workers(self):
+        started_indexes = self.replace_dead_workers()
+        if started_indexes and self.last_committed_plan is not None:
+            started_conns = [self.control_conns[worker_index] for worker_index in started_indexes]
+            self.broadcast_to(started_conns, self.last_committed_plan)
+
+    def broadcast_to(self, control_conns, plan):
+        plan_version = plan.version
+        prepare_message = (PREPARE_PLAN, plan_version, plan.strategy_name, plan.routing_tables, plan.options)
+        sent_conns = [control_conn for control_conn in control_conns if self._send(control_conn, prepare_message)]
+        deadline = time.monotonic() + self.reply_timeout
+        prepared_replies = [
+            self._wait_prepared_reply(control_conn, plan_version, deadline) for control_conn in sent_conns
+        ]
+        # the workers that died in the meantime are started again with the committed plan, they don't veto it
+        live_replies = [prepared_reply for prepared_reply in prepared_replies if prepared_reply is not None]
+        is_prepared = len(live_replies) > 0 and all(live_replies)
+
+        action = COMMIT_PLAN if is_prepared else ABORT_PLAN
+        for control_conn in sent_conns:
+            self._send(control_conn, (action, plan_version))
+        return is_prepared
+
+    def broadcast(self, plan):
+        self.recover_workers()
+        is_prepared = self.broadcast_to(self.control_conns, plan)
+        if is_prepared:
+            self.last_committed_plan = plan
+        self.recover_workers()
+        return is_prepared
+
+
+class PlanReceiver():
+    """
+    Data worker side of the plan fan-out: stages the compiled plan on prepare,
+    and only installs it on the worker service when the command plane commits it.
+    The plan destinations are warmed up for at most `warm_up_timeout` seconds on prepare, so the worker
+    replies within the broadcaster reply timeout, the ones left are created on their first event.
+    """
+
+    def __init__(self, service, control_conn, warm_up_timeout=2):
+        self.service = service
+        self.control_conn = control_conn
+        self.warm_up_timeout = warm_up_timeout
+        self.staged_plan = None
+        self.staged_destination_streams = None
+
+    def prepare(self, plan_version, strategy_name, routing_tables, options):
+        strategy = self.service.scheduling_strategies.get(strategy_name)
+        if strategy is None:
+            self.service.logger.error(f'No strategy named "{strategy_name}" available for plan version {plan_version}.')
+            self.staged_plan = None
+            return PLAN_PREPARE_FAILED
+        self.staged_plan = PlanSnapshot(plan_version, strategy_name, strategy, routing_tables, options)
+        self.staged_destination_streams = self.service.warm_up_plan(self.staged_plan, self.warm_up_timeout)
+        return PLAN_PREPARED
+
+    def commit(self, plan_version):
+        if self.staged_plan is None or self.staged_plan.version != plan_version:
+            self.service.logger.error(f'Commit received for plan version {plan_version} that was not staged.')
+            return
+        plan = self.staged_plan
+        destination_streams = self.staged_destination_streams
+        self.staged_plan = None
+        self.staged_destination_streams = None
+        self.service.install_compiled_plan(plan, destination_streams)
+
+    def abort(self, plan_version):
+        self.service.logger.warning(f'Aborting plan version {plan_version}.')
+        self.staged_plan = None
+        self.staged_destination_streams = None
+
+    def process_control(self):
+        message = self.control_conn.recv()
+        action, plan_version = message[0], message[1]
+        if action == PREPARE_PLAN:
+            reply = self.prepare(plan_version, *message[2:])
+            self.control_conn.send((reply, plan_version))
+        elif action == COMMIT_PLAN:
+            self.commit(plan_version)
+        elif action == ABORT_PLAN:
+            self.abort(plan_version)
+
+
+def start_data_worker(worker_target, worker_index):
+    control_conn, worker_control_conn = multiprocessing.Pipe()
+    process = multiprocessing.Process(target=worker_target, args=(worker_index, worker_control_conn), daemon=True)
+    process.start()
+    return process, control_conn
+
+
+def start_data_workers(worker_target, num_workers):
+    processes = []
+    control_conns = []
+    for worker_index in range(num_workers):
+        process, control_conn = start_data_worker(worker_target, worker_index)
+        processes.append(process)
+        control_conns.append(control_conn)
+    return processes, control_conns
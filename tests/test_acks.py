@@ -0,0 +1,81 @@
+import time
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+from redis.exceptions import ResponseError
+
+from scheduler.acks import DataStreamAcker, PendingEntryReclaimer
+
+
+class TestDataStreamAcker(TestCase):
+
+    def setUp(self):
+        self.service_stream = MagicMock(key='scheduler-data')
+        self.service_stream.input_consumer_group.name = 'cg-scheduler-data'
+
+    def test_ack_should_ack_all_event_ids_in_single_xack(self):
+        acker = DataStreamAcker(self.service_stream)
+        acker.ack(['1-0', '2-0', '3-0'])
+        self.service_stream.redis_db.xack.assert_called_once_with(
+            'scheduler-data', 'cg-scheduler-data', '1-0', '2-0', '3-0'
+        )
+        self.assertEqual(3, acker.acked_count)
+
+    def test_ack_should_ack_each_event_on_streams_without_redis(self):
+        service_stream = MagicMock(spec=['key', 'ack'])
+        DataStreamAcker(service_stream).ack(['1-0', '2-0'])
+        self.assertEqual(2, service_stream.ack.call_count)
+
+
+class TestPendingEntryReclaimer(TestCase):
+
+    def setUp(self):
+        self.service_stream = MagicMock(key='scheduler-data')
+        self.service_stream.input_consumer_group.name = 'cg-scheduler-data'
+        self.reclaimer = PendingEntryReclaimer(
+            self.service_stream, min_idle_ms=1000, max_age_ms=60000, count=10, consumer_name='Scheduler-worker-0'
+        )
+
+    def test_claim_should_return_events_to_route_and_old_ones_to_drop(self):
+        now_ms = int(time.time() * 1000)
+        self.service_stream.redis_db.xautoclaim.return_value = [
+            b'0-0',
+            [
+                (f'{now_ms - 120000}-0'.encode(), {b'event': b'{}'}),
+                (f'{now_ms - 5000}-0'.encode(), {b'event': b'{}'}),
+                (f'{now_ms - 4000}-0'.encode(), None),
+            ],
+            [],
+        ]
+        event_list, dropped_ids = self.reclaimer.claim()
+        self.service_stream.redis_db.xautoclaim.assert_called_once_with(
+            name='scheduler-data', groupname='cg-scheduler-data', consumername='Scheduler-worker-0',
+            min_idle_time=1000, start_id='0-0', count=10
+        )
+        self.assertEqual([(f'{now_ms - 5000}-0'.encode(), {b'event': b'{}'})], event_list)
+        self.assertEqual([f'{now_ms - 120000}-0'.encode(), f'{now_ms - 4000}-0'.encode()], dropped_ids)
+        self.assertEqual({'reclaimed': 1, 'dropped': 2}, self.reclaimer.get_state())
+
+    def test_claim_should_continue_from_returned_cursor(self):
+        self.service_stream.redis_db.xautoclaim.return_value = [b'15-0', [], []]
+        self.reclaimer.claim()
+        self.assertEqual('15-0', self.reclaimer.cursor)
+        self.reclaimer.claim()
+        self.assertEqual('15-0', self.service_stream.redis_db.xautoclaim.call_args[1]['start_id'])
+
+    def test_is_due_should_wait_for_interval_after_claim(self):
+        self.assertTrue(self.reclaimer.is_due())
+        self.service_stream.redis_db.xautoclaim.return_value = [b'0-0', [], []]
+        self.reclaimer.claim()
+        self.assertFalse(self.reclaimer.is_due())
+
+    def test_claim_should_back_off_when_xautoclaim_fails(self):
+        self.service_stream.redis_db.xautoclaim.side_effect = ResponseError('unknown command')
+        self.reclaimer.interval = 0.05
+        self.assertEqual(([], []), self.reclaimer.claim())
+        self.assertEqual(([], []), self.reclaimer.claim())
+        self.assertEqual(2, self.reclaimer.failed_claims)
+        time.sleep(0.06)
+        self.assertFalse(self.reclaimer.is_due())
+        time.sleep(0.16)
+        self.assertTrue(self.reclaimer.is_due())
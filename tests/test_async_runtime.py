@@ -0,0 +1,100 @@
+import asyncio
+import threading
+from unittest import TestCase
+from unittest.mock import AsyncMock, MagicMock
+
+from scheduler.async_runtime import AsyncSchedulerRuntime, CollectingOutputStage
+
+
+class TestCollectingOutputStage(TestCase):
+
+    def test_take_should_return_and_clear_pending_msgs(self):
+        output_stage = CollectingOutputStage()
+        stream = MagicMock(key='sc1-data', default_write_kwargs={'maxlen': 10})
+        output_stage.add(stream, {'event': '{}'})
+        self.assertEqual([('sc1-data', {'maxlen': 10}, {'event': '{}'})], output_stage.take())
+        self.assertEqual([], output_stage.take())
+
+
+class TestAsyncSchedulerRuntime(TestCase):
+
+    def setUp(self):
+        self.service = MagicMock()
+        self.service.name = 'Scheduler'
+        self.service.service_stream.key = 'sc-data'
+        self.service.service_cmd_cg_keys_map = {'default': []}
+        self.service.metrics_report_interval = 0
+        self.service.ack_data_stream_events = True
+        self.redis_client = MagicMock()
+        self.pipeline = MagicMock()
+        self.pipeline.execute = AsyncMock()
+        self.redis_client.pipeline.return_value = self.pipeline
+        self.redis_client.xack = AsyncMock()
+        self.runtime = AsyncSchedulerRuntime(
+            self.service, self.redis_client, read_block_ms=1, write_concurrency=2, queue_size=2
+        )
+
+        def route_events(event_list):
+            stream = MagicMock(key='sc1-data', default_write_kwargs={})
+            for event_id, json_msg in event_list:
+                self.runtime.output_stage.add(stream, json_msg)
+        self.service.process_data_events.side_effect = route_events
+
+    def run_until_read(self, read_responses):
+        async def xreadgroup(*args, **kwargs):
+            if read_responses:
+                return read_responses.pop(0)
+            self.runtime.stop()
+            return []
+        self.redis_client.xreadgroup = xreadgroup
+        # own loop, so the default event loop used by the jaeger tracer of the other tests is left untouched
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(self.runtime.run())
+        finally:
+            loop.close()
+
+    def test_run_should_route_write_and_ack_read_events_before_stopping(self):
+        event_list = [(b'1-0', {b'event': b'{"id": 1}'}), (b'2-0', {b'event': b'{"id": 2}'})]
+        self.run_until_read([[[b'sc-data', event_list]]])
+
+        self.service.process_data_events.assert_called_once_with(event_list)
+        self.assertEqual(2, self.pipeline.xadd.call_count)
+        self.pipeline.xadd.assert_any_call('sc1-data', {b'event': b'{"id": 1}'})
+        self.redis_client.xack.assert_called_once_with('sc-data', 'cg-sc-data', b'1-0', b'2-0')
+
+    def test_run_should_ack_batch_without_outgoing_events(self):
+        self.service.process_data_events.side_effect = None
+        event_list = [(b'1-0', {b'event': b'{"id": 1}'})]
+        self.run_until_read([[[b'sc-data', event_list]]])
+
+        self.assertFalse(self.pipeline.execute.called)
+        self.redis_client.xack.assert_called_once_with('sc-data', 'cg-sc-data', b'1-0')
+
+    def test_run_should_not_ack_batch_when_write_fails(self):
+        self.pipeline.execute.side_effect = ConnectionError('down')
+        event_list = [(b'1-0', {b'event': b'{"id": 1}'})]
+        self.run_until_read([[[b'sc-data', event_list]]])
+
+        self.assertTrue(self.pipeline.execute.called)
+        self.assertFalse(self.redis_client.xack.called)
+
+    def test_split_by_writer_should_keep_destination_in_same_writer(self):
+        msgs = [('sc1-data', {}, 1), ('sc2-data', {}, 2), ('sc1-data', {}, 3)]
+        writer_msgs = self.runtime.split_by_writer(msgs)
+        sc1_writers = [index for index, msgs in enumerate(writer_msgs) if any(m[0] == 'sc1-data' for m in msgs)]
+        self.assertEqual(1, len(sc1_writers))
+        self.assertEqual([1, 3], [m[2] for m in writer_msgs[sc1_writers[0]] if m[0] == 'sc1-data'])
+
+    def test_run_should_process_commands_outside_event_loop_thread(self):
+        self.service.service_cmd_cg_keys_map = {'default': ['NewQuerySchedulingPlanned']}
+        loop_thread = threading.current_thread()
+        cmd_threads = []
+        self.service.process_event_type_wrapper.side_effect = lambda *args: cmd_threads.append(
+            threading.current_thread()
+        )
+        cmd_event = (b'1-0', {b'event': b'{"id": 1}'})
+        self.run_until_read([[[b'NewQuerySchedulingPlanned', [cmd_event]]]])
+
+        self.assertEqual(1, len(cmd_threads))
+        self.assertIsNot(loop_thread, cmd_threads[0])
@@ -0,0 +1,46 @@
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+from scheduler.backlog import DestinationBacklogView
+from scheduler.strategies.dataflow import Dataflow
+
+
+class TestDestinationBacklogView(TestCase):
+
+    def setUp(self):
+        self.redis_db = MagicMock()
+        self.pipeline = self.redis_db.pipeline.return_value
+        self.streams = {
+            'od1-data': MagicMock(key='od1-data', redis_db=self.redis_db),
+            'od2-data': MagicMock(key='od2-data', redis_db=self.redis_db),
+        }
+        self.backlog_view = DestinationBacklogView(self.streams.get, refresh_interval_ms=1000)
+        self.backlog_view.set_destinations(['od1-data'])
+
+    def test_refresh_should_read_pending_and_lag_in_one_pipeline(self):
+        self.pipeline.execute.return_value = [[{'name': 'cg-od1-data', 'pending': 3, 'lag': 4}]]
+        self.backlog_view.refresh()
+        self.redis_db.pipeline.assert_called_once_with(transaction=False)
+        self.pipeline.xinfo_groups.assert_called_once_with('od1-data')
+        self.assertEqual(7, self.backlog_view.get_backlog('od1-data'))
+
+    def test_refresh_should_ignore_missing_streams_and_lag(self):
+        self.backlog_view.set_destinations(['od1-data', 'od2-data'])
+        self.pipeline.execute.return_value = [Exception('no such key'), [{'pending': 2, 'lag': None}]]
+        self.backlog_view.refresh()
+        backlogs = {
+            destination: self.backlog_view.get_backlog(destination) for destination in self.backlog_view.destinations
+        }
+        self.assertEqual(2, sum(backlogs.values()))
+
+    def test_refresh_if_due_should_only_refresh_once_per_interval(self):
+        self.pipeline.execute.return_value = [[]]
+        self.backlog_view.refresh_if_due()
+        self.backlog_view.refresh_if_due()
+        self.assertEqual(1, self.pipeline.execute.call_count)
+
+    def test_record_sent_should_increase_cached_backlog_until_next_refresh(self):
+        dataflow = Dataflow([['od1-data', 'od2-data'], ['wm-data']])
+        self.backlog_view.record_sent(dataflow)
+        self.backlog_view.record_sent(Dataflow([['od1-data']]))
+        self.assertEqual(2, self.backlog_view.get_dataflow_backlog(dataflow))
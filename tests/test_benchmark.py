@@ -0,0 +1,23 @@
+from unittest import TestCase
+
+from scheduler.benchmark import generate_bufferstream_keys, generate_plan, parse_plan_sizes, run_benchmark_case
+
+
+class TestBenchmark(TestCase):
+
+    def test_generate_plan_should_have_cumulative_weights_ending_at_one(self):
+        keys = generate_bufferstream_keys(3)
+        plan = generate_plan('QQoS-W-HP-LS', keys, 4)
+        for dataflow_choices in plan['dataflows'].values():
+            self.assertEqual(4, len(dataflow_choices))
+            self.assertAlmostEqual(1.0, dataflow_choices[-1][1])
+
+    def test_parse_plan_sizes(self):
+        self.assertEqual([(10, 2), (100, 4)], parse_plan_sizes('10x2,100X4'))
+
+    def test_run_benchmark_case_should_route_all_events(self):
+        result = run_benchmark_case('QQoS-W-HP', 5, 2, 200, allocation_events=50)
+        self.assertEqual(200, result['written_events'])
+        self.assertGreater(result['events_per_sec'], 0)
+        self.assertLessEqual(result['latency_p50_us'], result['latency_p99_us'])
+        self.assertIn('net_blocks_per_event', result['allocations'])
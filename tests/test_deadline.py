@@ -0,0 +1,53 @@
+from unittest import TestCase
+
+from scheduler.deadline import DeadlineChecker, get_event_time_ms
+from scheduler.passthrough import extract_passthrough_event
+
+
+class TestDeadlineChecker(TestCase):
+
+    def setUp(self):
+        self.now_ms = 1700000010000
+        self.checker = DeadlineChecker(event_time_field='publish_time')
+        self.checker.update_budgets({'bf1': 500})
+
+    def test_get_event_time_ms_should_read_seconds_and_milliseconds(self):
+        self.assertEqual(1700000000500, get_event_time_ms({'publish_time': 1700000000.5}, 'publish_time'))
+        self.assertEqual(1700000000500, get_event_time_ms({'publish_time': 1700000000500}, 'publish_time'))
+        self.assertIsNone(get_event_time_ms({'publish_time': '2023-11-14'}, 'publish_time'))
+
+    def test_get_event_time_ms_should_read_passthrough_events(self):
+        event = extract_passthrough_event(
+            {b'event': b'{"id": "p-1", "buffer_stream_key": "bf1", "publish_time": 1700000000500}'}
+        )
+        self.assertEqual(1700000000500, get_event_time_ms(event, 'publish_time'))
+
+    def test_get_event_wait_ms_should_only_return_wait_over_budget(self):
+        self.assertEqual(
+            1000, self.checker.get_event_wait_ms('bf1', '1-0', {'publish_time': 1700000009000}, self.now_ms)
+        )
+        self.assertIsNone(self.checker.get_event_wait_ms('bf1', '1-0', {'publish_time': 1700000009600}, self.now_ms))
+
+    def test_get_event_wait_ms_should_use_entry_id_without_event_time(self):
+        self.assertEqual(2000, self.checker.get_event_wait_ms('bf1', '1700000008000-0', {}, self.now_ms))
+        self.assertIsNone(self.checker.get_event_wait_ms('bf1', 'not-an-entry-id', {}, self.now_ms))
+
+    def test_get_event_wait_ms_should_move_entry_id_time_to_local_clock(self):
+        # redis server clock 1.5s ahead of the local one
+        self.checker.sync_clock((1700000011, 500000), self.now_ms)
+        self.assertEqual(1500, self.checker.clock_offset_ms)
+        self.assertIsNone(self.checker.get_event_wait_ms('bf1', '1700000011500-0', {}, self.now_ms))
+        self.assertEqual(1000, self.checker.get_event_wait_ms('bf1', '1700000011500-0', {}, self.now_ms + 1000))
+
+    def test_get_event_wait_ms_should_use_default_budget_for_bufferstreams_without_one(self):
+        self.assertIsNone(self.checker.get_event_wait_ms('bf2', '1-0', {}, self.now_ms))
+        checker = DeadlineChecker(default_budget_ms=1000)
+        self.assertEqual(2000, checker.get_event_wait_ms('bf2', '1700000008000-0', {}, self.now_ms))
+
+    def test_update_budgets_should_activate_checker_only_with_budgets(self):
+        checker = DeadlineChecker()
+        self.assertFalse(checker.is_active)
+        checker.update_budgets({'bf1': 0})
+        self.assertFalse(checker.is_active)
+        checker.update_budgets({'bf1': 200})
+        self.assertTrue(checker.is_active)
@@ -0,0 +1,47 @@
+from unittest import TestCase
+
+from scheduler.dedup import DuplicateFilter, get_bloom_size
+
+
+class TestDuplicateFilter(TestCase):
+
+    def test_get_bloom_size_should_grow_with_capacity_and_lower_false_positive_rate(self):
+        bit_count, hash_count = get_bloom_size(1000, 0.01)
+        self.assertEqual((9586, 7), (bit_count, hash_count))
+        self.assertGreater(get_bloom_size(1000, 0.001)[0], bit_count)
+        self.assertGreater(get_bloom_size(2000, 0.01)[0], bit_count)
+
+    def test_is_duplicate_should_only_suppress_ids_already_seen(self):
+        duplicate_filter = DuplicateFilter(window_s=60, capacity=1000)
+        self.assertFalse(duplicate_filter.is_duplicate('publisher-1'))
+        self.assertFalse(duplicate_filter.is_duplicate('publisher-2'))
+        self.assertTrue(duplicate_filter.is_duplicate('publisher-1'))
+        self.assertEqual(1, duplicate_filter.get_state()['suppressed'])
+
+    def test_is_duplicate_should_remember_ids_of_previous_generation(self):
+        duplicate_filter = DuplicateFilter(window_s=60, capacity=1000)
+        duplicate_filter.is_duplicate('publisher-1')
+        duplicate_filter.rotated_at -= 60
+        self.assertTrue(duplicate_filter.is_duplicate('publisher-1'))
+        self.assertEqual(0, duplicate_filter.get_state()['current_ids'])
+
+    def test_is_duplicate_should_forget_ids_after_two_rotations(self):
+        duplicate_filter = DuplicateFilter(window_s=60, capacity=1000)
+        duplicate_filter.is_duplicate('publisher-1')
+        duplicate_filter.rotated_at -= 60
+        duplicate_filter.is_duplicate('publisher-2')
+        duplicate_filter.rotated_at -= 60
+        self.assertFalse(duplicate_filter.is_duplicate('publisher-1'))
+
+    def test_is_duplicate_should_rotate_when_generation_reaches_capacity(self):
+        duplicate_filter = DuplicateFilter(window_s=60, capacity=10)
+        for index in range(11):
+            duplicate_filter.is_duplicate(f'publisher-{index}')
+        state = duplicate_filter.get_state()
+        self.assertEqual((1, 10), (state['current_ids'], state['previous_ids']))
+
+    def test_is_duplicate_should_keep_false_positives_under_rate(self):
+        duplicate_filter = DuplicateFilter(window_s=60, capacity=10000, false_positive_rate=0.01)
+        for index in range(20000):
+            duplicate_filter.is_duplicate(f'publisher-{index}')
+        self.assertLess(duplicate_filter.get_state()['suppressed'], 200)
@@ -0,0 +1,53 @@
+from unittest import TestCase
+
+from scheduler.dispatch import FairDispatcher
+from scheduler.strategies.state import BufferstreamStateStore
+
+
+class TestFairDispatcher(TestCase):
+
+    def setUp(self):
+        self.dispatcher = FairDispatcher(BufferstreamStateStore())
+        self.data_flow = (('od-data',),)
+
+    def get_bufferstream_dataflows(self, event_counts):
+        return [
+            (buffer_stream_key, [f'{buffer_stream_key}-{index}' for index in range(count)], [self.data_flow] * count)
+            for buffer_stream_key, count in event_counts.items()
+        ]
+
+    def test_dispatch_should_interleave_bufferstreams_and_keep_their_order(self):
+        dispatched = self.dispatcher.dispatch(self.get_bufferstream_dataflows({'bf1': 3, 'bf2': 2}))
+        self.assertEqual(['bf1-0', 'bf2-0', 'bf1-1', 'bf2-1', 'bf1-2'], [event for _, event, _ in dispatched])
+        self.assertTrue(all(data_flow == self.data_flow for _, _, data_flow in dispatched))
+
+    def test_dispatch_should_serve_bufferstreams_by_weight(self):
+        self.dispatcher.update_weights({'bf1': 2})
+        dispatched = self.dispatcher.dispatch(self.get_bufferstream_dataflows({'bf1': 4, 'bf2': 2}))
+        self.assertEqual(['bf1-0', 'bf1-1', 'bf2-0', 'bf1-2', 'bf1-3', 'bf2-1'], [event for _, event, _ in dispatched])
+
+    def test_dispatch_should_shed_events_over_bufferstream_fair_share(self):
+        dispatched = self.dispatcher.dispatch(self.get_bufferstream_dataflows({'bf1': 8, 'bf2': 2}), shedding_rate=0.5)
+        forwarded = {'bf1': 0, 'bf2': 0}
+        for buffer_stream_key, _, data_flow in dispatched:
+            if data_flow is not None:
+                forwarded[buffer_stream_key] += 1
+        self.assertEqual({'bf1': 3, 'bf2': 2}, forwarded)
+
+    def test_dispatch_should_not_penalise_bufferstream_for_its_shed_events(self):
+        self.dispatcher.dispatch(self.get_bufferstream_dataflows({'bf1': 8, 'bf2': 2}), shedding_rate=0.5)
+        dispatched = self.dispatcher.dispatch(self.get_bufferstream_dataflows({'bf1': 2, 'bf2': 2}))
+        self.assertEqual(['bf1-0', 'bf2-0', 'bf1-1', 'bf2-1'], [event for _, event, _ in dispatched])
+
+    def test_dispatch_should_carry_budget_fraction_to_next_batches(self):
+        forwarded_count = 0
+        for _ in range(4):
+            dispatched = self.dispatcher.dispatch(self.get_bufferstream_dataflows({'bf1': 1}), shedding_rate=0.5)
+            forwarded_count += sum(1 for _, _, data_flow in dispatched if data_flow is not None)
+        self.assertEqual(2, forwarded_count)
+
+    def test_dispatch_should_pass_events_not_forwarded_through(self):
+        bufferstream_dataflows = [('bf1', ['bf1-0', 'bf1-1'], [None, []])]
+        dispatched = self.dispatcher.dispatch(bufferstream_dataflows, shedding_rate=0.5)
+        self.assertEqual([('bf1', 'bf1-0', None), ('bf1', 'bf1-1', [])], dispatched)
+        self.assertEqual(0, len(self.dispatcher.state_store))
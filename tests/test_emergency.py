@@ -0,0 +1,88 @@
+import time
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+from scheduler.emergency import (
+    EmergencyShedder,
+    get_entry_id_timestamp_ms,
+    EMERGENCY_SHEDDING_STARTED,
+    EMERGENCY_SHEDDING_STOPPED,
+)
+
+
+class TestEmergencyShedder(TestCase):
+
+    def setUp(self):
+        self.redis_db = MagicMock()
+        self.service_stream = MagicMock(key='sc-data', redis_db=self.redis_db)
+        self.load_shedder = MagicMock()
+        self.shedder = EmergencyShedder(
+            self.service_stream, self.load_shedder, lag_watermark=100, max_shedding_rate=0.9, exit_ratio=0.8
+        )
+
+    def set_lag(self, pending, lag):
+        self.redis_db.xinfo_groups.return_value = [
+            {'name': b'other-group', 'pending': 1000, 'lag': 1000},
+            {'name': b'cg-sc-data', 'pending': pending, 'lag': lag},
+        ]
+
+    def test_get_entry_id_timestamp_ms(self):
+        self.assertEqual(1526919030474, get_entry_id_timestamp_ms(b'1526919030474-55'))
+        self.assertIsNone(get_entry_id_timestamp_ms('not-an-entry-id'))
+        self.assertIsNone(get_entry_id_timestamp_ms(1))
+
+    def test_should_be_disabled_without_watermarks(self):
+        shedder = EmergencyShedder(self.service_stream, self.load_shedder)
+        self.assertFalse(shedder.enabled)
+
+    def test_check_should_start_shedding_the_excess_above_the_watermark(self):
+        self.set_lag(150, 250)
+        self.assertEqual(EMERGENCY_SHEDDING_STARTED, self.shedder.check())
+        self.assertTrue(self.shedder.is_active)
+        self.assertAlmostEqual(0.75, self.shedder.shedding_rate)
+        self.assertIsNone(self.shedder.check())
+
+    def test_check_should_cap_shedding_rate(self):
+        self.set_lag(0, 10000)
+        self.shedder.check()
+        self.assertEqual(0.9, self.shedder.shedding_rate)
+
+    def test_check_should_only_stop_shedding_below_exit_ratio(self):
+        self.set_lag(0, 200)
+        self.shedder.check()
+        self.set_lag(0, 90)
+        self.assertIsNone(self.shedder.check())
+        self.assertTrue(self.shedder.is_active)
+        self.assertEqual(0, self.shedder.shedding_rate)
+        self.set_lag(0, 50)
+        self.assertEqual(EMERGENCY_SHEDDING_STOPPED, self.shedder.check())
+        self.assertFalse(self.shedder.is_active)
+
+    def test_check_should_use_oldest_event_age(self):
+        shedder = EmergencyShedder(self.service_stream, self.load_shedder, age_watermark_ms=1000)
+        self.set_lag(0, 0)
+        shedder.record_oldest_event_id(f'{int(time.time() * 1000) - 4000}-0')
+        self.assertEqual(EMERGENCY_SHEDDING_STARTED, shedder.check())
+        self.assertGreaterEqual(shedder.oldest_event_age_ms, 4000)
+        self.assertEqual(EMERGENCY_SHEDDING_STOPPED, shedder.check())
+
+    def test_check_should_keep_state_when_lag_read_fails(self):
+        self.set_lag(0, 200)
+        self.shedder.check()
+        self.redis_db.xinfo_groups.side_effect = Exception('connection error')
+        self.assertIsNone(self.shedder.check())
+        self.assertTrue(self.shedder.is_active)
+
+    def test_is_shedding_event_should_use_load_shedder_with_shedding_rate(self):
+        self.assertFalse(self.shedder.is_shedding_event('bf1'))
+        self.set_lag(0, 200)
+        self.shedder.check()
+        self.load_shedder.is_shedding_event.return_value = True
+        self.assertTrue(self.shedder.is_shedding_event('bf1'))
+        self.load_shedder.is_shedding_event.assert_called_once_with('bf1', 0.5)
+
+    def test_is_check_due_should_wait_check_interval(self):
+        self.assertTrue(self.shedder.is_check_due())
+        self.set_lag(0, 0)
+        self.shedder.check()
+        self.assertFalse(self.shedder.is_check_due())
@@ -0,0 +1,52 @@
+from unittest import TestCase
+
+from scheduler.metrics import LatencyHistogram, SchedulerMetrics, get_dataflow_label
+from scheduler.plan import PlanSnapshot
+from scheduler.strategies.routing_table import RoutingTable
+
+
+class TestLatencyHistogram(TestCase):
+
+    def test_get_percentile_should_be_exact_for_small_values(self):
+        histogram = LatencyHistogram()
+        for value_us in range(1, 11):
+            histogram.record(value_us / 1000000)
+        self.assertEqual(5, histogram.get_percentile(50))
+        self.assertEqual(10, histogram.get_percentile(99))
+        self.assertEqual(10, histogram.max_us)
+
+    def test_get_percentile_should_be_within_relative_error_for_large_values(self):
+        histogram = LatencyHistogram()
+        for _ in range(99):
+            histogram.record(0.001)
+        histogram.record(2.5)
+        p50 = histogram.get_percentile(50)
+        self.assertLess(abs(p50 - 1000) / 1000, 0.07)
+        self.assertEqual(2500000, histogram.get_percentile(100))
+
+    def test_record_should_clamp_huge_values(self):
+        histogram = LatencyHistogram()
+        histogram.record(10 ** 9)
+        self.assertEqual(1, histogram.total_count)
+
+
+class TestSchedulerMetrics(TestCase):
+
+    def test_record_event_should_count_per_bufferstream_category_and_dataflow(self):
+        metrics = SchedulerMetrics()
+        routing_table = RoutingTable.from_plan_choices([[1.0, [['object-detection-data'], ['wm-data']]]])
+        metrics.register_plan(PlanSnapshot(1, 'QQoS-W-HP', None, {'bf1': routing_table}))
+        data_flow = routing_table.dataflows[0]
+
+        metrics.record_event('bf1', 'forwarded', data_flow)
+        metrics.record_event('bf1', 'forwarded', data_flow)
+        metrics.record_event('bf1', 'shed', None)
+        metrics.record_destination_event('object-detection-data')
+
+        stats = metrics.get_stats()
+        self.assertEqual({'forwarded': 2, 'shed': 1, 'no_plan': 0}, stats['bufferstreams']['bf1'])
+        self.assertEqual(2, stats['dataflows'][get_dataflow_label(data_flow)])
+        self.assertEqual({'object-detection-data': 1}, stats['destinations'])
+
+    def test_get_dataflow_label_should_join_stages(self):
+        self.assertEqual('od1+od2>wm', get_dataflow_label([['od1', 'od2'], ['wm']]))
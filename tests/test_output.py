@@ -0,0 +1,107 @@
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+from scheduler.output import DestinationStreamPool, GroupedOutputStage
+
+
+class TestDestinationStreamPool(TestCase):
+
+    def test_get_should_create_stream_only_once(self):
+        stream_factory = MagicMock()
+        pool = DestinationStreamPool(stream_factory)
+        pool.get('sc1-data')
+        pool.get('sc1-data')
+        stream_factory.create.assert_called_once_with('sc1-data', stype='streamOnly')
+
+    def test_retain_should_retire_streams_not_in_plan(self):
+        pool = DestinationStreamPool(MagicMock())
+        pool.get('sc1-data')
+        pool.get('sc2-data')
+        retired = pool.retain({'sc2-data'})
+        self.assertEqual({'sc1-data'}, retired)
+        self.assertEqual(1, len(pool))
+
+    def test_warm_up_should_create_missing_streams_without_changing_pool(self):
+        redis_db = MagicMock()
+        stream_factory = MagicMock()
+        stream_factory.create.side_effect = lambda destination, stype: MagicMock(key=destination, redis_db=redis_db)
+        pool = DestinationStreamPool(stream_factory)
+        sc1_stream = pool.get('sc1-data')
+
+        streams, failed_destinations = pool.warm_up(['sc1-data', 'sc2-data'])
+
+        self.assertIs(sc1_stream, streams['sc1-data'])
+        self.assertEqual('sc2-data', streams['sc2-data'].key)
+        self.assertEqual({}, failed_destinations)
+        redis_db.ping.assert_called_once_with()
+        self.assertEqual(1, len(pool))
+
+    def test_warm_up_should_leave_out_failed_destinations(self):
+        stream_factory = MagicMock()
+        stream_factory.create.side_effect = ConnectionError('refused')
+        pool = DestinationStreamPool(stream_factory)
+        streams, failed_destinations = pool.warm_up(['sc1-data'])
+        self.assertEqual({}, streams)
+        self.assertEqual(['sc1-data'], list(failed_destinations.keys()))
+
+    def test_install_should_swap_streams_and_return_retired(self):
+        pool = DestinationStreamPool(MagicMock())
+        pool.get('sc1-data')
+        pool.get('sc2-data')
+        sc3_stream = MagicMock()
+        retired = pool.install({'sc2-data': pool.get('sc2-data'), 'sc3-data': sc3_stream})
+        self.assertEqual({'sc1-data'}, retired)
+        self.assertIs(sc3_stream, pool.get('sc3-data'))
+
+    def test_install_should_keep_plan_streams_created_since_warm_up(self):
+        pool = DestinationStreamPool(MagicMock())
+        streams, _ = pool.warm_up(['sc1-data'])
+        sc2_stream = pool.get('sc2-data')
+        pool.get('sc3-data')
+        retired = pool.install(streams, ['sc1-data', 'sc2-data'])
+        self.assertEqual({'sc3-data'}, retired)
+        self.assertIs(sc2_stream, pool.get('sc2-data'))
+
+    def test_warm_up_should_leave_out_destinations_after_timeout(self):
+        pool = DestinationStreamPool(MagicMock())
+        streams, failed_destinations = pool.warm_up(['sc1-data', 'sc2-data'], timeout_s=0)
+        self.assertEqual({}, streams)
+        self.assertEqual(['sc1-data', 'sc2-data'], list(failed_destinations.keys()))
+
+
+class TestGroupedOutputStage(TestCase):
+
+    def test_add_should_flush_all_destinations_in_one_pipeline_when_batch_is_full(self):
+        redis_db = MagicMock()
+        pipeline = redis_db.pipeline.return_value
+        stream1 = MagicMock(key='sc1-data', redis_db=redis_db, default_write_kwargs={})
+        stream2 = MagicMock(key='sc2-data', redis_db=redis_db, default_write_kwargs={})
+        output_stage = GroupedOutputStage(max_batch_size=3, max_delay_ms=1000, logger=MagicMock())
+
+        output_stage.add(stream1, {'event': '1'})
+        output_stage.add(stream2, {'event': '2'})
+        self.assertFalse(pipeline.execute.called)
+        output_stage.add(stream1, {'event': '3'})
+
+        redis_db.pipeline.assert_called_once_with(transaction=False)
+        self.assertEqual(3, pipeline.xadd.call_count)
+        pipeline.xadd.assert_any_call('sc1-data', {'event': '3'})
+        pipeline.execute.assert_called_once_with()
+        self.assertEqual(0, output_stage.pending_count)
+
+    def test_flush_if_due_should_flush_after_max_delay(self):
+        stream = MagicMock(key='sc1-data', redis_db=None)
+        output_stage = GroupedOutputStage(max_batch_size=10, max_delay_ms=0, logger=MagicMock())
+        output_stage.add(stream, {'event': '1'})
+        output_stage.add(stream, {'event': '2'})
+
+        output_stage.flush_if_due()
+        stream.write_events.assert_called_once_with({'event': '1'}, {'event': '2'})
+
+    def test_flush_if_due_should_wait_for_max_delay(self):
+        stream = MagicMock(key='sc1-data', redis_db=None)
+        output_stage = GroupedOutputStage(max_batch_size=10, max_delay_ms=10000, logger=MagicMock())
+        output_stage.add(stream, {'event': '1'})
+
+        output_stage.flush_if_due()
+        self.assertFalse(stream.write_events.called)
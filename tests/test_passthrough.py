@@ -0,0 +1,82 @@
+import json
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+from scheduler.passthrough import PassthroughEncoder, extract_passthrough_event, get_field_value, splice_fields
+
+
+class TestExtractPassthroughEvent(TestCase):
+
+    def test_should_extract_routing_fields_without_decoding_payload(self):
+        event_json = json.dumps({'id': 'pub:1', 'buffer_stream_key': 'bf1', 'vekg': {'nodes': ['a']}}).encode('utf-8')
+        event = extract_passthrough_event({b'event': event_json})
+        self.assertEqual('pub:1', event.id)
+        self.assertEqual('bf1', event.buffer_stream_key)
+        self.assertIs(event_json, event.event_json)
+
+    def test_should_ignore_field_names_inside_string_values(self):
+        event_json = json.dumps({'id': 1, 'buffer_stream_key': 'bf1', 'note': '{"buffer_stream_key": "bf2"}'})
+        event = extract_passthrough_event({b'event': event_json.encode('utf-8')})
+        self.assertEqual('bf1', event.buffer_stream_key)
+
+    def test_should_return_none_when_top_level_field_is_ambiguous(self):
+        event_json = json.dumps({'id': 1, 'buffer_stream_key': 'bf1', 'nested': {'buffer_stream_key': 'bf2'}})
+        self.assertIsNone(extract_passthrough_event({b'event': event_json.encode('utf-8')}))
+
+    def test_should_return_none_when_event_already_has_routing_fields(self):
+        event_json = json.dumps({'id': 1, 'buffer_stream_key': 'bf1', 'data_path': ['a']})
+        self.assertIsNone(extract_passthrough_event({b'event': event_json.encode('utf-8')}))
+
+    def test_should_return_none_without_id(self):
+        event_json = json.dumps({'buffer_stream_key': 'bf1'})
+        self.assertIsNone(extract_passthrough_event({b'event': event_json.encode('utf-8')}))
+
+    def test_should_return_none_when_id_is_only_nested(self):
+        event_json = json.dumps({'buffer_stream_key': 'bf1', 'vekg': {'id': 1}, 'note': 'id'})
+        self.assertIsNone(extract_passthrough_event({b'event': event_json.encode('utf-8')}))
+
+    def test_should_keep_id_unset_when_it_is_also_nested(self):
+        event_json = json.dumps({'vekg': {'id': 2}, 'id': 1, 'buffer_stream_key': 'bf1'})
+        event = extract_passthrough_event({b'event': event_json.encode('utf-8')})
+        self.assertIsNone(event.id)
+        self.assertEqual('bf1', event.buffer_stream_key)
+
+    def test_should_return_none_when_event_is_not_an_object(self):
+        event_json = json.dumps([{'id': 1, 'buffer_stream_key': 'bf1'}])
+        self.assertIsNone(extract_passthrough_event({b'event': event_json.encode('utf-8')}))
+
+    def test_get_field_value_should_ignore_nested_fields(self):
+        event_json = json.dumps({'nested': {'a': 1}, 'b': '{"a": 2}'}).encode('utf-8')
+        self.assertIsNone(get_field_value(event_json, b'"a"'))
+
+    def test_get_field_value_should_parse_full_numbers(self):
+        event_json = json.dumps({'a': 1700000000.25, 'b': -3, 'c': 1e3, 'd': 12}).encode('utf-8')
+        self.assertEqual(1700000000.25, get_field_value(event_json, b'"a"'))
+        self.assertEqual(-3, get_field_value(event_json, b'"b"'))
+        self.assertEqual(1000.0, get_field_value(event_json, b'"c"'))
+        self.assertIsInstance(get_field_value(event_json, b'"d"'), int)
+
+
+class TestPassthroughEncoder(TestCase):
+
+    def test_splice_fields_should_handle_empty_objects(self):
+        self.assertEqual({'a': 1}, json.loads(splice_fields(b'{ }', b'"a": 1')))
+        self.assertEqual({'b': 2, 'a': 1}, json.loads(splice_fields(b'{"b": 2}\n', b'"a": 1')))
+
+    def test_encode_should_splice_routing_fields_into_original_event(self):
+        encoder = PassthroughEncoder()
+        event_data = {'id': 1, 'buffer_stream_key': 'bf1', 'tracer': {'headers': {'uber-trace-id': 'abc'}}}
+        event = extract_passthrough_event({b'event': json.dumps(event_data).encode('utf-8')})
+        data_flow = [['object-detection-data'], ['wm-data']]
+
+        event_msg = encoder.encode(event, data_flow, 3)
+
+        event_data.update({'data_flow': data_flow, 'data_path': [], 'plan_version': 3})
+        self.assertEqual(event_data, json.loads(event_msg['event']))
+
+    def test_register_plan_should_report_unavailable_codecs(self):
+        encoder = PassthroughEncoder()
+        plan = MagicMock(options={'stream_codecs': {'wm-data': 'unknown', 'od-data': 'json'}})
+        self.assertEqual({'wm-data': 'unknown'}, encoder.register_plan(plan))
+        self.assertEqual('json', encoder.get_stream_codec('wm-data'))
+        self.assertIsNone(encoder.get_stream_serializer('wm-data'))
@@ -0,0 +1,56 @@
+from unittest import TestCase
+
+from scheduler.ratelimit import DestinationRateLimiter, SHED_OVERFLOW
+from scheduler.strategies.routing_table import RoutingTable
+
+
+class TestDestinationRateLimiter(TestCase):
+
+    def setUp(self):
+        self.routing_table = RoutingTable.from_plan_choices([
+            [0.7, [['od-data'], ['wm-data']]],
+            [1.0, [['od-gpu-data'], ['wm-data']]],
+        ])
+        self.data_flow, self.alternative_data_flow = self.routing_table.dataflows
+        self.rate_limiter = DestinationRateLimiter(burst_s=1.0)
+
+    def test_limit_should_admit_events_within_burst(self):
+        self.rate_limiter.update({'od-data': 2}, now=0)
+        self.assertEqual((self.data_flow, None), self.rate_limiter.limit(self.routing_table, self.data_flow, 0))
+        self.assertEqual((self.data_flow, None), self.rate_limiter.limit(self.routing_table, self.data_flow, 0))
+        self.assertEqual(0, self.rate_limiter.buckets['od-data'].tokens)
+
+    def test_limit_should_redirect_over_budget_events_to_alternative_dataflow(self):
+        self.rate_limiter.update({'od-data': 1}, now=0)
+        self.rate_limiter.limit(self.routing_table, self.data_flow, 0)
+        self.assertEqual(
+            (self.alternative_data_flow, 'od-data'), self.rate_limiter.limit(self.routing_table, self.data_flow, 0)
+        )
+
+    def test_limit_should_shed_over_budget_events_without_alternative(self):
+        self.rate_limiter.update({'od-data': 1, 'od-gpu-data': 1}, now=0)
+        self.rate_limiter.limit(self.routing_table, self.data_flow, 0)
+        self.rate_limiter.limit(self.routing_table, self.alternative_data_flow, 0)
+        self.assertEqual((None, 'od-data'), self.rate_limiter.limit(self.routing_table, self.data_flow, 0))
+
+    def test_limit_should_shed_over_budget_events_with_shed_overflow(self):
+        rate_limiter = DestinationRateLimiter(burst_s=1.0, overflow=SHED_OVERFLOW)
+        rate_limiter.update({'od-data': 1}, now=0)
+        rate_limiter.limit(self.routing_table, self.data_flow, 0)
+        self.assertEqual((None, 'od-data'), rate_limiter.limit(self.routing_table, self.data_flow, 0))
+
+    def test_limit_should_refill_tokens_at_destination_capacity(self):
+        self.rate_limiter.update({'od-data': 10}, now=0)
+        for _ in range(10):
+            self.rate_limiter.limit(self.routing_table, self.data_flow, 0)
+        self.assertEqual('od-data', self.rate_limiter.limit(self.routing_table, self.data_flow, 0.05)[1])
+        self.assertIsNone(self.rate_limiter.limit(self.routing_table, self.data_flow, 0.1)[1])
+
+    def test_update_should_keep_tokens_left_and_apply_capacity_share(self):
+        rate_limiter = DestinationRateLimiter(burst_s=0.5, capacity_share=0.5)
+        rate_limiter.update({'od-data': 20, 'wm-data': 0}, now=0)
+        rate_limiter.buckets['od-data'].tokens = 1
+        rate_limiter.update({'od-data': 40}, now=0)
+        bucket = rate_limiter.buckets['od-data']
+        self.assertEqual((20, 10, 1), (bucket.rate, bucket.burst, bucket.tokens))
+        self.assertNotIn('wm-data', rate_limiter.buckets)
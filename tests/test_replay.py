@@ -0,0 +1,82 @@
+import json
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+from scheduler.replay import SimulatedWorker, adapt_strategy_plan, export_redis_trace, run_replay_case, run_sweep
+
+
+def plan_record(time, strategy_name, dataflows):
+    execution_plan = {'strategy': {'name': strategy_name, 'dataflows': dataflows}}
+    return {'type': 'plan', 'time': time, 'event': {'id': f'plan-{time}', 'plan': {'execution_plan': execution_plan}}}
+
+
+def event_record(time, event_id, buffer_stream_key):
+    return {'type': 'event', 'time': time, 'event': {'id': event_id, 'buffer_stream_key': buffer_stream_key}}
+
+
+class TestReplay(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.trace_path = os.path.join(self.tmp_dir.name, 'trace.jsonl')
+        records = [event_record(0, 'early', 'bf1')]
+        records.append(plan_record(0, 'QQoS-W-HP-LS', {
+            'bf1': [[0.5, 0.25, [['od1-data'], ['wm-data']]], [0.0, 1.0, [['od2-data'], ['wm-data']]]],
+        }))
+        records.extend(event_record(i / 100, f'e{i}', 'bf1') for i in range(1, 2001))
+        with open(self.trace_path, 'w') as trace_file:
+            for record in records:
+                trace_file.write(json.dumps(record) + '\n')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_simulated_worker_should_queue_events_over_capacity(self):
+        worker = SimulatedWorker(capacity=10)
+        self.assertAlmostEqual(0.1, worker.process(0))
+        self.assertAlmostEqual(0.2, worker.process(0))
+        self.assertAlmostEqual(0.15, worker.total_delay / worker.events)
+        self.assertAlmostEqual(1.1, worker.process(1.0))
+
+    def test_adapt_strategy_plan_should_convert_load_shedding_entries(self):
+        strategy_plan = {'name': 'QQoS-W-HP', 'dataflows': {'bf1': [[1.0, [['od1-data']]]]}}
+        adapted_plan = adapt_strategy_plan(strategy_plan, 'QQoS-TK-LP-LS')
+        self.assertEqual({'name': 'QQoS-TK-LP-LS', 'dataflows': {'bf1': [[0.0, 1.0, [['od1-data']]]]}}, adapted_plan)
+        self.assertEqual(strategy_plan, adapt_strategy_plan(adapted_plan, 'QQoS-W-HP'))
+
+    def test_run_replay_case_should_report_shed_fraction_split_and_worker_load(self):
+        result = run_replay_case(self.trace_path, capacities={'od1-data': 10, 'od2-data': 200})
+        self.assertEqual(2001, result['events'])
+        self.assertEqual(1, result['no_plan_events'])
+        self.assertAlmostEqual(0.125, result['target_shed_fraction'])
+        self.assertAlmostEqual(0.125, result['shed_fraction'], delta=0.04)
+        self.assertLess(result['split_error'], 0.05)
+        self.assertGreater(result['workers']['od1-data']['utilization'], 0.9)
+        self.assertLess(result['workers']['od2-data']['utilization'], 0.5)
+        self.assertEqual(0, result['workers']['wm-data']['utilization'])
+
+    def test_run_sweep_should_run_each_strategy_and_capacity_scale(self):
+        strategies = ['QQoS-TK-LP', 'smooth_weighted_round_robin']
+        results = run_sweep(self.trace_path, strategies, [1.0, 2.0], max_events=100)
+        self.assertEqual(
+            [(strategy_name, scale) for strategy_name in strategies for scale in [1.0, 2.0]],
+            [(result['strategy'], result['capacity_scale']) for result in results]
+        )
+        self.assertEqual(0.75, results[0]['split_error'])
+        self.assertLess(results[2]['split_error'], 0.02)
+
+    def test_export_redis_trace_should_merge_streams_by_entry_time(self):
+        redis_db = MagicMock()
+        streams = {
+            'data': [(b'2000-0', {b'event': b'{"id": 1, "buffer_stream_key": "bf1"}'})],
+            'plans': [(b'1000-0', {b'event': b'{"id": 2, "plan": {}}'})],
+        }
+        redis_db.xrange.side_effect = lambda key, min, max, count: [] if min.startswith('(') else streams[key]
+        output_path = os.path.join(self.tmp_dir.name, 'exported.jsonl')
+
+        self.assertEqual(2, export_redis_trace(redis_db, output_path, 'data', ['plans']))
+        with open(output_path) as exported_file:
+            records = [json.loads(line) for line in exported_file]
+        self.assertEqual([('plan', 1.0), ('event', 2.0)], [(record['type'], record['time']) for record in records])
@@ -0,0 +1,27 @@
+from unittest import TestCase
+
+from scheduler.sampling import TraceSampler, get_routing_category, FORWARDED_EVENT, SHED_EVENT, NO_PLAN_EVENT
+
+
+class TestTraceSampler(TestCase):
+
+    def test_get_routing_category_should_categorize_dataflows(self):
+        self.assertEqual(SHED_EVENT, get_routing_category(None))
+        self.assertEqual(NO_PLAN_EVENT, get_routing_category([]))
+        self.assertEqual(FORWARDED_EVENT, get_routing_category([['object-detection-data']]))
+
+    def test_is_sampled_should_sample_all_categories_by_default(self):
+        sampler = TraceSampler()
+        for category in (FORWARDED_EVENT, SHED_EVENT, NO_PLAN_EVENT):
+            self.assertTrue(sampler.is_sampled(category))
+
+    def test_is_sampled_should_use_category_rate(self):
+        sampler = TraceSampler({SHED_EVENT: 0})
+        self.assertFalse(sampler.is_sampled(SHED_EVENT))
+        self.assertTrue(sampler.is_sampled(FORWARDED_EVENT))
+
+    def test_update_should_keep_rates_of_categories_not_informed(self):
+        sampler = TraceSampler({SHED_EVENT: 0, FORWARDED_EVENT: 0.5})
+        sampler.update({FORWARDED_EVENT: 2, 'unknown': 0})
+        self.assertEqual(1.0, sampler.sampling_rates[FORWARDED_EVENT])
+        self.assertEqual(0.0, sampler.sampling_rates[SHED_EVENT])
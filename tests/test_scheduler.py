@@ -1,8 +1,13 @@
-from unittest.mock import patch, MagicMock
+import json
+import os
+import tempfile
+import time
+from unittest.mock import ANY, patch, MagicMock
 
 from event_service_utils.tests.base_test_case import MockedEventDrivenServiceStreamTestCase
 from event_service_utils.tests.json_msg_helper import prepare_event_msg_tuple
 
+from scheduler.plan import PlanSnapshot
 from scheduler.service import Scheduler
 
 from scheduler.conf import (
@@ -132,3 +137,536 @@ class TestScheduler(MockedEventDrivenServiceStreamTestCase):
     #     altered_event = self.service.apply_dataflow_to_event(event_data)
     #     self.assertEqual(altered_event, None)
     #     self.assertTrue(event_trace_mock.called)
+
+    def test_get_bufferstream_dataflows_should_use_current_plan(self):
+        self.service.current_plan = MagicMock()
+        self.service.get_bufferstream_dataflows('bf-key', 3)
+        self.service.current_plan.get_bufferstream_dataflows.assert_called_once_with('bf-key', 3)
+
+    @patch('scheduler.service.Scheduler.route_data_event_wrapper')
+    def test_process_data_should_group_batch_by_bufferstream(self, mocked_route):
+        self.service.data_batch_size = 10
+        self.service.service_stream.ack = MagicMock()
+        self.service.current_plan = MagicMock(version=4)
+        self.service.current_plan.get_event_dataflows.side_effect = lambda key, events: [[[key]]] * len(events)
+        event_list = [
+            prepare_event_msg_tuple({'id': 1, 'buffer_stream_key': 'bf1'}),
+            prepare_event_msg_tuple({'id': 2, 'buffer_stream_key': 'bf2'}),
+            prepare_event_msg_tuple({'id': 3, 'buffer_stream_key': 'bf1'}),
+        ]
+        self.service.service_stream.mocked_values.extend(event_list)
+
+        self.service.process_data()
+
+        self.service.current_plan.get_event_dataflows.assert_any_call(
+            'bf1', [{'id': 1, 'buffer_stream_key': 'bf1'}, {'id': 3, 'buffer_stream_key': 'bf1'}]
+        )
+        self.service.current_plan.get_event_dataflows.assert_any_call('bf2', [{'id': 2, 'buffer_stream_key': 'bf2'}])
+        self.assertEqual(3, mocked_route.call_count)
+        self.assertIn(
+            ({'id': 3, 'buffer_stream_key': 'bf1'}, [['bf1']], 4), [c[0][:3] for c in mocked_route.call_args_list]
+        )
+        self.assertEqual(3, self.service.service_stream.ack.call_count)
+
+    def test_route_data_event_should_send_event_with_selected_dataflow(self):
+        self.service.send_event_to_first_service_in_dataflow = MagicMock()
+        event_data = {'id': 1, 'buffer_stream_key': 'bf1'}
+        self.service.route_data_event(event_data, [['object-detection-data'], ['wm-data']], 2)
+        self.service.send_event_to_first_service_in_dataflow.assert_called_once_with({
+            'id': 1,
+            'buffer_stream_key': 'bf1',
+            'data_flow': [['object-detection-data'], ['wm-data']],
+            'data_path': [],
+            'plan_version': 2,
+        }, True)
+
+    def test_execute_adaptive_plan_should_retire_destination_streams_not_in_plan(self):
+        self.service.get_destination_streams('old-data')
+        self.service.execute_adaptive_plan({
+            'name': 'QQoS-W-HP',
+            'dataflows': {
+                'bf1': [[1.0, [['object-detection-data'], ['wm-data']]]],
+            }
+        })
+        self.service.get_destination_streams('object-detection-data')
+        self.assertEqual({'object-detection-data'}, set(self.service.destination_streams.streams.keys()))
+
+    def test_execute_adaptive_plan_should_warm_up_first_hop_destination_streams(self):
+        self.service.stream_factory.create = MagicMock(side_effect=lambda key, stype: MagicMock(key=key, redis_db=None))
+        self.service.execute_adaptive_plan({
+            'name': 'QQoS-W-HP',
+            'dataflows': {
+                'bf1': [[1.0, [['object-detection-data', 'color-detection-data'], ['wm-data']]]],
+            }
+        })
+        self.assertEqual(
+            {'object-detection-data', 'color-detection-data'}, set(self.service.destination_streams.streams.keys())
+        )
+        self.assertGreater(self.service.plan_warm_up_ms, 0)
+
+    def test_setup_plan_snapshot_should_restore_last_plan_and_strategy_state(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            plan_snapshot_path = os.path.join(tmp_dir, 'plan-snapshot.json')
+            self.service.setup_plan_snapshot(plan_snapshot_path)
+            self.service.execute_adaptive_plan({
+                'name': 'round_robin',
+                'dataflows': {
+                    'bf1': [[0, [['od1-data'], ['wm-data']]], [0, [['od2-data'], ['wm-data']]]],
+                }
+            })
+            self.service.get_bufferstream_dataflow('bf1')
+            self.service.save_plan_snapshot(self.service.current_plan)
+
+            self.service.setup_scheduling_strategies('round_robin')
+            self.assertEqual(0, self.service.current_plan.version)
+            self.service.setup_plan_snapshot(plan_snapshot_path)
+
+        self.assertEqual(1, self.service.current_plan.version)
+        self.assertEqual('round_robin', self.service.current_plan.strategy_name)
+        self.assertEqual((('od2-data',), ('wm-data',)), self.service.get_bufferstream_dataflow('bf1'))
+
+    def test_setup_scheduling_strategies_should_use_default_strategy(self):
+        self.service.setup_scheduling_strategies('round_robin')
+        self.assertEqual('round_robin', self.service.current_plan.strategy_name)
+        self.service.setup_scheduling_strategies('unknown-strategy')
+        self.assertEqual('QQoS-W-HP', self.service.current_plan.strategy_name)
+
+    def test_install_compiled_plan_should_switch_strategy_and_plan_version(self):
+        strategy = self.service.scheduling_strategies['round_robin']
+        routing_tables = strategy.compile_routing_tables({
+            'name': 'round_robin',
+            'dataflows': {
+                'bf1': [[0, [['object-detection-data'], ['wm-data']]]],
+            }
+        })
+        self.service.install_compiled_plan(PlanSnapshot(3, 'round_robin', strategy, routing_tables))
+        self.assertEqual(strategy, self.service.current_strategy)
+        self.assertEqual(3, self.service.current_plan.version)
+        self.assertEqual(
+            (('object-detection-data',), ('wm-data',)), self.service.get_bufferstream_dataflow('bf1')
+        )
+
+    def test_install_compiled_plan_should_retire_states_of_removed_bufferstreams(self):
+        self.service.execute_adaptive_plan({
+            'name': 'round_robin',
+            'dataflows': {
+                'bf1': [[0, [['od-data']]], [0, [['od2-data']]]],
+                'bf2': [[0, [['od-data']]]],
+            }
+        })
+        self.service.get_bufferstream_dataflow('bf1')
+        self.service.get_bufferstream_dataflow('bf2')
+        self.service.execute_adaptive_plan({
+            'name': 'round_robin',
+            'dataflows': {
+                'bf1': [[0, [['od-data']]], [0, [['od2-data']]]],
+            }
+        })
+        self.assertEqual(['bf1'], [key for key, state in self.service.bufferstream_states.items()])
+        self.assertEqual(1, self.service.bufferstream_states.get('bf1').round_robin_index)
+
+    def test_install_compiled_plan_should_release_previous_strategy_routing_tables(self):
+        self.service.execute_adaptive_plan({
+            'name': 'round_robin',
+            'dataflows': {
+                'bf1': [[0, [['od-data']]]],
+            }
+        })
+        self.service.execute_adaptive_plan({
+            'name': 'QQoS-TK-LP',
+            'dataflows': {
+                'bf2': [[1.0, [['od-data']]]],
+            }
+        })
+        self.assertEqual({}, self.service.scheduling_strategies['round_robin'].bufferstream_routing_tables)
+        self.assertEqual(['bf2'], list(self.service.current_strategy.bufferstream_routing_tables.keys()))
+
+    def test_execute_adaptive_plan_should_fail_when_data_workers_do_not_stage_plan(self):
+        self.service.plan_broadcaster = MagicMock()
+        self.service.plan_broadcaster.broadcast.return_value = False
+        with self.assertRaises(RuntimeError):
+            self.service.execute_adaptive_plan({'name': 'QQoS-W-HP', 'dataflows': {}})
+
+    def test_execute_adaptive_plan_should_keep_previous_plan_when_broadcast_aborts(self):
+        self.service.execute_adaptive_plan({'name': 'QQoS-W-HP', 'dataflows': {'bf1': [[1.0, [['od-data']]]]}})
+        previous_plan = self.service.current_plan
+        self.service.plan_broadcaster = MagicMock()
+        self.service.plan_broadcaster.broadcast.return_value = False
+        with self.assertRaises(RuntimeError):
+            self.service.execute_adaptive_plan({'name': 'QQoS-W-HP', 'dataflows': {'bf2': [[1.0, [['od-data']]]]}})
+        self.assertIs(previous_plan, self.service.current_plan)
+        self.assertEqual(['bf1'], list(self.service.current_strategy.bufferstream_routing_tables.keys()))
+
+    def test_execute_adaptive_plan_should_not_reuse_aborted_plan_version(self):
+        self.service.plan_broadcaster = MagicMock()
+        self.service.plan_broadcaster.broadcast.return_value = False
+        with self.assertRaises(RuntimeError):
+            self.service.execute_adaptive_plan({'name': 'QQoS-W-HP', 'dataflows': {'bf1': [[1.0, [['od-data']]]]}})
+        aborted_version = self.service.plan_broadcaster.broadcast.call_args[0][0].version
+        self.service.plan_broadcaster.broadcast.return_value = True
+        self.service.execute_adaptive_plan({'name': 'QQoS-W-HP', 'dataflows': {'bf1': [[1.0, [['od-data']]]]}})
+        self.assertEqual(aborted_version + 1, self.service.current_plan.version)
+
+    def test_execute_adaptive_plan_should_publish_new_plan_version(self):
+        previous_plan = self.service.current_plan
+        self.service.execute_adaptive_plan({
+            'name': 'QQoS-TK-LP',
+            'dataflows': {
+                'bf1': [[1.0, [['object-detection-data'], ['wm-data']]]],
+            }
+        })
+        self.assertEqual(previous_plan.version + 1, self.service.current_plan.version)
+        self.assertEqual('QQoS-TK-LP', self.service.current_plan.strategy_name)
+        self.assertIs(self.service.scheduling_strategies['QQoS-TK-LP'], self.service.current_strategy)
+
+    def test_apply_dataflow_to_event_should_stamp_plan_version(self):
+        self.service.execute_adaptive_plan({
+            'name': 'QQoS-TK-LP',
+            'dataflows': {
+                'bf1': [[1.0, [['object-detection-data'], ['wm-data']]]],
+            }
+        })
+        event_data = self.service.apply_dataflow_to_event({'id': 1, 'buffer_stream_key': 'bf1'})
+        self.assertEqual(self.service.current_plan.version, event_data['plan_version'])
+
+    def test_route_data_event_wrapper_should_skip_tracing_for_unsampled_events(self):
+        self.service.trace_sampler.update({'forwarded': 0})
+        self.service.event_trace_for_method_with_event_data = MagicMock()
+        destination_stream = MagicMock()
+        self.service.get_destination_streams = MagicMock(return_value=destination_stream)
+        event_data = {'id': 1, 'buffer_stream_key': 'bf1', 'tracer': {'headers': {'uber-trace-id': 'abc'}}}
+
+        self.service.route_data_event_wrapper(event_data, [['object-detection-data'], ['wm-data']], 1)
+
+        self.assertFalse(self.service.event_trace_for_method_with_event_data.called)
+        self.assertEqual(1, destination_stream.write_events.call_count)
+        self.assertIn('uber-trace-id', destination_stream.write_events.call_args[0][0]['event'])
+
+    def test_route_data_event_wrapper_should_trace_sampled_events(self):
+        self.service.event_trace_for_method_with_event_data = MagicMock()
+        event_data = {'id': 1, 'buffer_stream_key': 'bf1'}
+
+        self.service.route_data_event_wrapper(event_data, None, 1)
+
+        self.assertTrue(self.service.event_trace_for_method_with_event_data.called)
+        tracer_tags = self.service.event_trace_for_method_with_event_data.call_args[1]['tracer_tags']
+        self.assertEqual('shed', tracer_tags['routing-category'])
+
+    def test_route_data_event_wrapper_should_open_single_span_for_sampled_shed_events(self):
+        self.service.event_trace_for_method_with_event_data = MagicMock(
+            side_effect=lambda method, method_args, method_kwargs, **kwargs: method(*method_args, **method_kwargs)
+        )
+        self.service.route_data_event_wrapper({'id': 1, 'buffer_stream_key': 'bf1'}, None, 1)
+        self.assertEqual(1, self.service.event_trace_for_method_with_event_data.call_count)
+
+    def test_process_adaptive_plan_should_update_trace_sampling_rates(self):
+        self.service.publish_scheduling_plan_executed = MagicMock()
+        self.service.process_adaptive_plan({
+            'plan': {
+                'execution_plan': {
+                    'strategy': {'name': 'QQoS-W-HP', 'dataflows': {}},
+                    'trace_sampling': {'shed': 0.1},
+                }
+            }
+        })
+        self.assertEqual(0.1, self.service.trace_sampler.sampling_rates['shed'])
+
+    def test_route_data_event_should_record_metrics(self):
+        self.service.send_event_to_first_service_in_dataflow = MagicMock()
+        self.service.route_data_event({'id': 1, 'buffer_stream_key': 'bf1'}, None, 1)
+        stats = self.service.metrics.get_stats()
+        self.assertEqual(1, stats['bufferstreams']['bf1']['shed'])
+        self.assertEqual(1, stats['routing_latency']['count'])
+        self.assertEqual(0, stats['write_latency']['count'])
+
+    def test_publish_scheduler_stats_reported_should_publish_current_stats(self):
+        self.service.publish_event_type_to_stream = MagicMock()
+        self.service.publish_scheduler_stats_reported()
+        kwargs = self.service.publish_event_type_to_stream.call_args[1]
+        self.assertEqual('SchedulerStatsReported', kwargs['event_type'])
+        self.assertIn('routing_latency', kwargs['new_event_data']['stats'])
+
+    @patch('scheduler.service.start_metrics_scrape_endpoint')
+    def test_start_metrics_reporting_should_use_own_port_and_label_per_data_worker(self, mocked_start_endpoint):
+        self.service.setup_metrics({'scrape_port': 9100})
+        self.service.start_metrics_reporting(worker_index=2)
+        mocked_start_endpoint.assert_called_once_with(self.service.metrics, f'{self.service.name}-worker-2', 9102)
+
+        self.service.publish_event_type_to_stream = MagicMock()
+        self.service.publish_scheduler_stats_reported()
+        self.assertEqual(2, self.service.publish_event_type_to_stream.call_args[1]['new_event_data']['worker'])
+
+    def test_process_data_event_should_drop_duplicate_events(self):
+        self.service.setup_dedup({'window_s': 60})
+        self.service.route_data_event_wrapper = MagicMock()
+        event_data = {'id': 'publisher-1', 'buffer_stream_key': 'bf1'}
+        self.service.process_data_event(event_data.copy(), None)
+        self.service.process_data_event(event_data.copy(), None)
+        self.assertEqual(1, self.service.route_data_event_wrapper.call_count)
+        self.assertEqual({'bf1': 1}, self.service.metrics.get_stats()['duplicates'])
+
+    def test_group_data_events_by_bufferstream_should_drop_duplicate_passthrough_events(self):
+        self.service.setup_dedup({'window_s': 60})
+        self.service.event_passthrough = True
+        event_json = json.dumps({'id': 'publisher-1', 'buffer_stream_key': 'bf1'})
+        event_list = [('1-0', {b'event': event_json}), ('2-0', {b'event': event_json})]
+        bufferstream_events = self.service.group_data_events_by_bufferstream(event_list)
+        self.assertEqual(1, len(bufferstream_events['bf1']))
+        self.assertEqual({'bf1': 1}, self.service.metrics.get_stats()['duplicates'])
+
+    def test_group_data_events_by_bufferstream_should_drop_expired_passthrough_events_with_dedup(self):
+        self.service.setup_dedup({'window_s': 60})
+        self.service.event_passthrough = True
+        self.service.deadline_checker.update_budgets({'bf1': 500})
+        now_ms = int(time.time() * 1000)
+        event_list = [
+            (f'{now_ms - 10000}-0', {b'event': json.dumps({'id': 'pub:1', 'buffer_stream_key': 'bf1'})}),
+            (f'{now_ms - 10000}-1', {b'event': json.dumps({'id': 2, 'buffer_stream_key': 'bf1'})}),
+            (f'{now_ms}-0', {b'event': json.dumps({'id': 3, 'buffer_stream_key': 'bf1'})}),
+        ]
+        bufferstream_events = self.service.group_data_events_by_bufferstream(event_list)
+        self.assertEqual([3], [event.id for event in bufferstream_events['bf1']])
+        self.assertEqual({'bf1': 2}, self.service.metrics.get_stats()['expired'])
+
+    def test_process_data_events_batch_should_shed_over_fair_share_under_emergency_shedding(self):
+        self.service.execute_adaptive_plan({
+            'name': 'QQoS-TK-LP',
+            'dataflows': {
+                'bf1': [[1.0, [['od-data']]]],
+                'bf2': [[1.0, [['od-data']]]],
+            }
+        }, {'bufferstream_weights': {'bf2': 3}})
+        self.service.setup_fair_dispatch(True)
+        self.service.fair_dispatcher.update_weights(self.service.current_plan.options['bufferstream_weights'])
+        self.service.emergency_shedder.is_active = True
+        self.service.emergency_shedder.shedding_rate = 0.5
+        self.service.route_data_event_wrapper = MagicMock()
+        event_list = [
+            (f'{index}-0', {'event': json.dumps({'id': index, 'buffer_stream_key': 'bf1' if index < 6 else 'bf2'})})
+            for index in range(8)
+        ]
+        self.service.process_data_events_batch(event_list)
+        forwarded = {'bf1': 0, 'bf2': 0}
+        for call in self.service.route_data_event_wrapper.call_args_list:
+            if call[0][1] is not None:
+                forwarded[call[0][0]['buffer_stream_key']] += 1
+        self.assertEqual({'bf1': 2, 'bf2': 2}, forwarded)
+
+    def test_process_data_event_should_redirect_events_over_destination_capacity(self):
+        self.service.execute_adaptive_plan({
+            'name': 'QQoS-TK-LP',
+            'dataflows': {
+                'bf1': [[0.5, [['od-data']]], [1.0, [['od-gpu-data']]]],
+            }
+        }, {'destination_capacities': {'od-data': 1}})
+        self.service.route_data_event_wrapper = MagicMock()
+        self.service.process_data_event({'id': 1, 'buffer_stream_key': 'bf1'}, None)
+        self.service.process_data_event({'id': 2, 'buffer_stream_key': 'bf1'}, None)
+        data_flows = [call[0][1] for call in self.service.route_data_event_wrapper.call_args_list]
+        self.assertEqual([(('od-data',),), (('od-gpu-data',),)], data_flows)
+        self.assertEqual(
+            {'od-data': {'redirected': 1, 'shed': 0}}, self.service.metrics.get_stats()['throttled']
+        )
+
+    def test_process_data_should_only_ack_events_once_their_output_is_flushed(self):
+        self.service.setup_output_stage({'batch_size': 10, 'max_delay_ms': 60000})
+        self.service.data_batch_size = 10
+        self.service.service_stream.ack = MagicMock()
+        self.service.execute_adaptive_plan({
+            'name': 'QQoS-TK-LP',
+            'dataflows': {
+                'bf1': [[1.0, [['od-data']]]],
+            }
+        })
+        destination_stream = MagicMock(spec=['key', 'write_events'])
+        self.service.route_data_event_wrapper = MagicMock(
+            side_effect=lambda *args: self.service.write_event_msg({'event': '{}'}, destination_stream)
+        )
+        self.service.service_stream.mocked_values.extend([
+            prepare_event_msg_tuple({'id': 1, 'buffer_stream_key': 'bf1'}),
+            prepare_event_msg_tuple({'id': 2, 'buffer_stream_key': 'bf1'}),
+        ])
+
+        self.service.process_data()
+        self.assertEqual(0, self.service.service_stream.ack.call_count)
+
+        self.service.output_stage.flush()
+        self.service.process_data()
+        self.assertEqual(2, self.service.service_stream.ack.call_count)
+
+    def test_publish_should_write_directly_with_output_stage(self):
+        self.service.setup_output_stage({'batch_size': 10, 'max_delay_ms': 60000})
+        pub_stream = MagicMock(key='SchedulingPlanExecuted')
+        self.service.pub_event_stream_map = {'SchedulingPlanExecuted': pub_stream}
+        self.service.publish_scheduling_plan_executed({'execution_plan': {}})
+        self.assertEqual(1, pub_stream.write_events.call_count)
+        self.assertEqual(0, self.service.output_stage.pending_count)
+
+        pub_stream.write_events.side_effect = ConnectionError('down')
+        with self.assertRaises(ConnectionError):
+            self.service.publish_scheduling_plan_executed({'execution_plan': {}})
+        self.assertFalse(self.service.has_failed_writes)
+
+    def test_send_event_to_first_service_should_flag_failed_traced_data_writes(self):
+        destination_stream = MagicMock(key='od-data')
+        destination_stream.write_events.side_effect = ConnectionError('down')
+        self.service.get_destination_streams = MagicMock(return_value=destination_stream)
+        with self.assertRaises(ConnectionError):
+            self.service.send_event_to_first_service_in_dataflow({'id': 1, 'data_flow': [['od-data']]})
+        self.assertTrue(self.service.has_failed_writes)
+
+    def test_process_data_should_not_ack_events_when_output_flush_fails(self):
+        self.service.setup_output_stage({'batch_size': 10, 'max_delay_ms': 60000})
+        self.service.service_stream.ack = MagicMock()
+        self.service.execute_adaptive_plan({
+            'name': 'QQoS-TK-LP',
+            'dataflows': {
+                'bf1': [[1.0, [['od-data']]]],
+            }
+        })
+        destination_stream = MagicMock(spec=['key', 'write_events'], key='od-data')
+        destination_stream.write_events.side_effect = ConnectionError('down')
+        self.service.route_data_event_wrapper = MagicMock(
+            side_effect=lambda *args: self.service.write_event_msg({'event': '{}'}, destination_stream)
+        )
+        self.service.service_stream.mocked_values.append(prepare_event_msg_tuple({'id': 1, 'buffer_stream_key': 'bf1'}))
+        self.service.output_stage.max_delay = 0
+
+        self.service.process_data()
+
+        self.assertEqual(0, self.service.service_stream.ack.call_count)
+        self.assertEqual(0, self.service.output_stage.pending_count)
+        self.assertFalse(self.service.output_stage.has_failed_writes)
+
+    def test_process_data_should_not_ack_events_read_before_failed_unbuffered_write(self):
+        self.service.service_stream.ack = MagicMock()
+        self.service.execute_adaptive_plan({
+            'name': 'QQoS-TK-LP',
+            'dataflows': {
+                'bf1': [[1.0, [['od-data']]]],
+            }
+        })
+        destination_stream = MagicMock(spec=['key', 'write_events'])
+        destination_stream.write_events.side_effect = ConnectionError('down')
+        self.service.route_data_event_wrapper = MagicMock(
+            side_effect=lambda *args: self.service.write_event_msg({'event': '{}'}, destination_stream)
+        )
+        self.service.service_stream.mocked_values.append(prepare_event_msg_tuple({'id': 1, 'buffer_stream_key': 'bf1'}))
+
+        self.service.process_data()
+        self.assertEqual(0, self.service.service_stream.ack.call_count)
+
+        destination_stream.write_events.side_effect = None
+        self.service.service_stream.mocked_values.append(prepare_event_msg_tuple({'id': 2, 'buffer_stream_key': 'bf1'}))
+        self.service.process_data()
+        self.assertEqual(1, self.service.service_stream.ack.call_count)
+
+    def test_process_data_should_route_and_ack_reclaimed_pending_events(self):
+        self.service.setup_data_acks({'reclaim_min_idle_ms': 1000})
+        self.service.service_stream.ack = MagicMock()
+        reclaimed_event = prepare_event_msg_tuple({'id': 1, 'buffer_stream_key': 'bf1'})
+        self.service.pending_reclaimer.claim = MagicMock(return_value=([reclaimed_event], ['0-1']))
+        self.service.process_data_event_wrapper = MagicMock()
+
+        self.service.process_data()
+
+        self.service.process_data_event_wrapper.assert_called_once_with(
+            {'id': 1, 'buffer_stream_key': 'bf1'}, reclaimed_event[1], reclaimed_event[0], ANY
+        )
+        acked_ids = [call[0][0] for call in self.service.service_stream.ack.call_args_list]
+        self.assertEqual(['0-1', reclaimed_event[0]], acked_ids)
+
+    def test_process_data_events_should_drop_events_past_their_latency_budget(self):
+        self.service.execute_adaptive_plan({
+            'name': 'QQoS-TK-LP',
+            'dataflows': {
+                'bf1': [[1.0, [['od-data']]]],
+            }
+        }, {'latency_budgets_ms': {'bf1': 1000}})
+        self.service.route_data_event_wrapper = MagicMock()
+        now_ms = int(time.time() * 1000)
+        fresh_event = prepare_event_msg_tuple({'id': 1, 'buffer_stream_key': 'bf1'})
+        stale_event = prepare_event_msg_tuple({'id': 2, 'buffer_stream_key': 'bf1'})
+        self.service.process_data_events([
+            (f'{now_ms}-0', fresh_event[1]),
+            (f'{now_ms - 5000}-0', stale_event[1]),
+        ])
+        self.service.route_data_event_wrapper.assert_called_once()
+        self.assertEqual({'id': 1, 'buffer_stream_key': 'bf1'}, self.service.route_data_event_wrapper.call_args[0][0])
+        stats = self.service.metrics.get_stats()
+        self.assertEqual({'bf1': 1}, stats['expired'])
+        self.assertNotIn('bf1', stats['bufferstreams'])
+
+    def test_process_data_events_should_refresh_backlogs_before_routing_with_power_of_two_choices(self):
+        self.service.execute_adaptive_plan({
+            'name': 'power_of_two_choices',
+            'dataflows': {
+                'bf1': [[0.5, [['od1-data']]], [1.0, [['od2-data']]]],
+            }
+        })
+        self.service.route_data_event_wrapper = MagicMock()
+        with patch.object(self.service.destination_backlogs, 'refresh') as mocked_refresh:
+            self.service.process_data_events([prepare_event_msg_tuple({'id': 1, 'buffer_stream_key': 'bf1'})])
+        mocked_refresh.assert_called_once_with()
+        self.service.route_data_event_wrapper.assert_called_once()
+
+    def test_process_data_events_should_drop_duplicates_before_checking_latency_budget(self):
+        self.service.setup_dedup({'window_s': 60})
+        self.service.execute_adaptive_plan({
+            'name': 'QQoS-TK-LP',
+            'dataflows': {
+                'bf1': [[1.0, [['od-data']]]],
+            }
+        }, {'latency_budgets_ms': {'bf1': 1000}})
+        self.service.route_data_event_wrapper = MagicMock()
+        now_ms = int(time.time() * 1000)
+        stale_event = prepare_event_msg_tuple({'id': 1, 'buffer_stream_key': 'bf1'})
+        self.service.process_data_events([(f'{now_ms - 5000}-0', stale_event[1])] * 2)
+        stats = self.service.metrics.get_stats()
+        self.assertEqual({'bf1': 1}, stats['duplicates'])
+        self.assertEqual({'bf1': 1}, stats['expired'])
+
+    def test_process_data_should_drop_events_shed_by_emergency_shedder(self):
+        self.service.execute_adaptive_plan({
+            'name': 'QQoS-TK-LP',
+            'dataflows': {
+                'bf1': [[1.0, [['od-data']]]],
+            }
+        })
+        self.service.emergency_shedder.enabled = True
+        self.service.emergency_shedder.check = MagicMock(return_value='started')
+        self.service.emergency_shedder.is_active = True
+        self.service.emergency_shedder.is_shedding_event = MagicMock(return_value=True)
+        self.service.publish_emergency_shedding_changed = MagicMock()
+        self.service.send_event_to_first_service_in_dataflow = MagicMock()
+        self.service.service_stream.ack = MagicMock()
+        self.service.service_stream.mocked_values.append(prepare_event_msg_tuple({'id': 1, 'buffer_stream_key': 'bf1'}))
+
+        self.service.process_data()
+
+        self.service.publish_emergency_shedding_changed.assert_called_once_with('started')
+        self.service.emergency_shedder.is_shedding_event.assert_called_once_with('bf1')
+        self.assertFalse(self.service.send_event_to_first_service_in_dataflow.called)
+
+    def test_process_data_in_passthrough_mode_should_write_same_encoded_event_to_all_destinations(self):
+        self.service.event_passthrough = True
+        self.service.trace_sampler.update({'forwarded': 0})
+        self.service.service_stream.ack = MagicMock()
+        self.service.execute_adaptive_plan({
+            'name': 'QQoS-TK-LP',
+            'dataflows': {
+                'bf1': [[1.0, [['od-data', 'cd-data'], ['wm-data']]]],
+            }
+        })
+        destination_stream = MagicMock()
+        self.service.get_destination_streams = MagicMock(return_value=destination_stream)
+        self.service.default_event_deserializer = MagicMock(side_effect=AssertionError('should not decode event'))
+        self.service.service_stream.mocked_values.append(prepare_event_msg_tuple({'id': 1, 'buffer_stream_key': 'bf1'}))
+
+        self.service.process_data()
+
+        self.assertEqual(2, destination_stream.write_events.call_count)
+        first_msg = destination_stream.write_events.call_args_list[0][0][0]
+        self.assertIs(first_msg, destination_stream.write_events.call_args_list[1][0][0])
+        self.assertEqual([['od-data', 'cd-data'], ['wm-data']], json.loads(first_msg['event'])['data_flow'])
+        self.assertEqual(1, self.service.service_stream.ack.call_count)
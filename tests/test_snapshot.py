@@ -0,0 +1,48 @@
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+from scheduler.plan import PlanSnapshot
+from scheduler.snapshot import PlanSnapshotStore
+from scheduler.strategies.routing_table import RoutingTable
+
+
+class TestPlanSnapshotStore(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'plan-snapshot.json')
+        self.store = PlanSnapshotStore(self.path, logger=MagicMock())
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_load_should_return_none_without_snapshot(self):
+        self.assertIsNone(self.store.load())
+
+    def test_save_should_store_compiled_plan_and_strategy_state(self):
+        routing_tables = {
+            'bf1': RoutingTable.from_plan_choices(
+                [[0.5, 0.3, [['od1-data'], ['wm-data']]], [0.0, 1.0, [['od2-data'], ['wm-data']]]],
+                has_load_shedding=True
+            )
+        }
+        plan = PlanSnapshot(7, 'QQoS-W-HP-LS', MagicMock(), routing_tables, {'trace_sampling': {'shed': 0.1}})
+        self.store.save(plan, {'some': 'state'})
+
+        snapshot = self.store.load()
+        self.assertEqual(7, snapshot['version'])
+        self.assertEqual('QQoS-W-HP-LS', snapshot['strategy_name'])
+        self.assertEqual({'trace_sampling': {'shed': 0.1}}, snapshot['options'])
+        self.assertEqual({'some': 'state'}, snapshot['strategy_state'])
+        routing_table = RoutingTable.from_snapshot(snapshot['routing_tables']['bf1'])
+        self.assertEqual(routing_tables['bf1'].dataflows, routing_table.dataflows)
+        self.assertEqual((0.3, 1.0), routing_table.cum_weights)
+        self.assertEqual((0.5, 0.0), routing_table.load_shedding_rates)
+        self.assertEqual(['plan-snapshot.json'], os.listdir(self.tmp_dir.name))
+
+    def test_load_should_ignore_unknown_format(self):
+        with open(self.path, 'w') as snapshot_file:
+            snapshot_file.write('{"format_version": 0}')
+        self.assertIsNone(self.store.load())
@@ -0,0 +1,55 @@
+from unittest import TestCase
+
+from scheduler.strategies.state import BufferstreamStateStore
+
+
+class TestBufferstreamStateStore(TestCase):
+
+    def setUp(self):
+        self.store = BufferstreamStateStore(idle_ttl_s=60, check_interval_s=10)
+
+    def test_get_should_return_the_same_record_for_a_bufferstream(self):
+        state = self.store.get('bf1')
+        state.round_robin_index = 3
+        self.assertIs(state, self.store.get('bf1'))
+        self.assertEqual(0, self.store.get('bf2').round_robin_index)
+        self.assertEqual(2, len(self.store))
+
+    def test_retain_should_drop_records_of_bufferstreams_not_in_the_plan(self):
+        self.store.get('bf1')
+        self.store.get('bf2')
+        self.assertEqual(1, self.store.retain(['bf2', 'bf3']))
+        self.assertEqual(['bf2'], [key for key, state in self.store.items()])
+        self.assertEqual(1, self.store.get_memory_report()['retired'])
+
+    def test_evict_idle_should_drop_records_not_used_within_idle_ttl(self):
+        self.store.evict_idle(now=100)
+        self.store.get('bf1')
+        self.store.get('bf2')
+        self.store.evict_idle(now=150)
+        self.store.get('bf2')
+        self.assertEqual(1, self.store.evict_idle(now=200))
+        self.assertEqual(['bf2'], [key for key, state in self.store.items()])
+        self.assertEqual(1, self.store.get_memory_report()['evicted'])
+
+    def test_evict_idle_should_keep_records_when_idle_ttl_is_disabled(self):
+        store = BufferstreamStateStore(idle_ttl_s=0)
+        store.evict_idle(now=100)
+        store.get('bf1')
+        self.assertEqual(0, store.evict_idle(now=100000))
+        self.assertEqual(1, len(store))
+
+    def test_evict_idle_if_due_should_only_check_after_check_interval(self):
+        self.store.get('bf1')
+        self.assertEqual(0, self.store.evict_idle_if_due())
+        self.store.now -= 120
+        self.store.states['bf1'].last_seen -= 120
+        self.assertEqual(1, self.store.evict_idle_if_due())
+        self.assertEqual(0, len(self.store))
+
+    def test_get_memory_report_should_count_records_and_bytes(self):
+        empty_report = self.store.get_memory_report()
+        self.store.get('bf1').smooth_weights = (None, (1, 1), 2, [0, 0])
+        report = self.store.get_memory_report()
+        self.assertEqual(1, report['bufferstreams'])
+        self.assertGreater(report['approximate_bytes'], empty_report['approximate_bytes'])
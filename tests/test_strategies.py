@@ -1,3 +1,19 @@
+import json
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from scheduler.strategies.dataflow import Dataflow, DataflowRegistry
+from scheduler.strategies.load_shedding import UniformLoadShedder
+from scheduler.strategies.routing_table import RoutingTable
+from scheduler.strategies.weighted_rand import WeightedRandomStrategy
+from scheduler.strategies.round_robin import RoundRobinStrategy
+from scheduler.strategies.single_best_dataflow import SingleBestStrategy
+from scheduler.strategies.power_of_two_choices import PowerOfTwoChoicesStrategy
+from scheduler.strategies.smooth_weighted_round_robin import SmoothWeightedRoundRobinStrategy
+from scheduler.strategies.consistent_hash import ConsistentHashStrategy
+from scheduler.passthrough import PassthroughEvent
+
+
 # from unittest import TestCase
 # from unittest.mock import patch, MagicMock
 
@@ -67,3 +83,421 @@
 #         bf_2_sc_3_dataflow = self.strategy.get_bufferstream_dataflow(bf_key2)
 #         expected_dataflow = [['object-detection-ssd-gpu3-data'], ['wm-data']]
 #         self.assertListEqual(expected_dataflow, bf_2_sc_3_dataflow)
+
+
+class TestRoutingTable(TestCase):
+
+    def test_from_plan_choices_should_unzip_plan_entries_once(self):
+        routing_table = RoutingTable.from_plan_choices([
+            [0.1, [['object-detection-ssd-data'], ['wm-data']]],
+            [1.0, [['object-detection-ssd-gpu-data'], ['wm-data']]]
+        ])
+        self.assertEqual((0.1, 1.0), routing_table.cum_weights)
+        self.assertEqual(1.0, routing_table.total_weight)
+        self.assertEqual(2, routing_table.size)
+        self.assertEqual(0, routing_table.get_load_shedding_rate(1))
+
+    def test_from_plan_choices_should_unzip_load_shedding_plan_entries(self):
+        routing_table = RoutingTable.from_plan_choices([
+            [0.5, 0.1, [['object-detection-ssd-data'], ['wm-data']]],
+            [0.2, 1.0, [['object-detection-ssd-gpu-data'], ['wm-data']]]
+        ], has_load_shedding=True)
+        self.assertEqual((0.1, 1.0), routing_table.cum_weights)
+        self.assertEqual(0.2, routing_table.get_load_shedding_rate(1))
+
+    def test_from_plan_choices_should_return_none_for_empty_choices(self):
+        self.assertIsNone(RoutingTable.from_plan_choices([]))
+
+    def test_weights_should_be_cum_weights_differences(self):
+        routing_table = RoutingTable.from_plan_choices([
+            [1, [['object-detection-ssd-data'], ['wm-data']]],
+            [3, [['object-detection-ssd-gpu-data'], ['wm-data']]],
+            [6, [['object-detection-yolo-data'], ['wm-data']]],
+        ])
+        self.assertEqual((1, 2, 3), routing_table.weights)
+
+    def test_select_weighted_index_should_follow_cum_weights(self):
+        routing_table = RoutingTable.from_plan_choices([
+            [0.0, [['object-detection-ssd-data'], ['wm-data']]],
+            [1.0, [['object-detection-ssd-gpu-data'], ['wm-data']]]
+        ])
+        for _ in range(100):
+            self.assertEqual(1, routing_table.select_weighted_index())
+
+
+class TestCompiledWeightedRandomStrategy(TestCase):
+
+    def test_get_bufferstream_dataflow_should_select_one_of_the_two_possible_choices(self):
+        strategy = WeightedRandomStrategy(parent_service=MagicMock())
+        bf_key = 'bf-key'
+        strategy.update({
+            'name': 'QQoS-W-HP',
+            'dataflows': {
+                bf_key: [
+                    [0.1, [['object-detection-ssd-data'], ['wm-data']]],
+                    [0.2, [['object-detection-ssd-gpu-data'], ['wm-data']]]
+                ]
+            }
+        })
+        dataflow = strategy.get_bufferstream_dataflow(bf_key)
+        self.assertIn(dataflow, [
+            Dataflow([['object-detection-ssd-data'], ['wm-data']]),
+            Dataflow([['object-detection-ssd-gpu-data'], ['wm-data']]),
+        ])
+
+    def test_get_bufferstream_dataflow_should_return_empty_for_unknown_bufferstream(self):
+        strategy = WeightedRandomStrategy(parent_service=MagicMock())
+        strategy.update({'name': 'QQoS-W-HP', 'dataflows': {}})
+        self.assertEqual([], strategy.get_bufferstream_dataflow('bf-key'))
+
+    def test_get_bufferstream_dataflow_should_shed_with_full_load_shedding_rate(self):
+        strategy = WeightedRandomStrategy(parent_service=MagicMock())
+        strategy.update({
+            'name': 'QQoS-W-HP-LS',
+            'dataflows': {
+                'bf-key': [
+                    [1.0, 1.0, [['object-detection-ssd-data'], ['wm-data']]],
+                ]
+            }
+        })
+        self.assertIsNone(strategy.get_bufferstream_dataflow('bf-key'))
+
+
+class TestCompiledRoundRobinStrategy(TestCase):
+
+    def test_get_bufferstream_dataflow_should_do_a_round_robin(self):
+        strategy = RoundRobinStrategy(parent_service=MagicMock())
+        strategy.update({
+            'name': 'round_robin',
+            'dataflows': {
+                'bf-key': [
+                    [0, [['object-detection-ssd-data'], ['wm-data']]],
+                    [0, [['object-detection-ssd-gpu-data'], ['wm-data']]]
+                ],
+            }
+        })
+        dataflow = Dataflow([['object-detection-ssd-data'], ['wm-data']])
+        gpu_dataflow = Dataflow([['object-detection-ssd-gpu-data'], ['wm-data']])
+        self.assertEqual(dataflow, strategy.get_bufferstream_dataflow('bf-key'))
+        self.assertEqual(gpu_dataflow, strategy.get_bufferstream_dataflow('bf-key'))
+        self.assertEqual(dataflow, strategy.get_bufferstream_dataflow('bf-key'))
+
+
+class TestCompiledSingleBestStrategy(TestCase):
+
+    def test_get_bufferstream_dataflow_should_use_first_choice(self):
+        strategy = SingleBestStrategy(parent_service=MagicMock())
+        strategy.update({
+            'name': 'QQoS-TK-LP-LS',
+            'dataflows': {
+                'bf-key': [
+                    [0, 1.0, [['object-detection-ssd-data'], ['wm-data']]],
+                    [0, 1.0, [['object-detection-ssd-gpu-data'], ['wm-data']]]
+                ],
+            }
+        })
+        self.assertEqual(
+            Dataflow([['object-detection-ssd-data'], ['wm-data']]), strategy.get_bufferstream_dataflow('bf-key')
+        )
+
+    def test_update_should_stop_routing_bufferstreams_removed_from_plan(self):
+        strategy = SingleBestStrategy(parent_service=MagicMock())
+        strategy.update({
+            'name': 'QQoS-TK-LP',
+            'dataflows': {
+                'bf1': [[1.0, [['object-detection-ssd-data']]]],
+                'bf2': [[1.0, [['object-detection-ssd-data']]]],
+            }
+        })
+        strategy.update({
+            'name': 'QQoS-TK-LP',
+            'dataflows': {
+                'bf2': [[1.0, [['object-detection-ssd-data']]]],
+            }
+        })
+        self.assertEqual(['bf2'], list(strategy.bufferstream_routing_tables.keys()))
+
+
+class TestBatchedStrategySelection(TestCase):
+
+    def test_get_bufferstream_dataflows_should_return_n_weighted_choices(self):
+        strategy = WeightedRandomStrategy(parent_service=MagicMock())
+        strategy.update({
+            'name': 'QQoS-W-HP',
+            'dataflows': {
+                'bf-key': [
+                    [0.0, [['object-detection-ssd-data'], ['wm-data']]],
+                    [1.0, [['object-detection-ssd-gpu-data'], ['wm-data']]]
+                ]
+            }
+        })
+        dataflows = strategy.get_bufferstream_dataflows('bf-key', 5)
+        self.assertEqual([Dataflow([['object-detection-ssd-gpu-data'], ['wm-data']])] * 5, dataflows)
+
+    def test_get_bufferstream_dataflows_should_shed_with_full_load_shedding_rate(self):
+        strategy = SingleBestStrategy(parent_service=MagicMock())
+        strategy.update({
+            'name': 'QQoS-TK-LP-LS',
+            'dataflows': {
+                'bf-key': [
+                    [1.0, 1.0, [['object-detection-ssd-data'], ['wm-data']]],
+                ]
+            }
+        })
+        self.assertEqual([None] * 4, strategy.get_bufferstream_dataflows('bf-key', 4))
+
+    def test_get_bufferstream_dataflows_should_keep_round_robin_order(self):
+        strategy = RoundRobinStrategy(parent_service=MagicMock())
+        strategy.update({
+            'name': 'round_robin',
+            'dataflows': {
+                'bf-key': [
+                    [0, [['sc1']]],
+                    [0, [['sc2']]]
+                ],
+            }
+        })
+        sc1_dataflow = Dataflow([['sc1']])
+        sc2_dataflow = Dataflow([['sc2']])
+        self.assertEqual([sc1_dataflow, sc2_dataflow, sc1_dataflow], strategy.get_bufferstream_dataflows('bf-key', 3))
+
+    def test_get_bufferstream_dataflows_should_return_empty_dataflows_for_unknown_bufferstream(self):
+        strategy = WeightedRandomStrategy(parent_service=MagicMock())
+        self.assertEqual([[], []], strategy.get_bufferstream_dataflows('bf-key', 2))
+
+
+class TestUniformLoadShedder(TestCase):
+
+    def test_is_shedding_event_should_space_drops_evenly_at_exact_rate(self):
+        load_shedder = UniformLoadShedder()
+        shedding_events = [load_shedder.is_shedding_event('bf-key', 0.25) for _ in range(12)]
+        self.assertEqual([False, False, False, True] * 3, shedding_events)
+
+    def test_is_shedding_event_should_not_round_up_small_rates(self):
+        load_shedder = UniformLoadShedder()
+        shedding_events = [load_shedder.is_shedding_event('bf-key', 0.001) for _ in range(2000)]
+        self.assertEqual(2, sum(shedding_events))
+
+    def test_is_shedding_event_should_keep_one_accumulator_per_bufferstream(self):
+        load_shedder = UniformLoadShedder()
+        load_shedder.is_shedding_event('bf-key', 0.5)
+        self.assertFalse(load_shedder.is_shedding_event('bf-key2', 0.5))
+        self.assertTrue(load_shedder.is_shedding_event('bf-key', 0.5))
+
+    def test_weighted_random_strategy_should_use_uniform_shedding_in_batches(self):
+        strategy = WeightedRandomStrategy(parent_service=MagicMock(), load_shedder=UniformLoadShedder())
+        strategy.update({
+            'name': 'QQoS-W-HP-LS',
+            'dataflows': {
+                'bf-key': [
+                    [0.5, 1.0, [['object-detection-ssd-data'], ['wm-data']]],
+                ]
+            }
+        })
+        dataflow = Dataflow([['object-detection-ssd-data'], ['wm-data']])
+        self.assertEqual([dataflow, None, dataflow, None], strategy.get_bufferstream_dataflows('bf-key', 4))
+
+
+class TestDataflowRegistry(TestCase):
+
+    def test_intern_should_return_same_object_for_equal_dataflows(self):
+        registry = DataflowRegistry()
+        dataflow = registry.intern([['od1-data', 'od2-data'], ['wm-data']])
+        self.assertIs(dataflow, registry.intern((('od1-data', 'od2-data'), ('wm-data',))))
+        self.assertEqual(('od1-data', 'od2-data'), dataflow.first_hop_destinations)
+        self.assertEqual('od1-data+od2-data>wm-data', dataflow.key)
+        self.assertEqual(b'[["od1-data", "od2-data"], ["wm-data"]]', dataflow.encoded)
+
+    def test_strategies_sharing_registry_should_share_dataflow_objects(self):
+        registry = DataflowRegistry()
+        plan_dataflows = {'bf-key': [[1.0, [['od-data'], ['wm-data']]]]}
+        weighted_strategy = WeightedRandomStrategy(parent_service=MagicMock(), dataflow_registry=registry)
+        single_best_strategy = SingleBestStrategy(parent_service=MagicMock(), dataflow_registry=registry)
+        weighted_strategy.update({'name': 'QQoS-W-HP', 'dataflows': plan_dataflows})
+        single_best_strategy.update({'name': 'QQoS-TK-LP', 'dataflows': plan_dataflows})
+        self.assertIs(
+            weighted_strategy.get_bufferstream_dataflow('bf-key'),
+            single_best_strategy.get_bufferstream_dataflow('bf-key')
+        )
+
+    def test_retain_should_drop_dataflows_not_in_use(self):
+        registry = DataflowRegistry()
+        dataflow = registry.intern([['od-data']])
+        registry.intern([['old-data']])
+        registry.retain({dataflow})
+        self.assertEqual(1, len(registry))
+        self.assertIs(dataflow, registry.intern([['od-data']]))
+
+
+class TestPowerOfTwoChoicesStrategy(TestCase):
+
+    def setUp(self):
+        self.backlog_view = MagicMock()
+        self.strategy = PowerOfTwoChoicesStrategy(parent_service=MagicMock(), backlog_view=self.backlog_view)
+        self.strategy.update({
+            'name': 'power_of_two_choices',
+            'dataflows': {
+                'bf-key': [
+                    [0.5, [['od1-data'], ['wm-data']]],
+                    [1.0, [['od2-data'], ['wm-data']]],
+                ]
+            }
+        })
+        self.routing_table = self.strategy.bufferstream_routing_tables['bf-key']
+
+    def test_update_should_watch_first_hop_destinations(self):
+        self.backlog_view.set_destinations.assert_called_with({'od1-data', 'od2-data'})
+
+    def test_select_dataflow_should_pick_candidate_with_shorter_backlog(self):
+        backlogs = {'od1-data': 10, 'od2-data': 1}
+        self.backlog_view.get_dataflow_backlog.side_effect = lambda dataflow: backlogs[dataflow[0][0]]
+        with patch.object(RoutingTable, 'select_weighted_index', MagicMock(side_effect=[0, 1])):
+            dataflow = self.strategy.get_bufferstream_dataflow('bf-key')
+        self.assertEqual(Dataflow([['od2-data'], ['wm-data']]), dataflow)
+        self.assertFalse(self.backlog_view.refresh_if_due.called)
+        self.assertFalse(self.backlog_view.refresh.called)
+        self.backlog_view.record_sent.assert_called_once_with(dataflow)
+
+    def test_select_dataflow_should_not_count_shed_events_as_sent(self):
+        self.strategy.update({
+            'name': 'power_of_two_choices-LS',
+            'dataflows': {'bf-key': [[1.0, 1.0, [['od1-data'], ['wm-data']]]]}
+        })
+        self.assertIsNone(self.strategy.get_bufferstream_dataflow('bf-key'))
+        self.assertFalse(self.backlog_view.record_sent.called)
+
+
+class TestSmoothWeightedRoundRobinStrategy(TestCase):
+
+    def setUp(self):
+        self.strategy = SmoothWeightedRoundRobinStrategy(parent_service=MagicMock())
+        self.strategy.update({
+            'name': 'smooth_weighted_round_robin',
+            'dataflows': {
+                'bf-key': [
+                    [5, [['od1-data'], ['wm-data']]],
+                    [6, [['od2-data'], ['wm-data']]],
+                    [7, [['od3-data'], ['wm-data']]],
+                ]
+            }
+        })
+
+    def select_first_hops(self, n):
+        return [self.strategy.get_bufferstream_dataflow('bf-key')[0][0] for _ in range(n)]
+
+    def test_select_dataflow_should_spread_weighted_choices(self):
+        self.assertEqual(
+            ['od1-data', 'od1-data', 'od2-data', 'od1-data', 'od3-data', 'od1-data', 'od1-data'],
+            self.select_first_hops(7)
+        )
+
+    def test_select_dataflow_should_give_exact_split_over_every_total_weight_window(self):
+        selections = self.select_first_hops(70)
+        for window_start in range(0, 70, 7):
+            window = selections[window_start:window_start + 7]
+            self.assertEqual([5, 1, 1], [window.count(f'od{i}-data') for i in range(1, 4)])
+
+    def test_select_dataflow_should_restart_on_new_plan(self):
+        self.select_first_hops(3)
+        self.strategy.update({
+            'name': 'smooth_weighted_round_robin',
+            'dataflows': {'bf-key': [[1, [['od1-data'], ['wm-data']]], [2, [['od2-data'], ['wm-data']]]]}
+        })
+        self.assertEqual(['od1-data', 'od2-data', 'od1-data', 'od2-data'], self.select_first_hops(4))
+
+    def test_select_dataflow_should_shed_with_load_shedding_plan(self):
+        self.strategy.update({
+            'name': 'smooth_weighted_round_robin-LS',
+            'dataflows': {'bf-key': [[1.0, 1, [['od1-data'], ['wm-data']]], [0.0, 2, [['od2-data'], ['wm-data']]]]}
+        })
+        self.assertEqual(
+            [None, Dataflow([['od2-data'], ['wm-data']])],
+            [self.strategy.get_bufferstream_dataflow('bf-key') for _ in range(2)]
+        )
+
+
+class TestConsistentHashStrategy(TestCase):
+
+    def setUp(self):
+        self.strategy = ConsistentHashStrategy(
+            parent_service=MagicMock(), routing_key_field='track_id', load_factor=2
+        )
+        self.update_weights([1, 1, 1, 1])
+
+    def update_weights(self, weights, name='consistent_hash'):
+        cum_weights = [sum(weights[:i + 1]) for i in range(len(weights))]
+        self.strategy.update({
+            'name': name,
+            'dataflows': {
+                'bf-key': [[cum_weight, [[f'od{i}-data'], ['wm-data']]] for i, cum_weight in enumerate(cum_weights)]
+            }
+        })
+
+    def route_keys(self, keys):
+        routing_table = self.strategy.bufferstream_routing_tables['bf-key']
+        return {
+            key: self.strategy.select_event_dataflow('bf-key', routing_table, {'track_id': key})[0][0] for key in keys
+        }
+
+    def test_select_event_dataflow_should_stick_to_same_dataflow_per_key(self):
+        keys = [f'track-{i}' for i in range(200)]
+        self.route_keys(keys)
+        first_routes = self.route_keys(keys)
+        self.assertEqual(first_routes, self.route_keys(keys))
+        self.assertEqual(4, len(set(first_routes.values())))
+
+    def test_weight_change_should_only_move_keys_to_changed_dataflow(self):
+        keys = [f'track-{i}' for i in range(400)]
+        self.route_keys(keys)
+        first_routes = self.route_keys(keys)
+        self.update_weights([1, 1, 1, 2])
+        second_routes = self.route_keys(keys)
+        moved_keys = [key for key in keys if first_routes[key] != second_routes[key]]
+        self.assertLess(len(moved_keys), len(keys) / 3)
+        self.assertTrue(all(second_routes[key] == 'od3-data' for key in moved_keys))
+
+    def test_select_event_dataflow_should_bound_keys_per_dataflow(self):
+        self.strategy.bounded_loads.load_factor = 1.25
+        routes = self.route_keys([f'track-{i}' for i in range(100)])
+        route_values = list(routes.values())
+        self.assertLessEqual(max(route_values.count(route) for route in set(route_values)), 1.25 * 25)
+        self.assertEqual(routes, self.route_keys(list(routes)))
+
+    def test_select_event_dataflow_should_not_move_single_hot_key(self):
+        self.strategy.bounded_loads.load_factor = 1.0
+        routing_table = self.strategy.bufferstream_routing_tables['bf-key']
+        routes = [
+            self.strategy.select_event_dataflow('bf-key', routing_table, {'track_id': 'hot'})[0][0] for _ in range(100)
+        ]
+        self.assertEqual(1, len(set(routes)))
+
+    def test_select_event_dataflow_should_unassign_idle_keys(self):
+        self.strategy.bounded_loads.window_size = 10
+        self.route_keys([f'track-{i}' for i in range(10)])
+        self.route_keys(['hot'] * 20)
+        self.assertEqual([('bf-key', 'hot')], list(self.strategy.bounded_loads.assignments))
+        self.assertEqual(1, sum(self.strategy.bounded_loads.loads.values()))
+
+    def test_get_routing_key_should_match_decoded_event_for_escaped_values(self):
+        event_data = {'id': 1, 'buffer_stream_key': 'bf-key', 'track_id': 'a"b'}
+        event = PassthroughEvent(1, 'bf-key', json.dumps(event_data).encode('utf-8'))
+        self.assertEqual('a"b', self.strategy.get_routing_key('bf-key', event))
+        self.assertEqual('a"b', self.strategy.get_routing_key('bf-key', event_data))
+
+    def test_select_event_dataflow_should_use_bufferstream_without_key_field(self):
+        routing_table = self.strategy.bufferstream_routing_tables['bf-key']
+        event = PassthroughEvent(1, 'bf-key', b'{"id": 1, "buffer_stream_key": "bf-key"}')
+        self.assertEqual(
+            self.strategy.get_routing_key('bf-key', event), self.strategy.get_routing_key('bf-key', {'id': 1})
+        )
+        event = PassthroughEvent(1, 'bf-key', b'{"id": 1, "buffer_stream_key": "bf-key", "track_id": "t1"}')
+        self.assertEqual('t1', self.strategy.get_routing_key('bf-key', event))
+        self.assertIsNotNone(self.strategy.select_dataflow('bf-key', routing_table))
+
+    def test_select_event_dataflow_should_shed_with_load_shedding_plan(self):
+        self.strategy.update({
+            'name': 'consistent_hash-LS',
+            'dataflows': {'bf-key': [[1.0, 1, [['od1-data'], ['wm-data']]]]}
+        })
+        routing_table = self.strategy.bufferstream_routing_tables['bf-key']
+        self.assertIsNone(self.strategy.select_event_dataflow('bf-key', routing_table, {'track_id': 't1'}))
@@ -0,0 +1,86 @@
+import multiprocessing
+import threading
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+from scheduler.plan import PlanSnapshot
+from scheduler.strategies.routing_table import RoutingTable
+from scheduler.workers import PLAN_PREPARED, PlanBroadcaster, PlanReceiver
+
+
+class TestPlanFanOut(TestCase):
+
+    def setUp(self):
+        self.worker_services = []
+        self.receivers = []
+        self.control_conns = []
+        for _ in range(2):
+            control_conn, worker_control_conn = multiprocessing.Pipe()
+            worker_service = MagicMock()
+            worker_service.scheduling_strategies = {'QQoS-W-HP': MagicMock()}
+            self.worker_services.append(worker_service)
+            self.receivers.append(PlanReceiver(worker_service, worker_control_conn))
+            self.control_conns.append(control_conn)
+        self.broadcaster = PlanBroadcaster(self.control_conns, logger=MagicMock(), reply_timeout=1)
+
+    def run_receivers(self, n_messages, receivers=None):
+        def receive(receiver):
+            for _ in range(n_messages):
+                receiver.process_control()
+        receivers = self.receivers if receivers is None else receivers
+        threads = [threading.Thread(target=receive, args=(receiver,), daemon=True) for receiver in receivers]
+        for thread in threads:
+            thread.start()
+        return threads
+
+    def test_broadcast_should_commit_plan_on_all_workers(self):
+        routing_tables = {'bf1': RoutingTable.from_plan_choices([[1.0, [['object-detection-data'], ['wm-data']]]])}
+        threads = self.run_receivers(2)
+        self.assertTrue(self.broadcaster.broadcast(PlanSnapshot(1, 'QQoS-W-HP', MagicMock(), routing_tables)))
+        for thread in threads:
+            thread.join(1)
+        for worker_service in self.worker_services:
+            plan = worker_service.install_compiled_plan.call_args[0][0]
+            self.assertEqual(1, plan.version)
+            self.assertEqual(worker_service.scheduling_strategies['QQoS-W-HP'], plan.strategy)
+            self.assertEqual(routing_tables['bf1'].dataflows, plan.routing_tables['bf1'].dataflows)
+            worker_service.warm_up_plan.assert_called_once_with(plan, 2)
+            self.assertEqual(
+                worker_service.warm_up_plan.return_value, worker_service.install_compiled_plan.call_args[0][1]
+            )
+
+    def test_broadcast_should_abort_plan_on_all_workers_when_one_fails_to_prepare(self):
+        self.worker_services[1].scheduling_strategies = {}
+        threads = self.run_receivers(2)
+        self.assertFalse(self.broadcaster.broadcast(PlanSnapshot(1, 'QQoS-W-HP', MagicMock(), {})))
+        for thread in threads:
+            thread.join(1)
+        for worker_service in self.worker_services:
+            self.assertFalse(worker_service.install_compiled_plan.called)
+
+    def test_broadcast_should_drop_late_replies_to_previous_plans(self):
+        self.receivers[0].control_conn.send((PLAN_PREPARED, 0))
+        threads = self.run_receivers(2)
+        self.assertTrue(self.broadcaster.broadcast(PlanSnapshot(1, 'QQoS-W-HP', MagicMock(), {})))
+        for thread in threads:
+            thread.join(1)
+        for worker_service in self.worker_services:
+            self.assertEqual(1, worker_service.install_compiled_plan.call_args[0][0].version)
+
+    def test_broadcast_should_remove_dead_workers_without_worker_target(self):
+        processes = [MagicMock(), MagicMock()]
+        processes[1].is_alive.return_value = False
+        self.broadcaster = PlanBroadcaster(self.control_conns, logger=MagicMock(), reply_timeout=1, processes=processes)
+        threads = self.run_receivers(2, self.receivers[:1])
+        self.assertTrue(self.broadcaster.broadcast(PlanSnapshot(1, 'QQoS-W-HP', MagicMock(), {})))
+        threads[0].join(1)
+        self.assertEqual([self.control_conns[0]], self.broadcaster.control_conns)
+        self.assertTrue(self.worker_services[0].install_compiled_plan.called)
+        self.assertFalse(self.worker_services[1].install_compiled_plan.called)
+
+    def test_broadcast_should_not_be_vetoed_by_worker_that_died(self):
+        self.receivers[1].control_conn.close()
+        threads = self.run_receivers(2, self.receivers[:1])
+        self.assertTrue(self.broadcaster.broadcast(PlanSnapshot(1, 'QQoS-W-HP', MagicMock(), {})))
+        threads[0].join(1)
+        self.assertTrue(self.worker_services[0].install_compiled_plan.called)